@@ -0,0 +1,266 @@
+###############################################################################
+#
+#   Early warnings from slow drifts of temperature and battery voltage
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, EWMA baseline and CUSUM per series, temperature
+#             rise, float voltage drift and unusual charge rate
+#           - the temperature series is one-sided, a drop is learned as the
+#             new level instead of freezing the baseline
+#
+###############################################################################
+#   How it works
+#
+#   Samples are averaged over interval seconds, so the result does not depend
+#   on how often the UPS is polled and most samples only add to a sum. Every
+#   interval the average is compared with a slow EWMA baseline (time constant
+#   tau) and its EWMA standard deviation. A CUSUM adds up the deviations in
+#   units of that standard deviation, minus a slack of k; when the sum passes
+#   h a warning is raised. Small deviations that persist are found long
+#   before a fixed limit would see them, single outliers are not. While a
+#   warning is active the baseline is frozen, so the drift is not learned;
+#   the warning clears when the CUSUM is back at zero.
+#
+#   temperature     ups_internal_temperature, rise only, plus a fixed limit
+#   float voltage   battery_voltage while on line with a full battery, both
+#                   directions; a drifting float voltage is a sign of a
+#                   charger fault or ageing cells
+#   charge rate     change of battery_capacity in %/hour while on line and
+#                   not full, both directions
+#
+#   A series uses a fixed number of floats, a fleet needs one
+#   AnomalyDetector per unit.
+#
+###############################################################################
+import math                         # for the time constants
+import time                         # for the timestamps
+
+from APC_SMART_UPS import STATUS_ON_BATTERY
+from APC_SMART_UPS import STATUS_ON_LINE
+
+
+# fields that sample() reads
+ANOMALY_FIELDS = (
+    'ups_internal_temperature',
+    'battery_voltage',
+    'battery_capacity',
+    'ups_status_byte',
+    )
+
+HIGH        = 1
+LOW         = -1
+NORMAL      = 0
+
+
+###############################################################################
+class Series:
+
+    __slots__ = ('tau', 'k', 'h', 'min_sigma', 'warmup', 'interval', 'lower', 'count', 'mean',
+                 'variance', 'high', 'low', 'state', 'sum', 'samples', 'start', 'previous', 'last')
+
+    def __init__(self, tau, k=0.5, h=8.0, min_sigma=0.1, warmup=30, interval=60.0, lower=True):
+        '''One monitored series. tau is the time constant of the baseline in seconds, k and h
+           are the slack and threshold of the CUSUM in standard deviations, min_sigma keeps the
+           standard deviation of a very quiet series from becoming zero. No warnings during the
+           first warmup intervals. lower False only watches upwards, a drop is learned.'''
+        self.tau = tau
+        self.k = k
+        self.h = h
+        self.min_sigma = min_sigma
+        self.warmup = warmup
+        self.interval = interval
+        self.lower = lower
+        self.count = 0                  # number of intervals seen
+        self.mean = 0.0
+        self.variance = 0.0
+        self.high = 0.0                 # CUSUM upwards
+        self.low = 0.0                  # CUSUM downwards
+        self.state = NORMAL
+        self.sum = 0.0                  # samples of the running interval
+        self.samples = 0
+        self.start = None
+        self.previous = None            # end of the previous interval
+        self.last = None                # average of the previous interval
+
+    def sigma(self):
+        return max(self.min_sigma, math.sqrt(self.variance))
+
+    def add(self, value, stamp):
+        '''Add a sample. Returns the new state HIGH, LOW or NORMAL when it changed, else None.'''
+        if self.start is None:
+            self.start = stamp
+        self.sum += value
+        self.samples += 1
+        if stamp - self.start < self.interval:
+            return None
+        average = self.sum / self.samples
+        elapsed = stamp - (self.previous if self.previous is not None else self.start)
+        self.sum = 0.0
+        self.samples = 0
+        self.start = None
+        self.previous = stamp
+        return self.step(average, max(elapsed, self.interval))
+
+    def step(self, value, elapsed):
+        '''Compare one interval average with the baseline.'''
+        self.last = value
+        self.count += 1
+        alpha = 1.0 - math.exp(-elapsed / self.tau)
+        if self.count <= self.warmup:
+            # learn the level fast while there is no baseline yet
+            alpha = max(alpha, 1.0 / self.count)
+        deviation = value - self.mean
+        if self.count == 1:
+            self.mean = value
+            return None
+        if self.count > self.warmup:
+            z = deviation / self.sigma()
+            self.high = max(0.0, self.high + z - self.k)
+            if self.lower:
+                self.low = max(0.0, self.low - z - self.k)
+        state = self.state
+        if self.high > self.h:
+            state = HIGH
+        elif self.low > self.h:
+            state = LOW
+        elif self.high == 0.0 and self.low == 0.0:
+            state = NORMAL
+        if state == NORMAL:
+            # baseline only learns while nothing is wrong
+            self.mean += alpha * deviation
+            self.variance = (1.0 - alpha) * (self.variance + alpha * deviation * deviation)
+        if state != self.state:
+            self.state = state
+            return state
+        return None
+
+    def relearn(self):
+        '''Accept the present level as normal, for example after a battery replacement.'''
+        self.count = 0
+        self.high = self.low = 0.0
+        self.state = NORMAL
+
+
+class AnomalyEvent:
+
+    def __init__(self, kind, field, start, value, baseline, sigma):
+        self.kind = kind                # temperature_rise, temperature_high, float_voltage_high, ...
+        self.field = field
+        self.start = start
+        self.end = None                 # None while the warning is active
+        self.value = value              # interval average that raised the warning
+        self.baseline = baseline        # the normal level at that time
+        self.sigma = sigma
+
+    def as_dict(self):
+        return {
+            'kind'      : self.kind,
+            'field'     : self.field,
+            'start'     : self.start,
+            'end'       : self.end,
+            'value'     : self.value,
+            'baseline'  : self.baseline,
+            'sigma'     : self.sigma,
+            }
+
+    def __repr__(self):
+        return 'AnomalyEvent(%s %s..%s %s baseline %s)' % (self.kind, self.start, self.end, self.value, self.baseline)
+
+
+###############################################################################
+class AnomalyDetector:
+
+    def __init__(self, interval=60.0, temperature_tau=6 * 3600.0, voltage_tau=24 * 3600.0,
+                 charge_tau=7 * 86400.0, k=0.5, h=8.0, max_temperature=45.0, full=99.0, callback=None):
+        '''Init of the detector of one UPS. interval is the averaging period in seconds, the
+           taus are the time constants of the baselines. full is the battery capacity from which
+           the battery voltage counts as float voltage. callback is called with every raised
+           and every cleared event.'''
+        self.temperature = Series(temperature_tau, k, h, 0.2, interval=interval, lower=False)
+        self.float_voltage = Series(voltage_tau, k, h, 0.02, interval=interval)
+        self.charge_rate = Series(charge_tau, k, h, 0.5, interval=0.0)
+        self.interval = interval
+        self.max_temperature = max_temperature
+        self.full = full
+        self.callback = callback
+        self.charge_start = None        # (time, capacity) at the start of a charge interval
+        self.open = {}                  # kind -> active AnomalyEvent
+        self.events = 0
+
+    def _change(self, series, state, stamp, field, high_kind, low_kind, result):
+        '''Close the event of the previous state of series and open one for the new state.'''
+        if state is None:
+            return
+        for kind in (high_kind, low_kind):
+            event = self.open.pop(kind, None)
+            if event is not None:
+                event.end = stamp
+                result.append(event)
+        kind = {HIGH: high_kind, LOW: low_kind}.get(state)
+        if kind is not None:
+            event = self.open[kind] = AnomalyEvent(kind, field, stamp, series.last, series.mean, series.sigma())
+            result.append(event)
+
+    def update(self, values, stamp=None):
+        '''Feed one sample, values is a dict with (some of) ANOMALY_FIELDS as APC.sample()
+           returns. Returns the events raised or cleared by this sample; a cleared event has
+           its end set.'''
+        if stamp is None:
+            stamp = time.time()
+        result = []
+        temperature = values.get('ups_internal_temperature')
+        voltage = values.get('battery_voltage')
+        capacity = values.get('battery_capacity')
+        status = values.get('ups_status_byte')
+
+        if temperature is not None and temperature >= 0:
+            state = self.temperature.add(temperature, stamp)
+            self._change(self.temperature, state, stamp, 'ups_internal_temperature',
+                         'temperature_rise', None, result)
+            event = self.open.get('temperature_high')
+            if temperature > self.max_temperature and event is None:
+                event = self.open['temperature_high'] = AnomalyEvent(
+                    'temperature_high', 'ups_internal_temperature', stamp, temperature,
+                    self.max_temperature, 0.0)
+                result.append(event)
+            elif temperature <= self.max_temperature - 1.0 and event is not None:
+                event.end = stamp
+                del self.open['temperature_high']
+                result.append(event)
+
+        on_line = status is not None and status >= 0 and status & STATUS_ON_LINE and not status & STATUS_ON_BATTERY
+        valid_capacity = capacity is not None and capacity >= 0
+        if on_line and valid_capacity and capacity >= self.full and voltage is not None and voltage >= 0:
+            state = self.float_voltage.add(voltage, stamp)
+            self._change(self.float_voltage, state, stamp, 'battery_voltage',
+                         'float_voltage_high', 'float_voltage_low', result)
+
+        if on_line and valid_capacity and capacity < self.full:
+            if self.charge_start is None:
+                self.charge_start = (stamp, capacity)
+            elif stamp - self.charge_start[0] >= self.interval:
+                elapsed = stamp - self.charge_start[0]
+                rate = (capacity - self.charge_start[1]) / elapsed * 3600.0
+                self.charge_start = (stamp, capacity)
+                state = self.charge_rate.add(rate, stamp)
+                self._change(self.charge_rate, state, stamp, 'battery_capacity',
+                             'charge_rate_high', 'charge_rate_low', result)
+        elif status is not None and status >= 0:
+            self.charge_start = None
+
+        self.events += len(result)
+        if self.callback is not None:
+            for event in result:
+                self.callback(event)
+        return result
+
+    def sample(self, ups, debug=False):
+        '''Read ANOMALY_FIELDS from ups and feed them, returns the raised and cleared events.'''
+        return self.update(ups.sample(ANOMALY_FIELDS, debug))
+
+    def relearn(self):
+        '''Accept the present levels as normal, for example after a battery replacement.'''
+        for series in (self.temperature, self.float_voltage, self.charge_rate):
+            series.relearn()
@@ -0,0 +1,314 @@
+###############################################################################
+#
+#   Managed run time calibration session
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, preconditions, dense capture during the
+#             discharge, automatic abort on safety limits, report next to
+#             the capture
+#           - the capture only reads the focused fields, temperature and line
+#             voltage every safety_every samples; the abort holds the
+#             exclusive token from the status read to the D
+#
+###############################################################################
+#   How it works
+#
+#   1. preconditions: battery capacity 100 %, on line, no low battery,
+#      replace battery or overload, load not above max_load
+#   2. "D" starts the calibration, the UPS runs on battery until about 25 %
+#   3. capture: CALIBRATION_FIELDS every period seconds, SAFETY_FIELDS every
+#      safety_every samples, into calibration_<date>_<time>.csv. One sample
+#      takes about 0.5 seconds per field, period is at least that long. Other
+#      loggers on the same UPS pause while the session is RUNNING
+#   4. every sample is checked against the limits; when one is passed "D" is
+#      sent again, which aborts the calibration. "D" toggles, so it is only
+#      sent while the status byte still shows the calibration bit, with the
+#      UPS held in between so no other command interleaves
+#   5. the session ends when the calibration bit clears, the report is
+#      written as calibration_<date>_<time>.json
+#
+#   session = CalibrationSession(ups, min_battery_voltage=46.0)
+#   ok, reasons = session.start()
+#   session.wait()
+#   print(session.report)
+#
+###############################################################################
+import json                         # for the report
+import os                           # for the file names
+import threading                    # for the capture thread
+import time                         # for the timestamps
+from datetime import datetime
+
+from APC_SMART_UPS import STATUS_CALIBRATION
+from APC_SMART_UPS import STATUS_LOW_BATTERY
+from APC_SMART_UPS import STATUS_ON_BATTERY
+from APC_SMART_UPS import STATUS_ON_LINE
+from APC_SMART_UPS import STATUS_OVERLOAD
+from APC_SMART_UPS import STATUS_REPLACE_BATTERY
+
+
+# the dense capture profile, the status byte is needed to follow the calibration
+CALIBRATION_FIELDS = (
+    'ups_status_byte',
+    'battery_capacity',
+    'battery_voltage',
+    'load_power',
+    )
+
+# slow values for the safety limits, read every safety_every samples
+SAFETY_FIELDS = (
+    'ups_internal_temperature',
+    'line_voltage',
+    )
+
+# read once before the start, for the preconditions and the report
+START_FIELDS = CALIBRATION_FIELDS + SAFETY_FIELDS + ('estimated_runtime',)
+
+# seconds per command, see APC.process_command
+COMMAND_TIME = 0.5
+
+IDLE        = 'idle'
+REFUSED     = 'refused'             # preconditions not met or the UPS answered NO/NA
+RUNNING     = 'running'
+COMPLETED   = 'completed'
+ABORTED     = 'aborted'
+
+
+###############################################################################
+class CalibrationSession:
+
+    def __init__(self, ups, directory='.', period=2.0, safety_every=10, required_capacity=100.0,
+                 max_load=80.0, min_battery_voltage=None, min_capacity=None, max_temperature=45.0,
+                 min_line_voltage=None, max_duration=3 * 3600.0, start_timeout=30.0,
+                 debug=False, callback=None):
+        '''Init of the session. period is raised to the time one sample of CALIBRATION_FIELDS
+           takes. Limits that are None are not checked. min_line_voltage aborts when the line
+           fails during the calibration, so the rest of the battery is kept for the real outage.
+           start_timeout is the time the UPS gets to show the calibration bit. callback is
+           called with the report at the end.'''
+        self.ups = ups
+        self.directory = directory
+        self.period = max(period, COMMAND_TIME * len(CALIBRATION_FIELDS))
+        self.safety_every = max(1, safety_every)
+        self.required_capacity = required_capacity
+        self.max_load = max_load
+        self.min_battery_voltage = min_battery_voltage
+        self.min_capacity = min_capacity
+        self.max_temperature = max_temperature
+        self.min_line_voltage = min_line_voltage
+        self.max_duration = max_duration
+        self.start_timeout = start_timeout
+        self.debug = debug
+        self.callback = callback
+        self.state = IDLE
+        self.reason = ''
+        self.report = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.base = None
+        self.token = None
+
+    ###########################################################################
+
+    def preconditions(self, values=None):
+        '''Check the UPS can be calibrated now. Returns (True, []) or (False, reasons).'''
+        if values is None:
+            values = self.ups.sample(START_FIELDS, self.debug)
+        reasons = []
+        status = values.get('ups_status_byte', -1)
+        capacity = values.get('battery_capacity', -1)
+        load = values.get('load_power', -1)
+        if status < 0:
+            reasons.append('no status')
+        else:
+            if not status & STATUS_ON_LINE or status & STATUS_ON_BATTERY:
+                reasons.append('not on line')
+            if status & STATUS_CALIBRATION:
+                reasons.append('calibration already running')
+            for bit, text in ((STATUS_LOW_BATTERY, 'low battery'), (STATUS_REPLACE_BATTERY, 'replace battery'),
+                              (STATUS_OVERLOAD, 'overload')):
+                if status & bit:
+                    reasons.append(text)
+        if capacity < self.required_capacity:
+            reasons.append('battery capacity %s' % capacity)
+        if load < 0:
+            reasons.append('no load reading')
+        elif self.max_load is not None and load > self.max_load:
+            reasons.append('load %s above %s' % (load, self.max_load))
+        return not reasons, reasons
+
+    def limit(self, values, elapsed):
+        '''The first safety limit passed by a capture sample, '' when all are fine.'''
+        voltage = values.get('battery_voltage', -1)
+        capacity = values.get('battery_capacity', -1)
+        temperature = values.get('ups_internal_temperature', -1)
+        line = values.get('line_voltage', -1)
+        load = values.get('load_power', -1)
+        status = values.get('ups_status_byte', -1)
+        if self.min_battery_voltage is not None and 0 <= voltage < self.min_battery_voltage:
+            return 'battery voltage %s below %s' % (voltage, self.min_battery_voltage)
+        if self.min_capacity is not None and 0 <= capacity < self.min_capacity:
+            return 'battery capacity %s below %s' % (capacity, self.min_capacity)
+        if self.max_temperature is not None and temperature > self.max_temperature:
+            return 'temperature %s above %s' % (temperature, self.max_temperature)
+        if self.min_line_voltage is not None and 0 <= line < self.min_line_voltage:
+            return 'line voltage %s below %s, line failure' % (line, self.min_line_voltage)
+        if self.max_load is not None and load > self.max_load:
+            return 'load %s above %s' % (load, self.max_load)
+        if status >= 0 and status & STATUS_OVERLOAD:
+            return 'overload'
+        if elapsed > self.max_duration:
+            return 'longer than %s seconds' % self.max_duration
+        return ''
+
+    ###########################################################################
+
+    def start(self):
+        '''Check the preconditions and start the calibration and the capture. Returns
+           (True, []) or (False, reasons); does not wait for the calibration.'''
+        before = self.ups.sample(START_FIELDS, self.debug)
+        ok, reasons = self.preconditions(before)
+        if not ok:
+            self.state = REFUSED
+            self.reason = ', '.join(reasons)
+            return False, reasons
+        answer = self.ups.run_time_calibration(self.debug)
+        if answer != 0:
+            self.state = REFUSED
+            self.reason = {1: 'UPS answered NO', 2: 'UPS answered NA'}.get(answer, 'no answer to D')
+            return False, [self.reason]
+        self.state = RUNNING
+        self.base = os.path.join(self.directory, 'calibration_' + datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
+        self.thread = threading.Thread(target=self._capture, args=(before,), daemon=True)
+        self.thread.start()
+        return True, []
+
+    def _capture(self, before):
+        from APC_SCHEDULER import FixedRateScheduler
+
+        started = time.time()
+        samples = []
+        seen = False                    # the calibration bit was seen
+        safety = {field: before.get(field, -1) for field in SAFETY_FIELDS}
+        columns = CALIBRATION_FIELDS + SAFETY_FIELDS
+        with open(self.base + '.csv', 'w') as f:
+            f.write('time,' + ''.join(field + ',' for field in columns) + '\n')
+            scheduler = FixedRateScheduler(self.period, sleep=self.stop_event.wait)
+            for count, tick in enumerate(scheduler):
+                values = self.ups.sample(CALIBRATION_FIELDS, self.debug)
+                if count % self.safety_every == self.safety_every - 1:
+                    safety = self.ups.sample(SAFETY_FIELDS, self.debug)
+                values.update(safety)
+                samples.append((tick.stamp, values))
+                f.write('%.3f,' % tick.stamp + ''.join(str(values[field]) + ',' for field in columns) + '\n')
+                f.flush()
+                elapsed = tick.stamp - started
+                status = values['ups_status_byte']
+                if status >= 0 and status & STATUS_CALIBRATION:
+                    seen = True
+                elif status >= 0 and seen:
+                    self.state = COMPLETED
+                    break
+                elif status >= 0 and elapsed > self.start_timeout:
+                    self.state = ABORTED
+                    self.reason = 'calibration did not start'
+                    break
+                reason = 'stopped by user' if self.stop_event.is_set() else self.limit(values, elapsed)
+                if reason:
+                    self.reason = reason
+                    self.state = ABORTED
+                    self._abort()
+                    break
+        self.report = self._report(before, samples, started)
+        with open(self.base + '.json', 'w') as f:
+            json.dump(self.report, f, indent=1)
+        if self.callback is not None:
+            self.callback(self.report)
+
+    def _acquire(self):
+        '''Take ownership of the UPS, returns the token or None when a sequence holds it.'''
+        with self.ups.lock:
+            if self.ups.exclusive is not None:
+                return None
+            self.token = object()
+            self.ups.exclusive = self.token
+            return self.token
+
+    def _release(self):
+        '''Hand the UPS back to the other callers.'''
+        with self.ups.lock:
+            if self.ups.exclusive is self.token:
+                self.ups.exclusive = None
+        self.token = None
+
+    def _status(self):
+        '''The status byte read with the token, -1 when the answer is not valid.'''
+        receive = self.ups.process_command([ord('Q')], self.debug, token=self.token)
+        if len(receive) < 4 or receive[2] != 13 or receive[3] != 10:
+            return -1
+        try:
+            return int(chr(receive[0]) + chr(receive[1]), 16)
+        except ValueError:
+            return -1
+
+    def _abort(self):
+        '''Send D again, but only while the UPS still calibrates; D would start a new one. The
+           UPS is held from the status read to the D, so no other command can come between.'''
+        for _ in range(3):
+            if self._acquire() is not None:
+                try:
+                    status = self._status()
+                    if status >= 0 and not status & STATUS_CALIBRATION:
+                        return True
+                    if status >= 0:
+                        self.ups.process_command([ord('D')], self.debug, token=self.token)
+                finally:
+                    self._release()
+            time.sleep(2.0)
+        return False
+
+    def abort(self):
+        '''Abort a running calibration from another thread.'''
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        '''Wait for the end of the session, returns the report.'''
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.report
+
+    ###########################################################################
+
+    def _report(self, before, samples, started):
+        def series(field):
+            return [(stamp, values[field]) for stamp, values in samples if values.get(field, -1) >= 0]
+
+        capacity = series('battery_capacity')
+        voltage = series('battery_voltage')
+        load = series('load_power')
+        ended = samples[-1][0] if samples else started
+        report = {
+            'outcome'               : self.state,
+            'reason'                : self.reason,
+            'start'                 : datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+            'end'                   : datetime.fromtimestamp(ended).isoformat(timespec='seconds'),
+            'duration_seconds'      : round(ended - started, 1),
+            'samples'               : len(samples),
+            'capture'               : os.path.basename(self.base + '.csv'),
+            'runtime_before'        : before.get('estimated_runtime'),
+            'runtime_after'         : self.ups.estimated_runtime(self.debug),
+            'capacity_start'        : capacity[0][1] if capacity else None,
+            'capacity_end'          : capacity[-1][1] if capacity else None,
+            'voltage_start'         : voltage[0][1] if voltage else None,
+            'voltage_min'           : min(v for _, v in voltage) if voltage else None,
+            'voltage_end'           : voltage[-1][1] if voltage else None,
+            'load_mean'             : round(sum(v for _, v in load) / len(load), 1) if load else None,
+            'load_max'              : max(v for _, v in load) if load else None,
+            'discharge_per_minute'  : None,
+            }
+        if len(capacity) >= 2 and capacity[-1][0] > capacity[0][0]:
+            report['discharge_per_minute'] = round(
+                (capacity[0][1] - capacity[-1][1]) / (capacity[-1][0] - capacity[0][0]) * 60.0, 3)
+        return report
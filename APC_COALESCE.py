@@ -0,0 +1,137 @@
+###############################################################################
+#
+#   On demand reads shared between concurrent callers
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, one serial exchange per field in flight, results
+#             reused within a freshness window per field, hit/miss counters
+#
+###############################################################################
+#   How it works
+#
+#   reader = CoalescingReader(ups)
+#   reader.battery_capacity()           same methods and answers as APC
+#
+#   A value younger than the freshness of its field is returned from the
+#   cache (hit). Otherwise the first caller reads it from the UPS (miss) and
+#   every caller that asks for the same field meanwhile waits for that answer
+#   instead of sending the command again (shared). The -1/-2/-3 error answers
+#   are shared with the waiting callers but not cached.
+#
+#   No thread of its own, the UPS is only asked when somebody asks.
+#
+###############################################################################
+import threading                    # for the in-flight reads
+import time                         # for the freshness
+
+from APC_SMART_UPS import FIELDS
+
+
+# seconds a value stays fresh, fields that are not listed use the default
+FRESHNESS = {
+    'ups_status'                            : 0.5,
+    'ups_status_byte'                       : 0.5,
+    'line_voltage'                          : 0.5,
+    'output_voltage'                        : 0.5,
+    'load_power'                            : 0.5,
+    'load_current'                          : 0.5,
+    'battery_test_result'                   : 5.0,
+    'transfer_cause'                        : 5.0,
+    'number_of_battery_packs'               : 3600.0,
+    'ups_nominal_battery_voltage_rating'    : 3600.0,
+    }
+
+
+###############################################################################
+class Flight:
+
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CoalescingReader:
+
+    def __init__(self, ups, default=1.0, freshness=None):
+        '''ups is an APC with an open port. default is the freshness in seconds of fields that
+           are not in freshness, freshness updates the FRESHNESS table for this reader.'''
+        self.ups = ups
+        self.default = default
+        self.freshness = dict(FRESHNESS)
+        if freshness:
+            self.freshness.update(freshness)
+        self.lock = threading.Lock()
+        self.cache = {}                 # field -> (monotonic time, value)
+        self.flights = {}               # field -> Flight of the read in progress
+        self.counters = {}              # field -> [hits, misses, shared]
+
+    def get(self, field, debug=False):
+        '''Value of field like getattr(ups, field)(debug) returns it.'''
+        now = time.monotonic()
+        with self.lock:
+            counters = self.counters.get(field)
+            if counters is None:
+                counters = self.counters[field] = [0, 0, 0]
+            cached = self.cache.get(field)
+            if cached is not None and now - cached[0] < self.freshness.get(field, self.default):
+                counters[0] += 1
+                return cached[1]
+            flight = self.flights.get(field)
+            if flight is not None:
+                counters[2] += 1
+                leader = False
+            else:
+                flight = self.flights[field] = Flight()
+                counters[1] += 1
+                leader = True
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = getattr(self.ups, field)(debug)
+        except Exception as error:
+            flight.error = error
+        with self.lock:
+            del self.flights[field]
+            if flight.error is None and flight.value is not None and flight.value >= 0:
+                self.cache[field] = (time.monotonic(), flight.value)
+        flight.event.set()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def sample(self, fields, debug=False):
+        '''Read several fields like APC.sample(), returns a dict.'''
+        return {field: self.get(field, debug) for field in fields}
+
+    def invalidate(self, field=None):
+        '''Forget the cached value of field, or of all fields, for example after a command.'''
+        with self.lock:
+            if field is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(field, None)
+
+    def stats(self):
+        '''Hits, misses (serial reads) and shared reads per field and in total.'''
+        with self.lock:
+            fields = {field: {'hits': c[0], 'misses': c[1], 'shared': c[2]} for field, c in self.counters.items()}
+        total = {key: sum(counters[key] for counters in fields.values()) for key in ('hits', 'misses', 'shared')}
+        asked = total['hits'] + total['misses'] + total['shared']
+        total['saved'] = (asked - total['misses']) / asked if asked else 0.0
+        return {'total': total, 'fields': fields}
+
+    def __getattr__(self, name):
+        # reader.battery_capacity() like APC.battery_capacity()
+        if name in FIELDS:
+            return lambda debug=False: self.get(name, debug)
+        raise AttributeError(name)
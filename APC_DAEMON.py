@@ -0,0 +1,420 @@
+###############################################################################
+#
+#   Monitoring daemon configured by a file, reloaded without sample gaps
+#
+#   python APC_DAEMON.py apc_daemon.json
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, one worker per UPS with its own pipeline, the
+#             configuration is reloaded on SIGHUP (or when the file changes
+#             on systems without SIGHUP) and only changed workers restart
+#           - fleet totals over all units, grouped by the tags of the units,
+#             served on the cache socket
+#           - a unit whose port fails while sampling closes it and opens it
+#             again with a growing delay; units share one SQLite connection
+#             per file
+#           - on reload the new worker of a unit is built before the old one
+#             stops, a unit whose new settings fail keeps the old settings
+#
+###############################################################################
+#   Configuration, JSON
+#
+#   {
+#     "units": {
+#       "rack1": {"port": "COM5", "period": 5, "sinks": ["csv", "sqlite"],
+#                 "tags": {"rack": "A", "feed": "B"}, "rated_watts": 2700},
+#       "rack2": {"port": "tcp://ts1:4001", "period": 1, "fields": ["line_voltage", "load_power"],
+#                 "sinks": ["sqlite", "shared"], "power_quality": {"nominal_voltage": 230}}
+#     },
+#     "sinks": {
+#       "csv"    : {"type": "csv", "filename": "ups_log_{unit}.csv"},
+#       "sqlite" : {"type": "sqlite", "filename": "ups.sqlite", "policy": "drop_oldest"},
+#       "rollup" : {"type": "rollup", "path": "rollup_{unit}", "flush_every": 60},
+#       "shared" : {"type": "shared", "filename": "{unit}.shm", "policy": "coalesce", "capacity": 1},
+#       "print"  : {"type": "print", "policy": "coalesce", "capacity": 1}
+#     },
+#     "socket": "127.0.0.1:47310",
+#     "watch": 5
+#   }
+#
+#   units   port (any name APC_TRANSPORT knows), period in seconds, fields
+#           (default LOG_FIELDS), sinks by name, options for the transport,
+#           debug, and the thresholds of the optional detectors
+#           "power_quality" (APC_POWER_QUALITY) and "anomaly" (APC_ANOMALY),
+#           their events are printed, tags and rated_watts for the fleet
+#           totals (APC_FLEET); the status flags are only counted when fields
+#           include ups_status_byte
+#   sinks   type, {unit} in names is replaced by the unit name, policy and
+#           capacity of the sink queue (APC_PIPELINE)
+#   socket  address of the local cache socket (APC_LOCAL_SOCKET), the first
+#           unit answers plain field names, every unit answers "unit/field",
+#           the fleet totals are "fleet/load_watts/sum", "fleet/on_battery",
+#           "fleet/rack=A/battery_capacity/min", ...
+#   watch   seconds between checks of the file modification time, 0 is off
+#
+#   On reload the new configuration is compared with the running one. A unit
+#   whose own settings or one of whose sinks changed is restarted, new units
+#   are started, removed units stopped; all other units keep sampling. New
+#   tags or rated_watts only move the unit to its new fleet groups. A unit
+#   whose new settings can not be built (an unknown detector option, a sink
+#   file that does not open) is logged and keeps running with the old ones.
+#
+###############################################################################
+import json                         # for the configuration
+import os                           # for the modification time
+import signal                       # for SIGHUP
+import sys
+import threading                    # one thread per unit
+import time                         # for the timestamps
+
+from APC_FLEET import Fleet
+from APC_FLEET import flatten
+from APC_SMART_UPS import APC
+from APC_SMART_UPS import LOG_FIELDS
+from APC_PIPELINE import BLOCK
+from APC_PIPELINE import CsvSink
+from APC_PIPELINE import Pipeline
+from APC_PIPELINE import csv_line
+from APC_PIPELINE import store_sink
+from APC_SCHEDULER import FixedRateScheduler
+
+
+MAX_RETRY = 60.0                    # longest wait between two attempts to open a port
+
+
+###############################################################################
+def load_config(filename):
+    '''Read and check a configuration file, raises ValueError when it is not usable.'''
+    with open(filename) as f:
+        config = json.load(f)
+    units = config.setdefault('units', {})
+    sinks = config.setdefault('sinks', {})
+    for name, unit in units.items():
+        if 'port' not in unit:
+            raise ValueError('unit %s has no port' % name)
+        for sink in unit.get('sinks', []):
+            if sink not in sinks:
+                raise ValueError('unit %s uses unknown sink %s' % (name, sink))
+    for name, sink in sinks.items():
+        if sink.get('type') not in SINK_TYPES:
+            raise ValueError('sink %s has unknown type %s' % (name, sink.get('type')))
+    return config
+
+
+def unit_config(config, name):
+    '''Everything a unit worker depends on, two equal results need no restart. The fleet tags
+       are changed without a restart.'''
+    unit = {key: value for key, value in config['units'][name].items() if key not in ('tags', 'rated_watts')}
+    return {'unit': unit, 'sinks': {sink: config['sinks'][sink] for sink in unit.get('sinks', [])}}
+
+
+def _name(template, unit):
+    return template.replace('{unit}', unit)
+
+
+def _csv(unit, fields, settings):
+    return CsvSink(_name(settings.get('filename', 'ups_log_{unit}.csv'), unit), fields)
+
+
+def _sqlite(unit, fields, settings):
+    from APC_SQLITE import SqliteStore
+    # units writing to the same file share one connection, see APC_SQLITE
+    store = SqliteStore(_name(settings.get('filename', 'ups.sqlite'), unit), ups=unit, fields=fields, shared=True)
+    return store_sink(store.add), store.close
+
+
+def _rollup(unit, fields, settings):
+    from APC_ROLLUP import RollupStore
+    store = RollupStore(_name(settings.get('path', 'rollup_{unit}'), unit), fields,
+                        flush_every=settings.get('flush_every', 60.0))
+    return store_sink(store.add), store.close
+
+
+def _shared(unit, fields, settings):
+    from APC_SHARED import SnapshotWriter
+    writer = SnapshotWriter(_name(settings.get('filename', '{unit}.shm'), unit), fields)
+    return store_sink(writer.publish), writer.close
+
+
+def _print(unit, fields, settings):
+    return lambda sample: print(unit, csv_line(sample, fields))
+
+
+SINK_TYPES = {
+    'csv'       : _csv,
+    'sqlite'    : _sqlite,
+    'rollup'    : _rollup,
+    'shared'    : _shared,
+    'print'     : _print,
+    }
+
+
+###############################################################################
+class UnitWorker:
+
+    def __init__(self, name, settings, cache, fleet=None):
+        '''Sampling thread of one UPS. settings is the result of unit_config, cache is the dict
+           the latest (time, values) of the unit is kept in, every sample also updates fleet.'''
+        self.name = name
+        self.settings = settings
+        self.cache = cache
+        self.fleet = fleet
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.ups = None
+        unit = settings['unit']
+        self.period = unit.get('period', 5.0)
+        self.fields = tuple(unit.get('fields', LOG_FIELDS))
+        self.debug = unit.get('debug', False)
+        self.detectors = []
+        if 'power_quality' in unit:
+            from APC_POWER_QUALITY import PowerQualityDetector
+            self.detectors.append(PowerQualityDetector(**unit['power_quality']))
+        if 'anomaly' in unit:
+            from APC_ANOMALY import AnomalyDetector
+            self.detectors.append(AnomalyDetector(**unit['anomaly']))
+        self.pipeline = Pipeline(stages=[self._detect])
+
+    def _detect(self, sample):
+        for detector in self.detectors:
+            for event in detector.update(sample.values, sample.stamp):
+                print(self.name, event)
+
+    def _open(self):
+        '''Open the port and switch to smart mode, False when that did not work.'''
+        port = self.settings['unit']['port']
+        try:
+            self.ups = APC(port, **self.settings['unit'].get('options', {}))
+            if self.ups.serial_open():
+                self.ups.set_ups_to_smart_mode(self.debug)
+                return True
+            print(self.name, 'can not open', port)
+        except Exception as error:
+            print(self.name, 'can not open', port, repr(error))
+        self._close()
+        return False
+
+    def _close(self):
+        if self.ups is not None:
+            try:
+                self.ups.serial_close()
+            except Exception:
+                pass
+            self.ups = None
+
+    def _run(self):
+        '''Sample until stopped. A port that can not be opened or fails while sampling (a
+           terminal server that went away, a USB adapter that was pulled) is closed and opened
+           again after 1, 2, 4, ... up to MAX_RETRY seconds.'''
+        delay = 1.0
+        while not self.stop_event.is_set():
+            if not self._open():
+                self.stop_event.wait(delay)
+                delay = min(delay * 2, MAX_RETRY)
+                continue
+            scheduler = FixedRateScheduler(self.period, sleep=self.stop_event.wait)
+            for tick in scheduler:
+                if self.stop_event.is_set():
+                    break
+                try:
+                    values = self.ups.sample(self.fields, self.debug)
+                except OSError as error:            # socket and serial errors
+                    print(self.name, 'lost', self.settings['unit']['port'], repr(error))
+                    self._close()
+                    self.stop_event.wait(delay)
+                    delay = min(delay * 2, MAX_RETRY)
+                    break
+                delay = 1.0
+                self.cache[self.name] = (tick.stamp, values)
+                if self.fleet is not None:
+                    self.fleet.update(self.name, values, tick.stamp)
+                self.pipeline.put(values, tick.stamp)
+
+    def _sinks(self):
+        '''Open the sinks, when one fails the ones already open are closed again.'''
+        try:
+            for sink_name, sink in self.settings['sinks'].items():
+                made = SINK_TYPES[sink['type']](self.name, self.fields, sink)
+                function, close = made if isinstance(made, tuple) else (made, None)
+                self.pipeline.add_sink(sink_name, function, sink.get('capacity', 64),
+                                       sink.get('policy', BLOCK), close)
+        except Exception:
+            for sink in self.pipeline.sinks:
+                if sink.close is not None:
+                    sink.close()
+            raise
+
+    def start(self):
+        '''Open the sinks and start sampling. The sinks open here and not in __init__, so an
+           old worker of the unit can close its files first.'''
+        self._sinks()
+        self.pipeline.start()
+        self.thread = threading.Thread(target=self._run, name='unit ' + self.name, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=30.0):
+        '''Stop sampling, deliver the queued samples and close the port.'''
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.pipeline.stop(timeout)
+        self._close()
+
+
+###############################################################################
+class Daemon:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.config = {'units': {}, 'sinks': {}}
+        self.workers = {}
+        self.cache = {}                 # unit -> (time, values)
+        self.fleet = Fleet()
+        self.server = None
+        self.socket = None
+        self.mtime = None
+        self.reload_requested = False
+        self.running = True
+
+    def snapshot(self):
+        '''(time, values) for the cache socket, see the socket setting.'''
+        units = list(self.config['units'])
+        stamp = 0.0
+        values = {}
+        for index, unit in enumerate(units):
+            latest = self.cache.get(unit)
+            if latest is None:
+                continue
+            stamp = max(stamp, latest[0])
+            for field, value in latest[1].items():
+                values[unit + '/' + field] = value
+                if index == 0:
+                    values[field] = value
+        values.update(flatten(self.fleet.summary()))
+        for tag in self.fleet.tag_names():
+            for value, summary in self.fleet.summary(tag).items():
+                values.update(flatten(summary, 'fleet/%s=%s/' % (tag, value)))
+        return stamp, values
+
+    def _socket(self, address):
+        if address == self.socket:
+            return
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+        self.socket = address
+        if address:
+            from APC_LOCAL_SOCKET import CacheServer
+            host, _, port = address.rpartition(':')
+            self.server = CacheServer(self.snapshot, (host, int(port)))
+            if not self.server.start():
+                print('cache socket address in use', address)
+                self.server = None
+
+    def apply(self, config):
+        '''Bring the running workers in line with config. Returns (started, restarted,
+           stopped, failed) unit names; a failed unit keeps its old worker, if it had one.'''
+        started, restarted, stopped, failed = [], [], [], []
+        for name in list(self.workers):
+            if name not in config['units']:
+                self.workers.pop(name).stop()
+                self.cache.pop(name, None)
+                self.fleet.remove(name)
+                stopped.append(name)
+        for name, unit in config['units'].items():
+            try:
+                self.fleet.tag(name, unit.get('rated_watts'), **unit.get('tags', {}))
+            except Exception as error:
+                print(name, 'tags not applied:', repr(error))
+            settings = unit_config(config, name)
+            old = self.workers.get(name)
+            if old is not None and settings == old.settings:
+                continue
+            try:
+                worker = UnitWorker(name, settings, self.cache, self.fleet)
+            except Exception as error:
+                # a bad detector option, the old worker keeps sampling
+                print(name, 'settings not applied:', repr(error))
+                failed.append(name)
+                continue
+            if old is not None:
+                old.stop()
+            try:
+                worker.start()
+            except Exception as error:
+                # a sink did not open, go back to the settings that worked
+                print(name, 'settings not applied:', repr(error))
+                failed.append(name)
+                if old is None:
+                    continue
+                worker = UnitWorker(name, old.settings, self.cache, self.fleet)
+                worker.start()
+            else:
+                (restarted if old is not None else started).append(name)
+            self.workers[name] = worker
+        self.config = config
+        self._socket(config.get('socket'))
+        return started, restarted, stopped, failed
+
+    def reload(self):
+        '''Read the file again and apply it, a broken file leaves everything running.'''
+        try:
+            self.mtime = os.path.getmtime(self.filename)
+            config = load_config(self.filename)
+        except (OSError, ValueError) as error:
+            print('configuration not loaded:', error)
+            return False
+        started, restarted, stopped, failed = self.apply(config)
+        print('configuration loaded, started', started, 'restarted', restarted, 'stopped', stopped,
+              'failed', failed)
+        return True
+
+    def _changed(self):
+        try:
+            return os.path.getmtime(self.filename) != self.mtime
+        except OSError:
+            return False
+
+    def run(self):
+        '''Load the configuration and run until SIGINT or SIGTERM.'''
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        def request_stop(signum, frame):
+            self.running = False
+
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, request_reload)
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        if not self.reload():
+            return 1
+        checked = time.monotonic()
+        while self.running:
+            time.sleep(0.2)
+            watch = self.config.get('watch', 0 if hasattr(signal, 'SIGHUP') else 5)
+            if watch and time.monotonic() - checked >= watch:
+                checked = time.monotonic()
+                if self._changed():
+                    self.reload_requested = True
+            if self.reload_requested:
+                self.reload_requested = False
+                self.reload()
+        self.stop()
+        return 0
+
+    def stop(self):
+        for worker in self.workers.values():
+            worker.stop()
+        self.workers = {}
+        if self.server is not None:
+            self.server.stop()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('usage: python APC_DAEMON.py apc_daemon.json')
+        sys.exit(2)
+    sys.exit(Daemon(sys.argv[1]).run())
@@ -0,0 +1,293 @@
+###############################################################################
+#
+#   Live web dashboard with server-sent events
+#
+#   python APC_DASHBOARD.py COM5 tcp://ts1:4001 --http 127.0.0.1:8080
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, standard library only, one page, updates are
+#             pushed to the browsers over server-sent events
+#           - /latest serves a copy that the sampling thread never changes,
+#             the default period follows the time one round of samples takes
+#
+###############################################################################
+#   How it works
+#
+#   The sampling loop calls publish() with every sample, nothing else talks
+#   to the UPS. publish() encodes the sample once as an event and puts it in
+#   the shared Broadcast buffer; every browser connection only copies the
+#   bytes of the new events to its socket. So a browser tab never causes a
+#   serial command and a hundred viewers cost about the same as one.
+#
+#   /           the page
+#   /events     text/event-stream, one "sample" event per unit and sample
+#   /latest     latest sample of every unit as JSON
+#
+#   A viewer that falls more than the buffer size behind gets the latest
+#   sample of every unit instead of the events it missed.
+#
+###############################################################################
+import collections                  # for the event buffer
+import itertools                    # for slicing the event buffer
+import json                         # for the event data
+import threading                    # for the server thread
+import time                         # for the timestamps
+
+from APC_SMART_UPS import status_flags
+
+
+# fields the dashboard shows
+DASHBOARD_FIELDS = (
+    'line_voltage',
+    'output_voltage',
+    'ups_and_utility_operating_frequency',
+    'load_power',
+    'battery_capacity',
+    'battery_voltage',
+    'estimated_runtime',
+    'ups_internal_temperature',
+    'ups_status_byte',
+    )
+
+
+###############################################################################
+class Broadcast:
+
+    def __init__(self, size=256):
+        '''Shared buffer of the latest size encoded events for all viewers.'''
+        self.condition = threading.Condition()
+        self.events = collections.deque(maxlen=size)
+        self.sequence = 0               # sequence number of the newest event
+        self.latest = {}                # key -> newest encoded event of that key
+
+    def publish(self, event, data, key=None):
+        '''Encode data once and wake up all viewers. key names the stream of the event, the
+           newest event of every key is kept for viewers that connect later.'''
+        payload = json.dumps(data, separators=(',', ':'))
+        with self.condition:
+            self.sequence += 1
+            message = ('id: %d\nevent: %s\ndata: %s\n\n' % (self.sequence, event, payload)).encode()
+            self.events.append(message)
+            if key is not None:
+                self.latest[key] = message
+            self.condition.notify_all()
+
+    def current(self):
+        '''(sequence, newest event of every key), the starting point of a new viewer.'''
+        with self.condition:
+            return self.sequence, list(self.latest.values())
+
+    def since(self, sequence, timeout=None):
+        '''Events after sequence, waits up to timeout seconds when there are none yet.
+           Returns (newest sequence, list of encoded events).'''
+        with self.condition:
+            if self.sequence == sequence:
+                self.condition.wait(timeout)
+            missed = self.sequence - sequence
+            if missed <= 0:
+                return self.sequence, []
+            if missed > len(self.events):
+                # too far behind, the newest state is enough to catch up
+                return self.sequence, list(self.latest.values())
+            start = len(self.events) - missed
+            return self.sequence, list(itertools.islice(self.events, start, None))
+
+
+###############################################################################
+class Dashboard:
+
+    def __init__(self, address=('127.0.0.1', 8080), keepalive=15.0, size=256):
+        '''Init of the dashboard. keepalive is the number of seconds between comment lines on an
+           idle event stream, so closed browser tabs are noticed.'''
+        self.address = address
+        self.keepalive = keepalive
+        self.broadcast = Broadcast(size)
+        self.latest = {}
+        self.viewers = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    def publish(self, unit, values, stamp=None):
+        '''Push a sample of unit to all viewers, values is a dict like APC.sample() returns.'''
+        if stamp is None:
+            stamp = time.time()
+        data = {
+            'unit'      : unit,
+            'time'      : stamp,
+            'values'    : {k: (v if v is not None and v >= 0 else None) for k, v in values.items()},
+            'status'    : status_flags(values.get('ups_status_byte')),
+            }
+        with self.lock:
+            # copy on write, /latest may be encoding the previous dict right now
+            latest = dict(self.latest)
+            latest[unit] = data
+            self.latest = latest
+        self.broadcast.publish('sample', data, unit)
+
+    def _stream(self, handler):
+        '''Write the event stream of one viewer until it disconnects.'''
+        with self.lock:
+            self.viewers += 1
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'text/event-stream')
+            handler.send_header('Cache-Control', 'no-cache')
+            handler.send_header('Connection', 'keep-alive')
+            handler.end_headers()
+            sequence, events = self.broadcast.current()
+            handler.wfile.write(b'retry: 3000\n\n' + b''.join(events))
+            handler.wfile.flush()
+            while self.server is not None:
+                sequence, events = self.broadcast.since(sequence, self.keepalive)
+                handler.wfile.write(b''.join(events) if events else b': keepalive\n\n')
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self.lock:
+                self.viewers -= 1
+
+    def start(self):
+        '''Start serving in a background thread. Returns False when the address is in use.'''
+        import http.server              # only needed by the process that serves
+
+        dashboard = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/events':
+                    dashboard._stream(self)
+                    return
+                if path == '/':
+                    body, kind = PAGE.encode(), 'text/html; charset=utf-8'
+                elif path == '/latest':
+                    body, kind = json.dumps(dashboard.latest).encode(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(http.server.ThreadingHTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+            request_queue_size = 128    # many viewers (re)connect at the same time
+
+        try:
+            self.server = Server(self.address, Handler)
+        except OSError:
+            return False
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        '''Stop serving, open event streams end with the next event or keepalive.'''
+        if self.server is not None:
+            server = self.server
+            self.server = None
+            server.shutdown()
+            server.server_close()
+
+
+###############################################################################
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>APC Smart-UPS</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+table { border-collapse: collapse; }
+th, td { padding: 0.3em 0.8em; border-bottom: 1px solid #ccc; text-align: right; }
+th:first-child, td:first-child, td.status { text-align: left; }
+td.alarm { color: #b00; font-weight: bold; }
+#state { color: #888; }
+</style></head>
+<body>
+<h1>APC Smart-UPS</h1>
+<table>
+<thead><tr><th>UPS</th><th>line V</th><th>output V</th><th>Hz</th><th>load %</th>
+<th>capacity %</th><th>battery V</th><th>runtime min</th><th>temp &deg;C</th><th>status</th><th>updated</th></tr></thead>
+<tbody id="units"></tbody>
+</table>
+<p id="state">connecting</p>
+<script>
+var columns = ['line_voltage', 'output_voltage', 'ups_and_utility_operating_frequency', 'load_power',
+               'battery_capacity', 'battery_voltage', 'estimated_runtime', 'ups_internal_temperature'];
+var alarms = ['replace battery', 'low battery', 'overload', 'on battery'];
+function row(unit) {
+    var id = 'unit-' + unit, tr = document.getElementById(id);
+    if (!tr) {
+        tr = document.createElement('tr');
+        tr.id = id;
+        for (var i = 0; i < columns.length + 3; i++) tr.appendChild(document.createElement('td'));
+        tr.cells[0].textContent = unit;
+        tr.cells[columns.length + 1].className = 'status';
+        document.getElementById('units').appendChild(tr);
+    }
+    return tr;
+}
+var source = new EventSource('events');
+source.addEventListener('sample', function (e) {
+    var data = JSON.parse(e.data), tr = row(data.unit);
+    columns.forEach(function (field, i) {
+        var value = data.values[field];
+        tr.cells[i + 1].textContent = (value === null || value === undefined) ? '-' : value;
+    });
+    var status = tr.cells[columns.length + 1];
+    status.textContent = data.status.join(', ');
+    status.className = data.status.some(function (s) { return alarms.indexOf(s) >= 0; }) ? 'status alarm' : 'status';
+    tr.cells[columns.length + 2].textContent = new Date(data.time * 1000).toLocaleTimeString();
+});
+source.onopen = function () { document.getElementById('state').textContent = 'live'; };
+source.onerror = function () { document.getElementById('state').textContent = 'reconnecting'; };
+</script>
+</body></html>
+'''
+
+
+if __name__ == '__main__':
+    import argparse
+    from APC_SMART_UPS import APC
+    from APC_SCHEDULER import FixedRateScheduler
+
+    parser = argparse.ArgumentParser(description='live dashboard of APC Smart-UPS units')
+    parser.add_argument('ports', nargs='+', help='serial ports or transport names of the units')
+    parser.add_argument('--http', default='127.0.0.1:8080', help='address of the web server')
+    parser.add_argument('--period', type=float, default=None,
+                        help='seconds between samples, default is the time one round takes plus 1')
+    args = parser.parse_args()
+
+    units = {}
+    for port in args.ports:
+        ups = APC(port)
+        if not ups.serial_open():
+            print('can not open', port)
+            continue
+        ups.set_ups_to_smart_mode()
+        units[port] = ups
+
+    # every field is one command with a response delay of 0.5 s, the units are read one
+    # after the other
+    period = args.period or 0.5 * len(DASHBOARD_FIELDS) * max(1, len(units)) + 1.0
+    if period < 0.5 * len(DASHBOARD_FIELDS) * len(units):
+        print('period %.1f s is shorter than one round of samples' % period)
+
+    host, _, tcpport = args.http.rpartition(':')
+    dashboard = Dashboard((host, int(tcpport)))
+    if not dashboard.start():
+        print('address in use', args.http)
+    else:
+        print('dashboard on http://%s:%d/' % dashboard.address[:2])
+        for tick in FixedRateScheduler(period):
+            for port, ups in units.items():
+                dashboard.publish(port, ups.sample(DASHBOARD_FIELDS), tick.stamp)
@@ -0,0 +1,194 @@
+###############################################################################
+#
+#   Energy accounting from the load of the UPS
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, kWh on line and on battery, per outage, per hour
+#             and per day, totals checkpointed to a small JSON file
+#           - intervals are split at local whole hours, the ones the hourly
+#             keys use, also in half hour time zones
+#
+###############################################################################
+#   How it works
+#
+#   load_power (P) is a percentage of the rated real power of the UPS, the
+#   Smart-UPS 3000 INET is rated 2700 W. Every sample gives a power in watts,
+#   the energy between two samples is the area of the trapezoid under the
+#   straight line between them, so irregular intervals are fine. A gap longer
+#   than max_gap is not filled in, it is counted as unknown time.
+#
+#   The interval belongs to the state of the sample at its start: on battery
+#   when ups_status_byte had the on-battery bit set, else on line. Intervals
+#   are split at whole hours, so the hourly and daily counters add up to the
+#   totals.
+#
+#   The checkpoint holds the totals, the counters and the last sample; after a
+#   restart within max_gap the integration continues where it stopped.
+#
+###############################################################################
+import collections                  # for the recent outages
+import json                         # for the checkpoint
+import os                           # for replacing the checkpoint
+import time                         # for the timestamps
+
+from APC_SMART_UPS import STATUS_ON_BATTERY
+
+
+# fields that sample() reads
+ENERGY_FIELDS = (
+    'load_power',
+    'ups_status_byte',
+    )
+
+HOURS = 48                          # hourly counters kept
+DAYS = 400                          # daily counters kept
+OUTAGES = 100                       # outages kept
+
+
+###############################################################################
+class EnergyMeter:
+
+    def __init__(self, rated_watts=2700.0, checkpoint=None, checkpoint_seconds=60.0, max_gap=300.0):
+        '''Init of the meter. rated_watts is the real power rating of the UPS, checkpoint the
+           name of the JSON file the totals are kept in, written at most every
+           checkpoint_seconds. Intervals longer than max_gap seconds are not integrated.'''
+        self.rated_watts = rated_watts
+        self.filename = checkpoint
+        self.checkpoint_seconds = checkpoint_seconds
+        self.max_gap = max_gap
+        self.online_wh = 0.0
+        self.battery_wh = 0.0
+        self.battery_seconds = 0.0
+        self.unknown_seconds = 0.0
+        self.hourly = collections.OrderedDict()     # 'YYYY-MM-DD HH' -> [on line Wh, on battery Wh]
+        self.daily = collections.OrderedDict()      # 'YYYY-MM-DD' -> [on line Wh, on battery Wh]
+        self.outage = None                          # running outage {'start', 'end', 'wh'}
+        self.outages = collections.deque(maxlen=OUTAGES)
+        self.last = None                            # (time, watts, on battery) of the last sample
+        self.saved = 0.0
+        if checkpoint is not None:
+            self.load()
+
+    ###########################################################################
+
+    def _add(self, key, counters, keep, on_battery, wh):
+        counter = counters.get(key)
+        if counter is None:
+            counter = counters[key] = [0.0, 0.0]
+            while len(counters) > keep:
+                counters.popitem(last=False)
+        counter[1 if on_battery else 0] += wh
+
+    def _integrate(self, t0, w0, t1, w1, on_battery):
+        '''Trapezoid from (t0, w0) to (t1, w1), split at whole hours of the local time.'''
+        slope = (w1 - w0) / (t1 - t0)
+        start = t0
+        while start < t1:
+            local = time.localtime(start)
+            offset = local.tm_gmtoff        # seconds east of UTC, 19800 for India
+            end = min(t1, ((start + offset) // 3600 + 1) * 3600 - offset)
+            wa = w0 + slope * (start - t0)
+            wb = w0 + slope * (end - t0)
+            wh = (wa + wb) / 2.0 * (end - start) / 3600.0
+            self._add(time.strftime('%Y-%m-%d %H', local), self.hourly, HOURS, on_battery, wh)
+            self._add(time.strftime('%Y-%m-%d', local), self.daily, DAYS, on_battery, wh)
+            if on_battery:
+                self.battery_wh += wh
+                self.outage['wh'] += wh
+            else:
+                self.online_wh += wh
+            start = end
+        if on_battery:
+            self.battery_seconds += t1 - t0
+
+    def update(self, values, stamp=None):
+        '''Feed one sample, values is a dict with ENERGY_FIELDS as APC.sample() returns.
+           Returns the energy in Wh added by this sample.'''
+        if stamp is None:
+            stamp = time.time()
+        load = values.get('load_power')
+        status = values.get('ups_status_byte')
+        if load is None or load < 0 or status is None or status < 0:
+            return 0.0
+        watts = load / 100.0 * self.rated_watts
+        on_battery = bool(status & STATUS_ON_BATTERY)
+        before = self.online_wh + self.battery_wh
+        if self.last is not None and stamp > self.last[0]:
+            t0, w0, was_on_battery = self.last
+            if stamp - t0 > self.max_gap:
+                self.unknown_seconds += stamp - t0
+            else:
+                self._integrate(t0, w0, stamp, watts, was_on_battery)
+        if on_battery and self.outage is None:
+            self.outage = {'start': stamp, 'end': None, 'wh': 0.0}
+        elif not on_battery and self.outage is not None:
+            self.outage['end'] = stamp
+            self.outages.append(self.outage)
+            self.outage = None
+        if self.last is None or stamp >= self.last[0]:
+            self.last = (stamp, watts, on_battery)
+        if self.filename is not None and time.monotonic() - self.saved >= self.checkpoint_seconds:
+            self.checkpoint()
+        return self.online_wh + self.battery_wh - before
+
+    def sample(self, ups, debug=False):
+        '''Read ENERGY_FIELDS from ups and feed them.'''
+        return self.update(ups.sample(ENERGY_FIELDS, debug))
+
+    def totals(self):
+        '''Totals since the meter was created, energies in kWh.'''
+        return {
+            'online_kwh'        : self.online_wh / 1000.0,
+            'battery_kwh'       : self.battery_wh / 1000.0,
+            'total_kwh'         : (self.online_wh + self.battery_wh) / 1000.0,
+            'battery_seconds'   : self.battery_seconds,
+            'unknown_seconds'   : self.unknown_seconds,
+            'outages'           : len(self.outages) + (self.outage is not None),
+            }
+
+    ###########################################################################
+
+    def checkpoint(self):
+        '''Write the totals to the checkpoint file, replaced in one step.'''
+        if self.filename is None:
+            return
+        state = {
+            'rated_watts'       : self.rated_watts,
+            'online_wh'         : self.online_wh,
+            'battery_wh'        : self.battery_wh,
+            'battery_seconds'   : self.battery_seconds,
+            'unknown_seconds'   : self.unknown_seconds,
+            'hourly'            : list(self.hourly.items()),
+            'daily'             : list(self.daily.items()),
+            'outage'            : self.outage,
+            'outages'           : list(self.outages),
+            'last'              : self.last,
+            }
+        temp = self.filename + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp, self.filename)
+        self.saved = time.monotonic()
+
+    def load(self):
+        '''Continue from the checkpoint file when there is one.'''
+        try:
+            with open(self.filename) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.online_wh = state['online_wh']
+        self.battery_wh = state['battery_wh']
+        self.battery_seconds = state['battery_seconds']
+        self.unknown_seconds = state['unknown_seconds']
+        self.hourly = collections.OrderedDict(state['hourly'])
+        self.daily = collections.OrderedDict(state['daily'])
+        self.outage = state['outage']
+        self.outages.extend(state['outages'])
+        self.last = tuple(state['last']) if state['last'] else None
+        self.saved = time.monotonic()
+
+    def close(self):
+        self.checkpoint()
@@ -0,0 +1,241 @@
+###############################################################################
+#
+#   Parallel shutdown fan-out to the hosts protected by the UPS
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, TCP and local command targets with per host
+#             timeout, retries and ordering groups, trigger on the status
+#             byte of the UPS
+#
+###############################################################################
+#   How it works
+#
+#   Every target belongs to a group. All targets of a group are contacted at
+#   the same time, each in its own thread, the next group starts when every
+#   target of the group acknowledged or gave up. So a group takes as long as
+#   its slowest target, not the sum of all targets. Use groups for an order,
+#   for example application servers in group 0 and the storage they use in
+#   group 1.
+#
+#   tcp     connect to host:port, send message, acknowledged when the answer
+#           starts with ack (or when the message was sent if ack is empty)
+#   command run argv locally, acknowledged on exit code 0; use it for ssh,
+#           IPMI or any other tool
+#
+#   A target gives up after timeout seconds, retries included. An overall
+#   deadline, for example the remaining runtime of the UPS, shortens the
+#   timeouts of the targets that are still to be contacted.
+#
+#   fanout = FanOut([
+#       Target('web1', address=('10.0.0.11', 47311)),
+#       Target('db1', command=['ssh', 'db1', 'sudo', 'poweroff'], group=1, timeout=20),
+#       ])
+#   trigger = ShutdownTrigger(fanout)
+#   while True:
+#       trigger.check(ups.sample(('ups_status_byte', 'estimated_runtime')))
+#
+###############################################################################
+import socket                       # for the TCP targets
+import subprocess                   # for the command targets
+import threading                    # one thread per target
+import time                         # for the timeouts
+
+from APC_SMART_UPS import STATUS_LOW_BATTERY
+from APC_SMART_UPS import STATUS_ON_BATTERY
+
+
+ACKNOWLEDGED    = 'acknowledged'
+FAILED          = 'failed'
+TIMEOUT         = 'timeout'
+SKIPPED         = 'skipped'         # the overall deadline passed before the group started
+
+
+###############################################################################
+def on_battery_and_low(values):
+    '''Default trigger, the UPS runs on battery and reports low battery.'''
+    status = values.get('ups_status_byte')
+    if status is None or status < 0:
+        return False
+    return bool(status & STATUS_ON_BATTERY) and bool(status & STATUS_LOW_BATTERY)
+
+
+class Target:
+
+    def __init__(self, name, address=None, command=None, group=0, timeout=10.0, retries=2,
+                 message=b'shutdown\n', ack=b'OK'):
+        '''A host to notify, either address (host, port) for TCP or command (argv list) for a
+           local hook. timeout covers all attempts together.'''
+        if (address is None) == (command is None):
+            raise ValueError('target %s needs either address or command' % name)
+        self.name = name
+        self.address = address
+        self.command = command
+        self.group = group
+        self.timeout = timeout
+        self.retries = retries
+        self.message = message
+        self.ack = ack
+
+    def _tcp(self, timeout):
+        with socket.create_connection(self.address, timeout=timeout) as conn:
+            conn.settimeout(timeout)
+            conn.sendall(self.message)
+            if not self.ack:
+                return True
+            data = b''
+            while len(data) < len(self.ack):
+                chunk = conn.recv(256)
+                if not chunk:
+                    break
+                data += chunk
+            return data.startswith(self.ack)
+
+    def _command(self, timeout):
+        completed = subprocess.run(self.command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL, timeout=timeout)
+        return completed.returncode == 0
+
+    def notify(self, timeout=None):
+        '''Contact the target until it acknowledges, the retries are used up or the timeout
+           passed. Returns a result dict.'''
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        start = time.monotonic()
+        end = start + timeout
+        result = {'name': self.name, 'group': self.group, 'state': FAILED, 'attempts': 0, 'error': ''}
+        for attempt in range(self.retries + 1):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                result['state'] = TIMEOUT
+                break
+            result['attempts'] += 1
+            try:
+                if self.address is not None:
+                    ok = self._tcp(remaining)
+                else:
+                    ok = self._command(remaining)
+                if ok:
+                    result['state'] = ACKNOWLEDGED
+                    result['error'] = ''
+                    break
+                result['error'] = 'no acknowledge'
+            except (socket.timeout, subprocess.TimeoutExpired):
+                result['state'] = TIMEOUT
+                result['error'] = 'timeout'
+                continue
+            except OSError as error:
+                result['error'] = str(error)
+            result['state'] = FAILED
+            if attempt == self.retries:
+                break
+            # short pause before the next attempt, a host that refuses may just be starting
+            time.sleep(min(0.2 * (attempt + 1), max(0.0, end - time.monotonic())))
+        result['elapsed'] = time.monotonic() - start
+        return result
+
+
+###############################################################################
+class FanOut:
+
+    def __init__(self, targets, callback=None):
+        '''targets is a list of Target. callback is called with every result dict as soon as
+           the target is done, from the thread of that target.'''
+        self.targets = list(targets)
+        self.callback = callback
+
+    def groups(self):
+        '''The targets as a list of lists, in group order.'''
+        groups = {}
+        for target in self.targets:
+            groups.setdefault(target.group, []).append(target)
+        return [groups[group] for group in sorted(groups)]
+
+    def run(self, deadline=None):
+        '''Notify all targets, group after group. deadline is the number of seconds all groups
+           together may take. Returns a report dict with the results of all targets.'''
+        start = time.monotonic()
+        results = []
+        lock = threading.Lock()
+
+        def worker(target, timeout):
+            result = target.notify(timeout)
+            with lock:
+                results.append(result)
+            if self.callback is not None:
+                self.callback(result)
+
+        for group in self.groups():
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - (time.monotonic() - start)
+                if timeout <= 0:
+                    for target in group:
+                        results.append({'name': target.name, 'group': target.group, 'state': SKIPPED,
+                                        'attempts': 0, 'error': 'deadline', 'elapsed': 0.0})
+                    continue
+            threads = [threading.Thread(target=worker, args=(target, timeout), daemon=True) for target in group]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        order = {target.name: i for i, target in enumerate(self.targets)}
+        results.sort(key=lambda result: order[result['name']])
+        return {
+            'elapsed'       : time.monotonic() - start,
+            'acknowledged'  : [r['name'] for r in results if r['state'] == ACKNOWLEDGED],
+            'failed'        : [r['name'] for r in results if r['state'] != ACKNOWLEDGED],
+            'results'       : results,
+            }
+
+
+###############################################################################
+class ShutdownTrigger:
+
+    def __init__(self, fanout, condition=on_battery_and_low, deadline=None, margin=60.0):
+        '''Runs the fan-out once when condition(values) becomes true. deadline is fixed in
+           seconds; without it the estimated_runtime of the sample (minutes) minus margin
+           seconds is used when it is in the sample.'''
+        self.fanout = fanout
+        self.condition = condition
+        self.deadline = deadline
+        self.margin = margin
+        self.thread = None
+        self.report = None
+        self.triggered = False
+
+    def _deadline(self, values):
+        if self.deadline is not None:
+            return self.deadline
+        runtime = values.get('estimated_runtime')
+        if runtime is None or runtime < 0:
+            return None
+        return max(1.0, runtime * 60.0 - self.margin)
+
+    def _run(self, deadline):
+        self.report = self.fanout.run(deadline)
+
+    def check(self, values):
+        '''Feed one sample, a dict like APC.sample() returns. Starts the fan-out in the
+           background the first time the condition is true and returns True then. The
+           monitoring loop is not blocked.'''
+        if self.triggered or not self.condition(values):
+            return False
+        self.triggered = True
+        self.thread = threading.Thread(target=self._run, args=(self._deadline(values),), daemon=True)
+        self.thread.start()
+        return True
+
+    def wait(self, timeout=None):
+        '''Wait for a started fan-out, returns its report or None.'''
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.report
+
+    def reset(self):
+        '''Arm the trigger again, for example when the power came back.'''
+        if self.thread is None or not self.thread.is_alive():
+            self.triggered = False
+            self.report = None
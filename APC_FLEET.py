@@ -0,0 +1,314 @@
+###############################################################################
+#
+#   Fleet totals over many UPS units, kept up to date sample by sample
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, sum/min/max per field with the unit holding the
+#             extreme, counts of the status flags, group by tags
+#
+###############################################################################
+#   How it works
+#
+#   fleet = Fleet()
+#   fleet.tag('rack1', rated_watts=2700, rack='A', room='1', feed='B')
+#   fleet.update('rack1', ups.sample(FLEET_FIELDS))        from every sampling loop
+#   fleet.summary()                                         whole fleet
+#   fleet.summary('rack')                                   {'A': {...}, 'B': {...}}
+#
+#   Every unit belongs to the fleet and to one group per tag. A sample only
+#   touches the groups of its unit: the sum is corrected by the difference to
+#   the previous value, min and max are heaps with lazy deletion (an entry is
+#   skipped when the unit has a newer value since), the flags are counters.
+#   An update costs O(log n) per field and group, a summary O(1) per field
+#   and group plus the stale heap entries it pops. Nothing asks a UPS again.
+#
+#   load_watts is load_power (% of the rated real power) times rated_watts of
+#   the unit, units without rated_watts are left out of it. The -1/-2 error
+#   answers take the unit out of a field until a valid value comes in.
+#
+###############################################################################
+import heapq                        # for min and max
+import threading                    # update and summary come from several threads
+import time                         # for the timestamps
+
+from APC_SMART_UPS import STATUS_LOW_BATTERY
+from APC_SMART_UPS import STATUS_ON_BATTERY
+from APC_SMART_UPS import STATUS_OVERLOAD
+from APC_SMART_UPS import STATUS_REPLACE_BATTERY
+
+
+# fields a sampling loop should read for the fleet
+FLEET_FIELDS = (
+    'ups_status_byte',
+    'load_power',
+    'battery_capacity',
+    'estimated_runtime',
+    'ups_internal_temperature',
+    'line_voltage',
+    )
+
+# fields aggregated, load_watts is computed
+AGGREGATED = (
+    'load_watts',
+    'load_power',
+    'battery_capacity',
+    'estimated_runtime',
+    'ups_internal_temperature',
+    'line_voltage',
+    )
+
+# status byte bits counted
+FLAGS = (
+    ('on_battery'       , STATUS_ON_BATTERY),
+    ('low_battery'      , STATUS_LOW_BATTERY),
+    ('replace_battery'  , STATUS_REPLACE_BATTERY),
+    ('overload'         , STATUS_OVERLOAD),
+    )
+
+RESUM = 10000                       # updates between exact recomputes of a sum
+
+
+###############################################################################
+class Aggregate:
+
+    def __init__(self):
+        '''Sum, count, min and max of one field over the units of one group.'''
+        self.values = {}                # unit -> (value, sequence)
+        self.low = []                   # heap of (value, sequence, unit)
+        self.high = []                  # heap of (-value, sequence, unit)
+        self.sum = 0.0
+        self.sequence = 0
+        self.updates = 0
+
+    def set(self, unit, value):
+        old = self.values.get(unit)
+        if old is not None:
+            if old[0] == value:
+                return
+            self.sum -= old[0]
+        self.sequence += 1
+        self.values[unit] = (value, self.sequence)
+        self.sum += value
+        heapq.heappush(self.low, (value, self.sequence, unit))
+        heapq.heappush(self.high, (-value, self.sequence, unit))
+        self._maintain()
+
+    def remove(self, unit):
+        old = self.values.pop(unit, None)
+        if old is not None:
+            self.sum -= old[0]
+            self._maintain()
+
+    def _maintain(self):
+        self.updates += 1
+        if self.updates % RESUM == 0:
+            # the running sum drifts by rounding, recompute it now and then
+            self.sum = sum(value for value, _ in self.values.values())
+        if len(self.low) > 2 * len(self.values) + 64:
+            # mostly stale entries, rebuild the heaps
+            self.low = [(value, sequence, unit) for unit, (value, sequence) in self.values.items()]
+            self.high = [(-value, sequence, unit) for unit, (value, sequence) in self.values.items()]
+            heapq.heapify(self.low)
+            heapq.heapify(self.high)
+
+    def _top(self, heap):
+        while heap:
+            value, sequence, unit = heap[0]
+            current = self.values.get(unit)
+            if current is not None and current[1] == sequence:
+                return value, unit
+            heapq.heappop(heap)
+        return None, None
+
+    def summary(self):
+        count = len(self.values)
+        if not count:
+            return {'count': 0}
+        low, low_unit = self._top(self.low)
+        high, high_unit = self._top(self.high)
+        return {
+            'count'     : count,
+            'sum'       : round(self.sum, 3),
+            'mean'      : round(self.sum / count, 3),
+            'min'       : low,
+            'min_unit'  : low_unit,
+            'max'       : -high,
+            'max_unit'  : high_unit,
+            }
+
+
+class Group:
+
+    def __init__(self):
+        self.units = set()
+        self.fields = {field: Aggregate() for field in AGGREGATED}
+        self.flags = dict.fromkeys([name for name, _ in FLAGS], 0)
+
+    def summary(self):
+        result = {'units': len(self.units)}
+        result.update(self.flags)
+        for field, aggregate in self.fields.items():
+            result[field] = aggregate.summary()
+        return result
+
+
+###############################################################################
+class Fleet:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = Group()
+        self.groups = {}                # (tag, value) -> Group
+        self.tags = {}                  # unit -> {tag: value}
+        self.rated = {}                 # unit -> rated watts
+        self.latest = {}                # unit -> (time, {field: value}) of AGGREGATED
+        self.flags = {}                 # unit -> set of flag names
+
+    def _groups(self, unit):
+        groups = [self.total]
+        for tag, value in self.tags.get(unit, {}).items():
+            group = self.groups.get((tag, value))
+            if group is None:
+                group = self.groups[(tag, value)] = Group()
+            groups.append(group)
+        return groups
+
+    def _leave(self, unit):
+        '''Take unit out of all its groups, empty groups are deleted.'''
+        flags = self.flags.get(unit, ())
+        for group in self._groups(unit):
+            group.units.discard(unit)
+            for aggregate in group.fields.values():
+                aggregate.remove(unit)
+            for name in flags:
+                group.flags[name] -= 1
+        for key in [key for key, group in self.groups.items() if not group.units]:
+            del self.groups[key]
+
+    def _join(self, unit):
+        '''Put unit into its groups with its latest values.'''
+        latest = self.latest.get(unit, (0.0, {}))[1]
+        flags = self.flags.get(unit, ())
+        for group in self._groups(unit):
+            group.units.add(unit)
+            for field, value in latest.items():
+                group.fields[field].set(unit, value)
+            for name in flags:
+                group.flags[name] += 1
+
+    ###########################################################################
+
+    def tag(self, unit, rated_watts=None, **tags):
+        '''Set the tags (rack='A', room='1', ...) and the rated real power of unit, replacing
+           the previous ones. The unit is moved to its new groups with its latest values.'''
+        tags = {tag: str(value) for tag, value in tags.items()}
+        with self.lock:
+            if unit in self.tags and self.tags[unit] == tags and self.rated.get(unit) == rated_watts:
+                return
+            self._leave(unit)
+            self.tags[unit] = tags
+            if rated_watts is None:
+                self.rated.pop(unit, None)
+            else:
+                self.rated[unit] = float(rated_watts)
+            if unit in self.latest:
+                stamp, latest = self.latest[unit]
+                self.latest[unit] = (stamp, {})
+                load = latest.get('load_power', -1)
+                latest['load_watts'] = load / 100.0 * rated_watts if rated_watts is not None and load >= 0 else -1
+                self._join(unit)
+                self._store(unit, latest, stamp)
+            else:
+                self._join(unit)
+
+    def update(self, unit, values, stamp=None):
+        '''New sample of unit, values is a dict like APC.sample() returns. A unit that was not
+           tagged joins the fleet without tags.'''
+        if stamp is None:
+            stamp = time.time()
+        latest = dict((field, values.get(field, -1)) for field in AGGREGATED if field != 'load_watts')
+        load = latest.get('load_power', -1)
+        rated = self.rated.get(unit)
+        latest['load_watts'] = load / 100.0 * rated if rated is not None and load >= 0 else -1
+        with self.lock:
+            if unit not in self.tags:
+                self.tags[unit] = {}
+                self._join(unit)
+            self._store(unit, latest, stamp)
+            status = values.get('ups_status_byte', -1)
+            if status is not None and status >= 0:
+                flags = set(name for name, bit in FLAGS if status & bit)
+                old = self.flags.get(unit, set())
+                if flags != old:
+                    self.flags[unit] = flags
+                    for group in self._groups(unit):
+                        for name in old - flags:
+                            group.flags[name] -= 1
+                        for name in flags - old:
+                            group.flags[name] += 1
+
+    def _store(self, unit, latest, stamp):
+        kept = self.latest.get(unit, (0.0, {}))[1]
+        groups = self._groups(unit)
+        for field, value in latest.items():
+            if value is None or value < 0:
+                if field in kept:
+                    del kept[field]
+                    for group in groups:
+                        group.fields[field].remove(unit)
+                continue
+            if kept.get(field) != value:
+                kept[field] = value
+                for group in groups:
+                    group.fields[field].set(unit, value)
+        self.latest[unit] = (stamp, kept)
+
+    def remove(self, unit):
+        '''Take unit out of the fleet.'''
+        with self.lock:
+            if unit not in self.tags:
+                return
+            self._leave(unit)
+            for table in (self.tags, self.rated, self.latest, self.flags):
+                table.pop(unit, None)
+
+    def expire(self, max_age, now=None):
+        '''Remove the units without a sample for max_age seconds, returns their names.'''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            old = [unit for unit, (stamp, _) in self.latest.items() if now - stamp > max_age]
+        for unit in old:
+            self.remove(unit)
+        return old
+
+    ###########################################################################
+
+    def summary(self, by=None):
+        '''Totals of the whole fleet, or {tag value: totals} of the groups of tag by.'''
+        with self.lock:
+            if by is None:
+                return self.total.summary()
+            return {value: group.summary() for (tag, value), group in sorted(self.groups.items()) if tag == by}
+
+    def tag_names(self):
+        '''The tags in use.'''
+        with self.lock:
+            return sorted(set(tag for tag, _ in self.groups))
+
+    def sink(self, unit):
+        '''Pipeline sink feeding the samples of unit into the fleet.'''
+        return lambda sample: self.update(unit, sample.values, sample.stamp)
+
+
+def flatten(summary, prefix='fleet/'):
+    '''A summary as flat {name: value} pairs, for example "fleet/load_watts/sum".'''
+    result = {}
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            result.update(flatten(value, prefix + key + '/'))
+        else:
+            result[prefix + key] = value
+    return result
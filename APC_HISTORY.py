@@ -0,0 +1,322 @@
+###############################################################################
+#
+#   In-memory history of recent UPS samples
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, fixed size ring buffer with one array per field
+#           - values are stored exactly as integers in the resolution of the
+#             UPS answer; every block keeps its values sorted, so percentiles
+#             do not sort the window
+#
+###############################################################################
+#   Layout
+#
+#   Every sample gets a sequence number seq, it is stored at seq % capacity.
+#   A value is stored as an integer in units of its resolution (DECIMALS, the
+#   UPS answers line_voltage with one decimal, so 231.4 is stored as 2314),
+#   all values of a field in one array, no Python object per sample:
+#
+#   value   array('h')  the value, MISSING for the -1/-2 error answers
+#   stamps  array('d')  time of every sample
+#
+#   The samples are grouped in blocks of BLOCK. Per block there is the sum and
+#   count of all valid values before the block, and a copy of the values of
+#   the block in sorted order. The sum of a window is one subtraction plus the
+#   samples at both ends, minimum and maximum are the ends of the sorted
+#   copies, and a percentile counts the values below a candidate with one
+#   bisect per block instead of sorting the window.
+#
+#   24 h of 1 Hz samples of the 8 LOG_FIELDS take about 3.5 MB. A field
+#   that is not in DECIMALS is kept with 3 decimals in 4 bytes.
+#
+###############################################################################
+import array                        # for the columns
+import bisect                       # for the sorted blocks
+import math                         # for the block extremes
+import time                         # for the timestamps
+
+from APC_SMART_UPS import LOG_FIELDS
+
+
+BLOCK = 64
+
+# decimals of the answers of the UPS, four digits at most, so they fit in 'h'
+DECIMALS = {
+    'line_voltage'                          : 1,
+    'output_voltage'                        : 1,
+    'maximum_line_voltage'                  : 1,
+    'minimum_line_voltage'                  : 1,
+    'ups_and_utility_operating_frequency'   : 2,
+    'load_power'                            : 1,
+    'battery_capacity'                      : 1,
+    'battery_voltage'                       : 2,
+    'ups_internal_temperature'              : 1,
+    'ups_status'                            : 0,
+    'ups_status_byte'                       : 0,
+    'estimated_runtime'                     : 0,
+    }
+
+
+###############################################################################
+class Column:
+
+    def __init__(self, field, capacity, blocks):
+        if field in DECIMALS:
+            decimals, typecode = DECIMALS[field], 'h'
+        else:
+            decimals, typecode = 3, 'i'
+        self.scale = 10 ** decimals
+        self.missing = -2 ** (8 * array.array(typecode).itemsize - 1)
+        self.limit = -self.missing - 1
+        self.value = array.array(typecode, [self.missing]) * capacity
+        self.sorted = array.array(typecode, [0]) * capacity
+        self.valid = array.array('H', [0]) * blocks         # valid values in the block
+        self.before_sum = array.array('q', [0]) * blocks    # before the block
+        self.before_count = array.array('Q', [0]) * blocks
+        # running totals over everything ever added, in units of the resolution
+        self.sum = 0
+        self.count = 0
+
+    def quantise(self, value):
+        '''The stored integer of value, missing for the error answers and values that do not fit.'''
+        if value is None or value < 0:
+            return self.missing
+        stored = int(round(value * self.scale))
+        if stored > self.limit:
+            return self.missing
+        return stored
+
+
+class History:
+
+    def __init__(self, fields=LOG_FIELDS, capacity=86400):
+        '''Init of the history. fields are the names of the APC methods that are kept, capacity
+           is the number of samples, the default holds 24 h of 1 Hz samples.'''
+        capacity = ((capacity + BLOCK - 1) // BLOCK) * BLOCK
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self.blocks = capacity // BLOCK
+        self.stamps = array.array('d', [0.0]) * capacity
+        self.columns = {field: Column(field, capacity, self.blocks) for field in self.fields}
+        self.seq = 0                    # sequence number of the next sample
+
+    def __len__(self):
+        return min(self.seq, self.capacity)
+
+    def nbytes(self):
+        '''Memory used by the arrays.'''
+        size = self.stamps.itemsize * len(self.stamps)
+        for column in self.columns.values():
+            for a in (column.value, column.sorted, column.valid, column.before_sum, column.before_count):
+                size += a.itemsize * len(a)
+        return size
+
+    def add(self, values, stamp=None):
+        '''Add one sample, values is a dict like APC.sample() returns. Fields that are missing or
+           negative (the error answers of the APC methods) are stored as missing.'''
+        if stamp is None:
+            stamp = time.time()
+        seq = self.seq
+        position = seq % self.capacity
+        block = position // BLOCK
+        new_block = seq % BLOCK == 0
+        self.stamps[position] = stamp
+        for field, column in self.columns.items():
+            if new_block:
+                column.valid[block] = 0
+                column.before_sum[block] = column.sum
+                column.before_count[block] = column.count
+            value = column.quantise(values.get(field))
+            column.value[position] = value
+            if value == column.missing:
+                continue
+            column.sum += value
+            column.count += 1
+            # insert into the sorted copy of the block
+            start = block * BLOCK
+            end = start + column.valid[block]
+            index = bisect.bisect_right(column.sorted, value, start, end)
+            column.sorted[index + 1:end + 1] = column.sorted[index:end]
+            column.sorted[index] = value
+            column.valid[block] += 1
+        self.seq = seq + 1
+
+    def sample(self, ups, debug=False):
+        '''Read the fields from ups and add them.'''
+        self.add(ups.sample(self.fields, debug))
+
+    ###########################################################################
+
+    def window(self, seconds=None, end=None):
+        '''Sequence numbers (first, last) of the samples newer than seconds before the last one,
+           up to and including end. The whole history when seconds is None, None when the
+           window is empty.'''
+        if self.seq == 0:
+            return None
+        oldest = max(0, self.seq - self.capacity)
+        last = self.seq - 1
+        if end is not None:
+            last = self._find(end, oldest, self.seq) - 1
+        if last < oldest:
+            return None
+        first = oldest
+        if seconds is not None:
+            stop = self.stamps[last % self.capacity]
+            first = self._find(stop - seconds, oldest, last + 1)
+        if first > last:
+            return None
+        return first, last
+
+    def _find(self, stamp, low, high):
+        '''First sequence number between low and high with a timestamp after stamp.'''
+        while low < high:
+            middle = (low + high) // 2
+            value = self.stamps[middle % self.capacity]
+            if value <= stamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _split(self, first, last):
+        '''The window as whole blocks (first block, stop block) and the single samples at both
+           ends as ranges of sequence numbers.'''
+        start_block = (first + BLOCK - 1) // BLOCK
+        stop_block = (last + 1) // BLOCK
+        if start_block >= stop_block:
+            return start_block, start_block, ((first, last + 1),)
+        return start_block, stop_block, ((first, start_block * BLOCK), (stop_block * BLOCK, last + 1))
+
+    def _ends(self, column, ranges):
+        '''The valid stored values of the single samples.'''
+        for start, stop in ranges:
+            for seq in range(start, stop):
+                value = column.value[seq % self.capacity]
+                if value != column.missing:
+                    yield value
+
+    def _before(self, column, block):
+        '''Sum and count of the valid values before block (a sequence number / BLOCK).'''
+        if block * BLOCK >= self.seq:
+            return column.sum, column.count
+        slot = block % self.blocks
+        return column.before_sum[slot], column.before_count[slot]
+
+    def _sum_count(self, column, first, last):
+        start_block, stop_block, ranges = self._split(first, last)
+        total = count = 0
+        if start_block < stop_block:
+            stop_sum, stop_count = self._before(column, stop_block)
+            start_sum, start_count = self._before(column, start_block)
+            total, count = stop_sum - start_sum, stop_count - start_count
+        for value in self._ends(column, ranges):
+            total += value
+            count += 1
+        return total, count
+
+    def _extreme(self, column, first, last, high):
+        '''Minimum or maximum, whole blocks from the ends of their sorted copies, the ends of
+           the window sample by sample.'''
+        best = -math.inf if high else math.inf
+        better = max if high else min
+        start_block, stop_block, ranges = self._split(first, last)
+        for block in range(start_block, stop_block):
+            slot = block % self.blocks
+            valid = column.valid[slot]
+            if valid:
+                best = better(best, column.sorted[slot * BLOCK + (valid - 1 if high else 0)])
+        for value in self._ends(column, ranges):
+            best = better(best, value)
+        if math.isinf(best):
+            return None
+        return best / column.scale
+
+    def _rank(self, column, k, blocks, ends, low, high):
+        '''The stored value with k values below it, searched between low and high.'''
+        while low < high:
+            middle = (low + high) // 2
+            count = sum(1 for value in ends if value <= middle)
+            for slot in blocks:
+                start = slot * BLOCK
+                count += bisect.bisect_right(column.sorted, middle, start, start + column.valid[slot]) - start
+            if count > k:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    ###########################################################################
+
+    def count(self, field, seconds=None):
+        '''Number of valid samples of field in the window.'''
+        span = self.window(seconds)
+        if span is None:
+            return 0
+        return self._sum_count(self.columns[field], *span)[1]
+
+    def mean(self, field, seconds=None):
+        '''Mean of field over the last seconds, None without valid samples.'''
+        span = self.window(seconds)
+        if span is None:
+            return None
+        column = self.columns[field]
+        total, count = self._sum_count(column, *span)
+        if count == 0:
+            return None
+        return total / count / column.scale
+
+    def minimum(self, field, seconds=None):
+        span = self.window(seconds)
+        if span is None:
+            return None
+        return self._extreme(self.columns[field], span[0], span[1], False)
+
+    def maximum(self, field, seconds=None):
+        span = self.window(seconds)
+        if span is None:
+            return None
+        return self._extreme(self.columns[field], span[0], span[1], True)
+
+    def values(self, field, seconds=None):
+        '''The valid values of field in the window, oldest first.'''
+        span = self.window(seconds)
+        if span is None:
+            return []
+        column = self.columns[field]
+        return [value / column.scale for value in self._ends(column, ((span[0], span[1] + 1),))]
+
+    def percentile(self, field, p, seconds=None):
+        '''Percentile p (0..100) of field over the window with linear interpolation.'''
+        span = self.window(seconds)
+        if span is None:
+            return None
+        column = self.columns[field]
+        start_block, stop_block, ranges = self._split(*span)
+        blocks = [block % self.blocks for block in range(start_block, stop_block)]
+        ends = list(self._ends(column, ranges))
+        count = len(ends) + sum(column.valid[slot] for slot in blocks)
+        if count == 0:
+            return None
+        low = self._extreme(column, span[0], span[1], False)
+        high = self._extreme(column, span[0], span[1], True)
+        bounds = (int(round(low * column.scale)), int(round(high * column.scale)))
+        rank = (count - 1) * p / 100.0
+        below = int(rank)
+        value = self._rank(column, below, blocks, ends, *bounds)
+        if rank > below:
+            above = self._rank(column, below + 1, blocks, ends, value, bounds[1])
+            return (value + (above - value) * (rank - below)) / column.scale
+        return value / column.scale
+
+    def latest(self, field):
+        '''Last stored value of field and its timestamp, (None, None) when empty.'''
+        if self.seq == 0:
+            return None, None
+        position = (self.seq - 1) % self.capacity
+        column = self.columns[field]
+        value = column.value[position]
+        if value == column.missing:
+            return None, self.stamps[position]
+        return value / column.scale, self.stamps[position]
@@ -0,0 +1,223 @@
+###############################################################################
+#
+#   Parallel bulk import of the csv logs of battery_calibration_log_to_csv.py
+#
+#   python APC_INGEST.py logs/ [ups_log_*.csv ...] [--workers 8]
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, process pool over chunks of the files, column
+#             wise parsing, one time sorted columnar result
+#
+###############################################################################
+#   How it works
+#
+#   The files are cut in chunks of about chunk bytes at line ends, every chunk
+#   is parsed by a worker process. A worker splits the rows once and converts
+#   one column at a time with map(float, ...) into an array('d'); only a
+#   column with a bad value falls back to value by value. The trailing comma
+#   of the rows is ignored, the -1/-2 error answers and bad values become NaN,
+#   rows without a valid date and time are skipped.
+#
+#   The date and time columns become seconds since the epoch, mktime is called
+#   once per date and hour only. The chunks come back as raw arrays, they are
+#   joined in time order; only when chunks overlap in time the whole result is
+#   sorted.
+#
+#   dataset = ingest(['logs'])
+#   dataset.columns['battery_voltage']      array('d') in time order
+#
+###############################################################################
+import glob                         # for finding the files
+import os                           # for the file sizes
+import time                         # for mktime
+from array import array             # for the columns
+
+from APC_SMART_UPS import LOG_COLUMNS
+from APC_SMART_UPS import LOG_FIELDS
+
+
+PATTERN = 'ups_log_*.csv'
+CHUNK = 4 * 1024 * 1024
+NAN = float('nan')
+
+
+###############################################################################
+class Dataset:
+
+    def __init__(self, fields=LOG_FIELDS):
+        '''Columnar samples, 'time' (seconds since epoch) and one array('d') per field.'''
+        self.fields = tuple(fields)
+        self.columns = {name: array('d') for name in ('time',) + self.fields}
+        self.files = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def rows(self):
+        '''The samples as (time, dict of values), NaN left out, for APC_SQLITE and friends.'''
+        times = self.columns['time']
+        columns = [(field, self.columns[field]) for field in self.fields]
+        for index in range(len(times)):
+            values = {}
+            for field, column in columns:
+                value = column[index]
+                if value == value:
+                    values[field] = value
+            yield times[index], values
+
+
+###############################################################################
+def discover(paths):
+    '''Log files in paths; a path is a file, a directory (searched recursively for
+       ups_log_*.csv) or a glob pattern. Sorted, without duplicates.'''
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found.update(glob.glob(os.path.join(path, '**', PATTERN), recursive=True))
+        else:
+            found.update(glob.glob(path))
+    return sorted(found)
+
+
+def chunks(filename, chunk=CHUNK):
+    '''Cut a file in (filename, start, end, column indexes) at line ends after the header.'''
+    with open(filename, 'rb') as f:
+        header = f.readline()
+        names = [name.strip() for name in header.decode(errors='replace').split(',')]
+        index = {name: i for i, name in enumerate(names)}
+        columns = [index.get(name) for name in LOG_COLUMNS]
+        size = os.fstat(f.fileno()).st_size
+        start = f.tell()
+        result = []
+        while start < size:
+            end = start + chunk
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            else:
+                end = size
+            result.append((filename, start, end, columns))
+            start = end
+    return result
+
+
+def _float(value):
+    try:
+        value = float(value)
+    except ValueError:
+        return NAN
+    return NAN if value < 0 else value
+
+
+def parse_chunk(job):
+    '''Parse one chunk. Returns (start time, end time, sorted, skipped rows, time column as
+       bytes, field columns as bytes), run in a worker process.'''
+    filename, start, end, columns = job
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    needed = max(c for c in columns + [2] if c is not None) + 1
+    rows = [line.split(b',') for line in data.split(b'\n')]
+    good = [row for row in rows if len(row) >= needed]
+    skipped = sum(1 for row in rows if len(row) > 1) - len(good)
+
+    # timestamps, mktime once per date and hour
+    bases = {}
+    times = array('d')
+    keep = []
+    for row in good:
+        day = row[1]
+        clock = row[2]
+        try:
+            key = (day, clock[:2])
+            base = bases.get(key)
+            if base is None:
+                y, m, d = (int(part) for part in day.split(b'-'))
+                hour = int(clock[:2])
+                if not (1 <= m <= 12 and 1 <= d <= 31 and 0 <= hour <= 23):
+                    raise ValueError(day)
+                base = bases[key] = time.mktime((y, m, d, hour, 0, 0, 0, 0, -1))
+            times.append(base + int(clock[3:5]) * 60 + int(clock[6:8]))
+            keep.append(row)
+        except ValueError:
+            skipped += 1
+    good = keep
+
+    result = []
+    for column in columns:
+        if column is None:
+            result.append(array('d', [NAN]) * len(good))
+            continue
+        raw = [row[column] for row in good]
+        try:
+            values = array('d', map(float, raw))
+            if min(values, default=0.0) < 0:
+                values = array('d', [NAN if value < 0 else value for value in values])
+        except ValueError:
+            values = array('d', map(_float, raw))
+        result.append(values)
+
+    ordered = all(times[i] <= times[i + 1] for i in range(len(times) - 1))
+    first = times[0] if times else 0.0
+    last = times[-1] if times else 0.0
+    return first, last, ordered, skipped, times.tobytes(), [values.tobytes() for values in result]
+
+
+###############################################################################
+def ingest(paths, workers=None, chunk=CHUNK):
+    '''Import all log files in paths (see discover) with workers processes (default the
+       number of cores). Returns a Dataset in time order.'''
+    from concurrent.futures import ProcessPoolExecutor
+
+    filenames = discover(paths)
+    jobs = [job for filename in filenames for job in chunks(filename, chunk)]
+    dataset = Dataset()
+    dataset.files = len(filenames)
+    if not jobs:
+        return dataset
+    if workers == 1:
+        parts = list(map(parse_chunk, jobs))
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(parse_chunk, jobs, chunksize=max(1, len(jobs) // 64)))
+
+    parts = [part for part in parts if part[4]]
+    parts.sort(key=lambda part: part[0])
+    ordered = all(part[2] for part in parts) and all(
+        parts[i][1] <= parts[i + 1][0] for i in range(len(parts) - 1))
+    names = ('time',) + dataset.fields
+    for part in parts:
+        dataset.skipped += part[3]
+        dataset.columns['time'].frombytes(part[4])
+        for name, data in zip(dataset.fields, part[5]):
+            dataset.columns[name].frombytes(data)
+
+    if not ordered:
+        times = dataset.columns['time']
+        order = sorted(range(len(times)), key=times.__getitem__)
+        for name in names:
+            column = dataset.columns[name]
+            dataset.columns[name] = array('d', [column[i] for i in order])
+    return dataset
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='bulk import of ups_log_*.csv files')
+    parser.add_argument('paths', nargs='+', help='files, directories or glob patterns')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, default all cores')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    dataset = ingest(args.paths, args.workers)
+    elapsed = time.perf_counter() - start
+    print('files', dataset.files, 'rows', len(dataset), 'skipped', dataset.skipped)
+    if len(dataset):
+        times = dataset.columns['time']
+        print('from', time.ctime(times[0]), 'to', time.ctime(times[-1]))
+    print('%.2f s, %.0f rows/s' % (elapsed, len(dataset) / elapsed if elapsed else 0))
@@ -0,0 +1,242 @@
+###############################################################################
+#
+#   Instrumentation of the commands to the APC SMART-UPS
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, timing of every exchange in process_command,
+#             retries and parse outcome of every method call
+#           - the Prometheus histograms are cumulative since the start, the
+#             rolling window stays in snapshot(); the attempt counter only
+#             runs inside a wrapped method call
+#           - the attempt counter is per thread; a recorded port is asked for
+#             in_waiting once, first_byte is then not measured
+#
+###############################################################################
+#   Usage
+#
+#   ups = APC('COM5')
+#   instrument = Instrumentation(log=open('commands.jsonl', 'a'))
+#   instrument.attach(ups)
+#   ...
+#   print(instrument.snapshot())        # dict with counters and histograms
+#   print(instrument.prometheus())      # text format for a metrics scraper
+#
+#   Without attach() process_command only checks that ups.hooks is None.
+#
+#   command events  kind, time, command, written, read, first_byte, latency,
+#                   attempt, result (ok, write_error, no_answer, blocked)
+#   parse events    kind, time, field, value, ok, attempts, latency
+#
+###############################################################################
+import bisect                       # for the histogram buckets
+import collections                  # for the rolling window
+import json                         # for the structured log
+import time                         # for the parse timing
+
+from APC_SMART_UPS import FIELDS
+
+
+# methods that are wrapped to see retries and the parse outcome
+CONTROLS = (
+    'set_ups_to_smart_mode',
+    'return_to_simple_mode',
+    'test_lights_and_beeper',
+    'turn_off_after_delay',
+    'shut_down_ups_on_battery',
+    'simulate_power_failure',
+    'battery_test',
+    'turn_off_ups',
+    'shut_down_with_delayed_wake_up',
+    'abort_shutdown',
+    'run_time_calibration',
+    'ups_to_bypass',
+    'turn_ups_on',
+    )
+
+# bucket upper bounds in seconds, the UPS answers in tens to hundreds of milliseconds
+BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0, 10.0)
+
+
+###############################################################################
+class RollingHistogram:
+
+    def __init__(self, window=1000, bounds=BOUNDS):
+        '''Histogram over the last window values. Adding a value is O(1), the oldest value is
+           taken out of its bucket when it leaves the window. all_counts and all_total cover
+           every value since the start and never go down.'''
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.all_counts = [0] * (len(bounds) + 1)
+        self.values = collections.deque(maxlen=window)
+        self.total = 0.0
+        self.all_total = 0.0
+        self.count = 0
+
+    def add(self, value):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            self.counts[bisect.bisect_left(self.bounds, old)] -= 1
+            self.total -= old
+        self.values.append(value)
+        bucket = bisect.bisect_left(self.bounds, value)
+        self.counts[bucket] += 1
+        self.all_counts[bucket] += 1
+        self.total += value
+        self.all_total += value
+        self.count += 1
+
+    def percentile(self, p):
+        '''Upper bound of the bucket that holds percentile p (0..100), None when empty.'''
+        size = len(self.values)
+        if size == 0:
+            return None
+        rank = p / 100.0 * size
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                if index < len(self.bounds):
+                    return self.bounds[index]
+                return float('inf')
+        return float('inf')
+
+    def summary(self):
+        size = len(self.values)
+        return {
+            'count'     : self.count,
+            'window'    : size,
+            'mean'      : self.total / size if size else None,
+            'p50'       : self.percentile(50),
+            'p90'       : self.percentile(90),
+            'p99'       : self.percentile(99),
+            'buckets'   : dict(zip([str(b) for b in self.bounds] + ['inf'], self.counts)),
+            }
+
+
+###############################################################################
+class Instrumentation:
+
+    def __init__(self, callback=None, window=1000, log=None):
+        '''callback is called with every event dict, log is an open text file that gets every
+           event as a line of JSON. window is the number of values kept per histogram.'''
+        self.callback = callback
+        self.window = window
+        self.log = log
+        self.latency = {}               # command -> RollingHistogram
+        self.first_byte = {}            # command -> RollingHistogram
+        self.results = collections.Counter()        # (command, result) -> count
+        self.parse = collections.Counter()          # (field, ok) -> count
+        self.retries = collections.Counter()        # field -> extra attempts
+        self.wrapped = {}
+
+    def attach(self, ups):
+        '''Start reporting on ups.'''
+        if ups.hooks is None:
+            ups.hooks = []
+        ups.hooks.append(self.on_command)
+        for name in FIELDS + CONTROLS:
+            self.wrapped[name] = getattr(ups, name)
+            setattr(ups, name, self._wrap(ups, name, self.wrapped[name]))
+
+    def detach(self, ups):
+        '''Stop reporting on ups, process_command is back to the plain exchange.'''
+        for name in self.wrapped:
+            delattr(ups, name)
+        self.wrapped = {}
+        if ups.hooks is not None and self.on_command in ups.hooks:
+            ups.hooks.remove(self.on_command)
+            if not ups.hooks:
+                ups.hooks = None
+
+    def _wrap(self, ups, name, method):
+        def wrapper(*args, **kwargs):
+            ups.local.attempt = 0
+            start = time.perf_counter()
+            try:
+                value = method(*args, **kwargs)
+                attempts = ups.local.attempt
+            finally:
+                ups.local.attempt = None
+            self.on_parse(name, value, attempts, time.perf_counter() - start)
+            return value
+        wrapper.__name__ = name
+        wrapper.__doc__ = method.__doc__
+        return wrapper
+
+    def _emit(self, event):
+        if self.log is not None:
+            self.log.write(json.dumps(event) + '\n')
+        if self.callback is not None:
+            self.callback(event)
+
+    def on_command(self, event):
+        '''Hook for APC.hooks, called for every exchange.'''
+        event['kind'] = 'command'
+        command = event['command']
+        if command not in self.latency:
+            self.latency[command] = RollingHistogram(self.window)
+            self.first_byte[command] = RollingHistogram(self.window)
+        self.latency[command].add(event['latency'])
+        if event['first_byte'] is not None:
+            self.first_byte[command].add(event['first_byte'])
+        self.results[(command, event['result'])] += 1
+        self._emit(event)
+
+    def on_parse(self, field, value, attempts, latency):
+        '''Called after every wrapped method call.'''
+        ok = not (isinstance(value, (int, float)) and value < 0)
+        self.parse[(field, ok)] += 1
+        if attempts > 1:
+            self.retries[field] += attempts - 1
+        self._emit({
+            'kind'      : 'parse',
+            'time'      : time.time(),
+            'field'     : field,
+            'value'     : value,
+            'ok'        : ok,
+            'attempts'  : attempts,
+            'latency'   : latency,
+            })
+
+    ###########################################################################
+
+    def snapshot(self):
+        '''All counters and histogram summaries as one dict.'''
+        return {
+            'latency'       : {c: h.summary() for c, h in self.latency.items()},
+            'first_byte'    : {c: h.summary() for c, h in self.first_byte.items()},
+            'results'       : {'%s:%s' % k: v for k, v in self.results.items()},
+            'parse'         : {'%s:%s' % (f, 'ok' if ok else 'error'): v for (f, ok), v in self.parse.items()},
+            'retries'       : dict(self.retries),
+            }
+
+    def prometheus(self, prefix='apc_ups'):
+        '''Counters and histograms in the Prometheus text format. The histograms count every
+           exchange since the start, as Prometheus expects; the window is in snapshot().'''
+        lines = []
+        for name, histograms in (('latency', self.latency), ('first_byte', self.first_byte)):
+            metric = '%s_command_%s_seconds' % (prefix, name)
+            lines.append('# TYPE %s histogram' % metric)
+            for command, histogram in sorted(histograms.items()):
+                label = 'command="%s"' % ('%02x' % ord(command) if command else '')
+                cumulative = 0
+                for bound, count in zip(list(histogram.bounds) + ['+Inf'], histogram.all_counts):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (metric, label, bound, cumulative))
+                lines.append('%s_sum{%s} %f' % (metric, label, histogram.all_total))
+                lines.append('%s_count{%s} %d' % (metric, label, histogram.count))
+        metric = '%s_commands_total' % prefix
+        lines.append('# TYPE %s counter' % metric)
+        for (command, result), count in sorted(self.results.items()):
+            lines.append('%s{command="%02x",result="%s"} %d' % (metric, ord(command) if command else 0, result, count))
+        metric = '%s_parse_total' % prefix
+        lines.append('# TYPE %s counter' % metric)
+        for (field, ok), count in sorted(self.parse.items()):
+            lines.append('%s{field="%s",ok="%s"} %d' % (metric, field, str(ok).lower(), count))
+        metric = '%s_retries_total' % prefix
+        lines.append('# TYPE %s counter' % metric)
+        for field, count in sorted(self.retries.items()):
+            lines.append('%s{field="%s"} %d' % (metric, field, count))
+        return '\n'.join(lines) + '\n'
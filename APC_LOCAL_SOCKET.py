@@ -0,0 +1,101 @@
+###############################################################################
+#
+#   Local socket to share cached UPS values between processes
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, a process that owns the serial port serves its
+#             latest values, short lived scripts ask for them instead of
+#             opening the port themselves
+#
+###############################################################################
+#   Protocol
+#
+#   One request per connection, both directions are a single line of JSON.
+#   request : {"fields": ["battery_capacity", "ups_status"]}
+#   answer  : {"time": 1760000000.0, "values": {"battery_capacity": 100.0, ...}}
+#   Unknown fields are left out of the answer. An empty field list returns
+#   all cached values.
+#
+###############################################################################
+import json                         # for the request and answer lines
+import socket                       # for the local connection
+
+
+DEFAULT_ADDRESS = ('127.0.0.1', 47310)
+
+
+###############################################################################
+def query(fields, address=DEFAULT_ADDRESS, timeout=0.5):
+    '''Ask a running daemon for cached values. Returns the answer dict, or None when no
+       daemon is listening or the answer is not usable.'''
+    try:
+        with socket.create_connection(address, timeout=timeout) as conn:
+            conn.sendall(json.dumps({'fields': list(fields)}).encode() + b'\n')
+            data = b''
+            while not data.endswith(b'\n'):
+                chunk = conn.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+    except OSError:
+        return None
+    try:
+        answer = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(answer, dict) or 'values' not in answer:
+        return None
+    return answer
+
+
+###############################################################################
+class CacheServer:
+
+    def __init__(self, snapshot, address=DEFAULT_ADDRESS):
+        '''Init of the server. snapshot is a function returning (time, dict of values) of the
+           latest sample, it is called for every request and must not talk to the UPS.'''
+        self.snapshot = snapshot
+        self.address = address
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        '''Start serving in a background thread. Returns False when the address is in use.'''
+        import socketserver             # only needed by the process that serves
+        import threading
+
+        snapshot = self.snapshot
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline(4096))
+                    fields = request.get('fields', [])
+                except (ValueError, AttributeError):
+                    fields = []
+                stamp, values = snapshot()
+                if fields:
+                    values = {k: values[k] for k in fields if k in values}
+                self.wfile.write(json.dumps({'time': stamp, 'values': values}).encode() + b'\n')
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        try:
+            self.server = Server(self.address, Handler)
+        except OSError:
+            return False
+        self.address = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        '''Stop serving and close the socket.'''
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,327 @@
+###############################################################################
+#
+#   Pipeline from the sampling loop to the outputs, with bounded queues
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, acquire -> stages -> sinks, one thread per sink,
+#             block, drop, drop oldest and coalesce policies per queue
+#
+###############################################################################
+#   How it works
+#
+#   acquire     the sampling loop calls put(), or run() samples a source on
+#               a FixedRateScheduler; put() never blocks, when the input
+#               queue is full the oldest sample is dropped
+#   stages      functions f(sample) that decode or enrich sample.values in
+#               place, in one worker thread; a stage returns False to drop
+#               the sample
+#   sinks       every sink has its own bounded queue and thread, a slow sink
+#               only fills its own queue
+#
+#   Policies of a sink queue when it is full:
+#
+#   block       wait for room, the stages wait too (the input queue still
+#               drops, the sampling loop is never held up)
+#   drop        the new sample is dropped
+#   drop_oldest the oldest queued sample is dropped
+#   coalesce    the newest queued sample is replaced, the sink gets the
+#               latest state as soon as it catches up (displays, metrics)
+#
+#   pipeline = Pipeline()
+#   pipeline.add_sink('csv', CsvSink('ups_log.csv'), policy=BLOCK)
+#   pipeline.add_sink('sqlite', store_sink(SqliteStore('ups.sqlite').add), policy=DROP_OLDEST)
+#   pipeline.add_sink('print', print_sink, capacity=1, policy=COALESCE)
+#   pipeline.start()
+#   for tick in scheduler:
+#       pipeline.put(ups.sample(), tick.stamp)
+#
+###############################################################################
+import collections                  # for the queues
+import threading                    # one thread per sink
+import time                         # for the timestamps
+from datetime import datetime
+
+from APC_SMART_UPS import LOG_COLUMNS
+from APC_SMART_UPS import LOG_FIELDS
+
+
+BLOCK       = 'block'
+DROP        = 'drop'
+DROP_OLDEST = 'drop_oldest'
+COALESCE    = 'coalesce'
+
+
+###############################################################################
+class Sample:
+
+    __slots__ = ('number', 'stamp', 'values')
+
+    def __init__(self, number, stamp, values):
+        self.number = number            # sample counter since the start
+        self.stamp = stamp              # time.time() of the sample
+        self.values = values            # dict like APC.sample() returns
+
+
+class Channel:
+
+    def __init__(self, capacity, policy=BLOCK):
+        '''Bounded queue between two threads.'''
+        self.capacity = max(1, capacity)
+        self.policy = policy
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+        self.high_water = 0
+
+    def put(self, item):
+        '''Queue item following the policy. Returns False when an item was dropped.'''
+        with self.condition:
+            if self.closed:
+                return False
+            kept = True
+            if len(self.items) >= self.capacity:
+                if self.policy == BLOCK:
+                    while len(self.items) >= self.capacity and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        return False
+                elif self.policy == DROP:
+                    self.dropped += 1
+                    return False
+                elif self.policy == COALESCE:
+                    self.items[-1] = item
+                    self.dropped += 1
+                    return False
+                else:
+                    self.items.popleft()
+                    self.dropped += 1
+                    kept = False
+            self.items.append(item)
+            self.high_water = max(self.high_water, len(self.items))
+            self.condition.notify_all()
+            return kept
+
+    def get(self):
+        '''Next item, None when the channel is closed and empty.'''
+        with self.condition:
+            while not self.items and not self.closed:
+                self.condition.wait()
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        '''No more items, get() returns the queued items and then None.'''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Sink:
+
+    def __init__(self, name, function, capacity, policy, close):
+        self.name = name
+        self.function = function
+        self.close = close
+        self.channel = Channel(capacity, policy)
+        self.thread = None
+        self.delivered = 0
+        self.errors = 0
+        self.last_error = ''
+        self.max_lag = 0.0              # seconds from sampling to delivery
+
+    def work(self):
+        while True:
+            sample = self.channel.get()
+            if sample is None:
+                break
+            try:
+                self.function(sample)
+                self.delivered += 1
+            except Exception as error:      # a broken sink must not stop the others
+                self.errors += 1
+                self.last_error = repr(error)
+            self.max_lag = max(self.max_lag, time.time() - sample.stamp)
+        if self.close is not None:
+            self.close()
+
+
+###############################################################################
+class Pipeline:
+
+    def __init__(self, stages=(), capacity=64):
+        '''stages are functions f(sample) run in order on every sample, capacity is the size of
+           the input queue.'''
+        self.stages = list(stages)
+        self.input = Channel(capacity, DROP_OLDEST)
+        self.sinks = []
+        self.number = 0
+        self.worker = None
+        self.sampler = None
+        self.running = False
+        self.dropped_by_stages = 0
+
+    def add_sink(self, name, function, capacity=64, policy=BLOCK, close=None):
+        '''Add an output, function(sample) is called from its own thread. close is called once
+           when the pipeline stops, default is the close method of function when it has one.'''
+        if close is None:
+            close = getattr(function, 'close', None)
+        sink = Sink(name, function, capacity, policy, close)
+        self.sinks.append(sink)
+        if self.worker is not None:
+            self._start_sink(sink)
+        return sink
+
+    def _start_sink(self, sink):
+        sink.thread = threading.Thread(target=sink.work, name='sink ' + sink.name, daemon=True)
+        sink.thread.start()
+
+    def put(self, values, stamp=None):
+        '''Hand over one sample from the sampling loop. Never blocks.'''
+        if stamp is None:
+            stamp = time.time()
+        sample = Sample(self.number, stamp, values)
+        self.number += 1
+        return self.input.put(sample)
+
+    def _work(self):
+        while True:
+            sample = self.input.get()
+            if sample is None:
+                break
+            keep = True
+            for stage in self.stages:
+                if stage(sample) is False:
+                    keep = False
+                    break
+            if not keep:
+                self.dropped_by_stages += 1
+                continue
+            for sink in self.sinks:
+                sink.channel.put(sample)
+        for sink in self.sinks:
+            sink.channel.close()
+
+    def start(self):
+        '''Start the stage and sink threads.'''
+        for sink in self.sinks:
+            self._start_sink(sink)
+        self.worker = threading.Thread(target=self._work, name='stages', daemon=True)
+        self.worker.start()
+
+    def run(self, source, period):
+        '''Sample source() every period seconds in a thread of its own, source returns a dict
+           like APC.sample(). Starts the pipeline when needed.'''
+        from APC_SCHEDULER import FixedRateScheduler
+
+        if self.worker is None:
+            self.start()
+        self.running = True
+        scheduler = FixedRateScheduler(period)
+
+        def sample():
+            for tick in scheduler:
+                if not self.running:
+                    break
+                self.put(source(), tick.stamp)
+
+        self.sampler = threading.Thread(target=sample, name='sampler', daemon=True)
+        self.sampler.start()
+
+    def stop(self, timeout=None):
+        '''Stop sampling, deliver what is queued and stop all threads.'''
+        self.running = False
+        if self.sampler is not None:
+            self.sampler.join(timeout)
+        self.input.close()
+        if self.worker is not None:
+            self.worker.join(timeout)
+        for sink in self.sinks:
+            if sink.thread is not None:
+                sink.thread.join(timeout)
+
+    def stats(self):
+        '''Counters of the input queue and every sink.'''
+        result = {
+            'samples'   : self.number,
+            'input'     : {'queued': len(self.input), 'dropped': self.input.dropped,
+                           'high_water': self.input.high_water},
+            'stages'    : {'dropped': self.dropped_by_stages},
+            }
+        for sink in self.sinks:
+            result[sink.name] = {
+                'queued'        : len(sink.channel),
+                'delivered'     : sink.delivered,
+                'dropped'       : sink.channel.dropped,
+                'errors'        : sink.errors,
+                'last_error'    : sink.last_error,
+                'high_water'    : sink.channel.high_water,
+                'max_lag'       : sink.max_lag,
+                }
+        return result
+
+
+###############################################################################
+#   stages and sinks
+
+def drop_errors(sample):
+    '''Stage, the -1/-2 error answers become None.'''
+    values = sample.values
+    for field, value in values.items():
+        if value is not None and value < 0:
+            values[field] = None
+
+
+def store_sink(method):
+    '''Sink for the stores of this project, method(values, stamp), for example
+       SqliteStore.add, RollupStore.add, History.add or SnapshotWriter.publish.'''
+    return lambda sample: method(sample.values, sample.stamp)
+
+
+def csv_header(fields=LOG_FIELDS):
+    '''Header line of battery_calibration_log_to_csv.py.'''
+    names = dict(zip(LOG_FIELDS, LOG_COLUMNS))
+    return 'counter,date,time,' + ''.join(names.get(field, field) + ',' for field in fields)
+
+
+def csv_line(sample, fields=LOG_FIELDS):
+    '''Data line of battery_calibration_log_to_csv.py for sample.'''
+    stamp = datetime.fromtimestamp(sample.stamp)
+    line = '%d,%s,%s,' % (sample.number, stamp.date(), str(stamp.time()).split('.')[0])
+    return line + ''.join(str(sample.values.get(field)) + ',' for field in fields)
+
+
+class CsvSink:
+
+    def __init__(self, filename, fields=LOG_FIELDS, flush=1):
+        '''Sink writing the csv format of battery_calibration_log_to_csv.py, the file stays
+           open and is flushed every flush lines. The header is written to a new file.'''
+        self.fields = tuple(fields)
+        self.flush_lines = flush
+        self.lines = 0
+        self.file = open(filename, 'a')
+        if self.file.tell() == 0:
+            self.file.write(csv_header(self.fields) + '\n')
+            self.file.flush()
+
+    def __call__(self, sample):
+        self.file.write(csv_line(sample, self.fields) + '\n')
+        self.lines += 1
+        if self.lines % self.flush_lines == 0:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def print_sink(sample):
+    '''Sink printing the csv line of sample.'''
+    print(csv_line(sample))
@@ -0,0 +1,261 @@
+###############################################################################
+#
+#   Power quality events from the line voltage and frequency of the UPS
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, sags, swells, frequency excursions, transfers
+#             and unacceptable line quality
+#           - an outage is only an outage, the sag before it ends when the
+#             outage starts
+#
+###############################################################################
+#   How it works
+#
+#   Regular samples of line_voltage (L) and ups_and_utility_operating_frequency
+#   (F) give events with a start and end at poll resolution. Between two polls
+#   the UPS itself keeps the highest and lowest line voltage, maximum_line_voltage
+#   (M) and minimum_line_voltage (N) return those and restart the interval. A
+#   sag or swell that is shorter than the poll interval only shows up there, it
+#   is reported as an event between the two polls with source 'interval'.
+#
+#   transfer_cause (G) reports a transfer when its answer changes, the same
+#   cause twice in a row can not be seen. acceptable_line_quality (9) opens an
+#   event while the UPS reports unacceptable line quality.
+#
+#   Reading M and N restarts the interval of the UPS, so only one reader of
+#   these two should exist.
+#
+###############################################################################
+import time                         # for the timestamps
+
+
+# fields that sample() reads
+PQ_FIELDS = (
+    'line_voltage',
+    'ups_and_utility_operating_frequency',
+    'maximum_line_voltage',
+    'minimum_line_voltage',
+    'transfer_cause',
+    'acceptable_line_quality',
+    )
+
+TRANSFER_CAUSES = {
+    0   : 'none',
+    1   : 'voltage rate of change',
+    2   : 'high line voltage',
+    3   : 'low line voltage',
+    4   : 'line voltage notch or spike',
+    5   : 'command or self test',
+    }
+
+MINOR       = 'minor'
+MAJOR       = 'major'
+CRITICAL    = 'critical'
+
+
+###############################################################################
+def valid(values, field):
+    '''Value of field, None when it is missing or one of the -1/-2 error answers.'''
+    value = values.get(field)
+    if value is None or value < 0:
+        return None
+    return value
+
+
+class PowerQualityEvent:
+
+    def __init__(self, kind, start, extreme, source):
+        self.kind = kind                # sag, swell, outage, frequency_low, frequency_high, transfer, line_quality
+        self.start = start
+        self.end = None                 # None while the event is open
+        self.extreme = extreme          # lowest or highest value seen
+        self.severity = MINOR
+        self.source = source            # sample, interval or ups
+        self.detail = ''
+
+    def duration(self):
+        if self.end is None:
+            return None
+        return self.end - self.start
+
+    def as_dict(self):
+        return {
+            'kind'      : self.kind,
+            'start'     : self.start,
+            'end'       : self.end,
+            'extreme'   : self.extreme,
+            'severity'  : self.severity,
+            'source'    : self.source,
+            'detail'    : self.detail,
+            }
+
+    def __repr__(self):
+        return 'PowerQualityEvent(%s %s %s..%s %s)' % (self.kind, self.severity, self.start, self.end, self.extreme)
+
+
+class PowerQualityDetector:
+
+    def __init__(self, nominal_voltage=230.0, nominal_frequency=50.0, sag=0.90, swell=1.10,
+                 outage=0.50, frequency_tolerance=1.0, callback=None):
+        '''Init of the detector. sag, swell and outage are fractions of the nominal voltage,
+           frequency_tolerance is the allowed deviation in Hz. callback is called with every
+           event that is closed.'''
+        self.nominal_voltage = nominal_voltage
+        self.nominal_frequency = nominal_frequency
+        self.sag = sag
+        self.swell = swell
+        self.outage = outage
+        self.frequency_tolerance = frequency_tolerance
+        self.callback = callback
+        self.open = {}                  # kind -> open PowerQualityEvent
+        self.previous = None            # time of the previous update
+        self.transfer_cause = None
+        self.events = 0
+
+    ###########################################################################
+
+    def _voltage_kind(self, voltage):
+        ratio = voltage / self.nominal_voltage
+        if ratio < self.outage:
+            return 'outage'
+        if ratio < self.sag:
+            return 'sag'
+        if ratio > self.swell:
+            return 'swell'
+        return None
+
+    def _severity(self, kind, extreme):
+        if kind in ('sag', 'swell'):
+            deviation = abs(extreme / self.nominal_voltage - 1.0)
+            band = (1.0 - self.sag) if kind == 'sag' else (self.swell - 1.0)
+            if deviation >= 3 * band:
+                return CRITICAL
+            if deviation >= 2 * band:
+                return MAJOR
+            return MINOR
+        if kind in ('frequency_low', 'frequency_high'):
+            deviation = abs(extreme - self.nominal_frequency)
+            if deviation >= 3 * self.frequency_tolerance:
+                return CRITICAL
+            if deviation >= 2 * self.frequency_tolerance:
+                return MAJOR
+            return MINOR
+        if kind == 'outage':
+            return CRITICAL
+        return MAJOR
+
+    def _track(self, kind, active, stamp, value, low, closed):
+        '''Open, extend or close the event of kind from a regular sample.'''
+        event = self.open.get(kind)
+        if active:
+            if event is None:
+                event = self.open[kind] = PowerQualityEvent(kind, stamp, value, 'sample')
+            elif value is not None and ((low and value < event.extreme) or (not low and value > event.extreme)):
+                event.extreme = value
+            if value is not None:
+                event.severity = self._severity(kind, event.extreme)
+        elif event is not None:
+            event.end = stamp
+            del self.open[kind]
+            closed.append(event)
+
+    def _interval(self, kind, start, end, value, low, closed, continuing):
+        '''Extreme of the UPS between two polls. An open event of the same kind gets the new
+           extreme. Otherwise it is a short event that fell between the polls, unless this
+           sample is outside the limits too (continuing); the event the sample opens covers it.'''
+        if low:
+            event = self.open.get('outage') or self.open.get('sag')
+        else:
+            event = self.open.get('swell')
+        if event is not None:
+            if (low and value < event.extreme) or (not low and value > event.extreme):
+                event.extreme = value
+                event.severity = self._severity(event.kind, value)
+            return
+        if continuing:
+            return
+        event = PowerQualityEvent(kind, start, value, 'interval')
+        event.end = end
+        event.severity = self._severity(kind, value)
+        closed.append(event)
+
+    def update(self, values, stamp=None):
+        '''Feed one sample, values is a dict with (some of) PQ_FIELDS as APC.sample() returns.
+           Returns the list of events closed by this sample.'''
+        if stamp is None:
+            stamp = time.time()
+        closed = []
+        voltage = valid(values, 'line_voltage')
+        frequency = valid(values, 'ups_and_utility_operating_frequency')
+        maximum = valid(values, 'maximum_line_voltage')
+        minimum = valid(values, 'minimum_line_voltage')
+        cause = valid(values, 'transfer_cause')
+        quality = valid(values, 'acceptable_line_quality')
+
+        now = self._voltage_kind(voltage) if voltage is not None else None
+        if self.previous is not None:
+            # extremes of the UPS since the previous poll, before this sample closes anything
+            if minimum is not None:
+                kind = self._voltage_kind(minimum)
+                if kind in ('sag', 'outage'):
+                    self._interval(kind, self.previous, stamp, minimum, True, closed,
+                                   now in ('sag', 'outage'))
+            if maximum is not None and self._voltage_kind(maximum) == 'swell':
+                self._interval('swell', self.previous, stamp, maximum, False, closed, now == 'swell')
+
+        if voltage is not None:
+            opened = now is not None and now not in self.open
+            self._track('outage', now == 'outage', stamp, voltage, True, closed)
+            self._track('sag', now == 'sag', stamp, voltage, True, closed)
+            self._track('swell', now == 'swell', stamp, voltage, False, closed)
+            if opened and self.previous is not None:
+                # the event started between the polls, the UPS saw its extreme
+                event = self.open[now]
+                extreme = maximum if now == 'swell' else minimum
+                if extreme is not None and (extreme > event.extreme if now == 'swell' else extreme < event.extreme):
+                    event.extreme = extreme
+                    event.severity = self._severity(now, extreme)
+
+        if frequency is not None:
+            low = frequency < self.nominal_frequency - self.frequency_tolerance
+            high = frequency > self.nominal_frequency + self.frequency_tolerance
+            self._track('frequency_low', low, stamp, frequency, True, closed)
+            self._track('frequency_high', high, stamp, frequency, False, closed)
+
+        if cause is not None:
+            if self.transfer_cause is not None and cause != self.transfer_cause and cause != 0:
+                event = PowerQualityEvent('transfer', self.previous or stamp, cause, 'ups')
+                event.end = stamp
+                event.severity = MINOR if cause == 5 else MAJOR
+                event.detail = TRANSFER_CAUSES.get(cause, 'unknown')
+                closed.append(event)
+            self.transfer_cause = cause
+
+        if quality is not None:
+            self._track('line_quality', quality == 1, stamp, None, True, closed)
+
+        self.previous = stamp
+        self.events += len(closed)
+        if self.callback is not None:
+            for event in closed:
+                self.callback(event)
+        return closed
+
+    def sample(self, ups, debug=False):
+        '''Read PQ_FIELDS from ups and feed them, returns the closed events.'''
+        return self.update(ups.sample(PQ_FIELDS, debug))
+
+    def flush(self, stamp=None):
+        '''Close all open events, for example at shutdown. Returns them.'''
+        if stamp is None:
+            stamp = time.time()
+        closed = list(self.open.values())
+        for event in closed:
+            event.end = stamp
+        self.open = {}
+        if self.callback is not None:
+            for event in closed:
+                self.callback(event)
+        return closed
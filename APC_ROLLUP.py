@@ -0,0 +1,287 @@
+###############################################################################
+#
+#   Multi-resolution rollup store for years of UPS history (RRD style)
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, raw, 1 minute, 1 hour and 1 day archives with
+#             min/avg/max per field and a fixed footprint on disk
+#           - queries only use archives that still hold the start of the range
+#           - the open segments and the buckets being filled are written every
+#             flush_every seconds, a crash loses at most that much
+#
+###############################################################################
+#   Layout on disk
+#
+#   <path>/meta.json                fields and archives of the store
+#   <path>/<step>/<slot>.z          closed segment, zlib compressed rows
+#   <path>/<step>/open              rows of the segment that is being filled,
+#                                   then the bucket being filled
+#
+#   Every archive has step seconds per row and keeps rows rows. The rows are
+#   grouped in segments of SEGMENT rows, segment n is stored in slot
+#   n % slots, so an archive never has more than slots files and old data is
+#   overwritten in place, like a round robin database.
+#
+#   row     '<d' bucket start, then per field '<fffI' min, avg, max, count
+#   segment '<4sQIdd' magic, segment number, number of rows, first and last
+#           bucket start, then the rows
+#   bucket  '<d' bucket start, then per field '<dddI' min, sum, max, count
+#
+#   All archives are fed by the same samples, so the 1 day minimum is the
+#   real minimum and not a minimum of averages. add() writes the open
+#   segments every flush_every seconds, with the buckets being filled, so a
+#   day bucket survives a restart of the logger.
+#
+###############################################################################
+import json                         # for the meta file
+import math                         # for NaN
+import os                           # for the directories
+import struct                       # for the rows
+import time                         # for the timestamps
+import zlib                         # for the closed segments
+
+from APC_SMART_UPS import LOG_FIELDS
+
+
+# (seconds per row, rows kept)
+ARCHIVES = (
+    (1,         6 * 3600),          # raw samples, 6 hours
+    (60,        90 * 1440),         # 1 minute, 90 days
+    (3600,      5 * 366 * 24),      # 1 hour, 5 years
+    (86400,     20 * 366),          # 1 day, 20 years
+    )
+
+SEGMENT = 1440
+MAGIC = b'APCR'
+HEADER = struct.Struct('<4sQIdd')
+NAN = float('nan')
+
+
+###############################################################################
+class Archive:
+
+    def __init__(self, path, step, rows, fields):
+        self.path = path
+        self.step = step
+        self.rows = rows
+        self.fields = fields
+        self.row = struct.Struct('<d' + 'fffI' * len(fields))
+        self.pending = struct.Struct('<d' + 'dddI' * len(fields))
+        self.slots = (rows + SEGMENT - 1) // SEGMENT + 1
+        self.segment = 0                # number of the open segment
+        self.open_rows = []             # packed rows of the open segment
+        self.bucket = None              # start of the bucket being filled
+        self.closed = -math.inf         # start of the last stored row
+        self.low = [math.inf] * len(fields)
+        self.high = [-math.inf] * len(fields)
+        self.sum = [0.0] * len(fields)
+        self.count = [0] * len(fields)
+        os.makedirs(path, exist_ok=True)
+        self._load_open()
+
+    def _load_open(self):
+        '''Pick up the open segment after a restart.'''
+        name = os.path.join(self.path, 'open')
+        if not os.path.exists(name):
+            return
+        with open(name, 'rb') as f:
+            data = f.read()
+        magic, segment, count, first, last = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            return
+        self.segment = segment
+        offset = HEADER.size
+        for _ in range(count):
+            self.open_rows.append(data[offset:offset + self.row.size])
+            offset += self.row.size
+        if self.open_rows:
+            self.closed = self.row.unpack(self.open_rows[-1])[0]
+        if len(data) - offset == self.pending.size:
+            items = self.pending.unpack_from(data, offset)
+            if items[0] > self.closed:
+                self.bucket = items[0]
+                self.low = list(items[1::4])
+                self.sum = list(items[2::4])
+                self.high = list(items[3::4])
+                self.count = list(items[4::4])
+
+    def add(self, stamp, values):
+        '''Add one sample, values is a list in the order of fields, None or negative is skipped.'''
+        bucket = stamp - stamp % self.step
+        if bucket <= self.closed or (self.bucket is not None and bucket < self.bucket):
+            return                      # already stored, or the clock went back
+        if bucket != self.bucket:
+            self._close_bucket()
+            self.bucket = bucket
+        for index, value in enumerate(values):
+            if value is None or value < 0:
+                continue
+            if value < self.low[index]:
+                self.low[index] = value
+            if value > self.high[index]:
+                self.high[index] = value
+            self.sum[index] += value
+            self.count[index] += 1
+
+    def _close_bucket(self):
+        '''Turn the bucket being filled into a row.'''
+        if self.bucket is None or not any(self.count):
+            return
+        items = [self.bucket]
+        for index in range(len(self.fields)):
+            count = self.count[index]
+            if count:
+                items += [self.low[index], self.sum[index] / count, self.high[index], count]
+            else:
+                items += [NAN, NAN, NAN, 0]
+            self.low[index] = math.inf
+            self.high[index] = -math.inf
+            self.sum[index] = 0.0
+            self.count[index] = 0
+        self.open_rows.append(self.row.pack(*items))
+        self.closed = self.bucket
+        if len(self.open_rows) >= SEGMENT:
+            self._close_segment()
+
+    def _write(self, name, data):
+        temp = name + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, name)
+
+    def _header(self):
+        first = last = 0.0
+        if self.open_rows:
+            first = self.row.unpack(self.open_rows[0])[0]
+            last = self.row.unpack(self.open_rows[-1])[0]
+        return HEADER.pack(MAGIC, self.segment, len(self.open_rows), first, last)
+
+    def _close_segment(self):
+        '''Compress the full open segment into its slot.'''
+        data = self._header() + zlib.compress(b''.join(self.open_rows), 6)
+        self._write(os.path.join(self.path, '%d.z' % (self.segment % self.slots)), data)
+        self.segment += 1
+        self.open_rows = []
+        self._write_open()
+
+    def _write_open(self):
+        data = self._header() + b''.join(self.open_rows)
+        if self.bucket is not None and self.bucket > self.closed and any(self.count):
+            items = [self.bucket]
+            for index in range(len(self.fields)):
+                items += [self.low[index], self.sum[index], self.high[index], self.count[index]]
+            data += self.pending.pack(*items)
+        self._write(os.path.join(self.path, 'open'), data)
+
+    def flush(self):
+        '''Write the open segment and the bucket being filled.'''
+        self._write_open()
+
+    def _segment_rows(self, segment, start, end):
+        '''Packed rows of a closed segment, empty when the slot holds another segment or the
+           segment is outside start..end, then it is not decompressed.'''
+        name = os.path.join(self.path, '%d.z' % (segment % self.slots))
+        try:
+            with open(name, 'rb') as f:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return b''
+                magic, number, count, first, last = HEADER.unpack(header)
+                if magic != MAGIC or number != segment or last < start or first > end:
+                    return b''
+                return zlib.decompress(f.read())
+        except OSError:
+            return b''
+
+    def query(self, index, start, end):
+        '''Rows of field index between start and end as (bucket start, min, avg, max, count).'''
+        result = []
+        first = max(0, self.segment - self.slots + 1)
+        chunks = [self._segment_rows(segment, start, end) for segment in range(first, self.segment)]
+        chunks.append(b''.join(self.open_rows))
+        offset = 1 + 4 * index
+        for chunk in chunks:
+            for items in self.row.iter_unpack(chunk):
+                if start <= items[0] <= end and items[offset + 3]:
+                    result.append((items[0],) + items[offset:offset + 4])
+        return result
+
+
+###############################################################################
+class RollupStore:
+
+    def __init__(self, path, fields=LOG_FIELDS, archives=ARCHIVES, flush_every=60.0):
+        '''Open or create a store in directory path. fields and archives are taken from the
+           store when it already exists. add() writes the open segments every flush_every
+           seconds, 0 writes them on every sample.'''
+        os.makedirs(path, exist_ok=True)
+        meta = os.path.join(path, 'meta.json')
+        if os.path.exists(meta):
+            with open(meta) as f:
+                stored = json.load(f)
+            fields = stored['fields']
+            archives = [tuple(a) for a in stored['archives']]
+        else:
+            with open(meta, 'w') as f:
+                json.dump({'fields': list(fields), 'archives': [list(a) for a in archives]}, f)
+        self.path = path
+        self.fields = tuple(fields)
+        self.archives = [Archive(os.path.join(path, str(step)), step, rows, self.fields) for step, rows in archives]
+        self.archives.sort(key=lambda archive: archive.step)
+        self.flush_every = flush_every
+        self.flushed = time.monotonic()
+
+    def add(self, values, stamp=None):
+        '''Add one sample, values is a dict like APC.sample() returns.'''
+        if stamp is None:
+            stamp = time.time()
+        row = [values.get(field) for field in self.fields]
+        for archive in self.archives:
+            archive.add(stamp, row)
+        if time.monotonic() - self.flushed >= self.flush_every:
+            self.flush()
+
+    def sample(self, ups, debug=False):
+        '''Read the fields from ups and add them.'''
+        self.add(ups.sample(self.fields, debug))
+
+    def flush(self):
+        '''Write the open segments of all archives, add() does this every flush_every seconds,
+           close() at the end.'''
+        for archive in self.archives:
+            archive.flush()
+        self.flushed = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+    def choose(self, start, end, step=None, points=500):
+        '''The archive for a query. Only archives whose rows reach back to start count, of
+           those the coarsest with rows of at most step seconds, else the finest. Without step
+           the rows are at most (end - start) / points seconds. When no archive reaches back
+           that far the one that reaches back furthest is used.'''
+        if step is None:
+            step = max(1, (end - start) / points)
+        now = max(time.time(), end)
+        reaching = [archive for archive in self.archives if now - archive.step * archive.rows <= start]
+        if not reaching:
+            return max(self.archives, key=lambda archive: archive.step * archive.rows)
+        chosen = reaching[0]
+        for archive in reaching:
+            if archive.step <= step:
+                chosen = archive
+        return chosen
+
+    def query(self, field, start, end=None, step=None, points=500):
+        '''Rows of field between start and end, see choose() for the resolution. Returns
+           (seconds per row, list of (bucket start, min, avg, max, count)).'''
+        if end is None:
+            end = time.time()
+        archive = self.choose(start, end, step, points)
+        return archive.step, archive.query(self.fields.index(field), start, end)
+
+    def footprint(self):
+        '''Largest size on disk in bytes per archive, uncompressed.'''
+        return {archive.step: archive.slots * SEGMENT * archive.row.size for archive in self.archives}
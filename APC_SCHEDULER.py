@@ -0,0 +1,99 @@
+###############################################################################
+#
+#   Fixed rate sampling scheduler
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, ticks on the monotonic clock so the period does
+#             not stretch with slow answers of the UPS
+#
+###############################################################################
+#   Usage
+#
+#   scheduler = FixedRateScheduler(1.0)
+#   for tick in scheduler:
+#       values = ups.sample()
+#       write(tick.datetime, values)
+#
+#   Tick n is due at start + n * period. When a sample takes longer than the
+#   period the ticks that can no longer be made are counted as missed and
+#   skipped, the schedule is never shifted. Every tick carries one wall clock
+#   timestamp, taken when the tick starts, before the first command.
+#
+###############################################################################
+import time                         # for the clocks
+from datetime import datetime
+
+
+###############################################################################
+class Tick:
+
+    def __init__(self, number, due, stamp, late, missed):
+        self.number = number            # tick number since the start, missed ticks included
+        self.due = due                  # monotonic time the tick was due
+        self.stamp = stamp              # wall clock time.time() of the tick
+        self.late = late                # seconds the tick started after it was due
+        self.missed = missed            # ticks skipped right before this one
+
+    @property
+    def datetime(self):
+        '''The wall clock timestamp as datetime, use it for both date and time of a sample.'''
+        return datetime.fromtimestamp(self.stamp)
+
+
+class FixedRateScheduler:
+
+    def __init__(self, period, tolerance=None, clock=time.monotonic, sleep=time.sleep):
+        '''period in seconds. A tick that starts more than tolerance seconds late is counted as
+           an overrun, default is a tenth of the period.'''
+        self.period = period
+        self.tolerance = period / 10.0 if tolerance is None else tolerance
+        self.clock = clock
+        self.sleep = sleep
+        self.start = None
+        self.number = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.missed = 0
+        self.max_late = 0.0
+
+    def wait(self):
+        '''Sleep until the next tick is due and return it.'''
+        now = self.clock()
+        if self.start is None:
+            self.start = now
+        due = self.start + self.number * self.period
+        if now < due:
+            self.sleep(due - now)
+            now = self.clock()
+        late = max(0.0, now - due)
+        missed = 0
+        if late >= self.period:
+            # too late for this tick and maybe more, continue with the last one that was due
+            missed = int(late // self.period)
+            self.number += missed
+            due += missed * self.period
+            late = now - due
+            self.missed += missed
+        if late > self.tolerance or missed:
+            self.overruns += 1
+        self.max_late = max(self.max_late, late)
+        tick = Tick(self.number, due, time.time(), late, missed)
+        self.number += 1
+        self.ticks += 1
+        return tick
+
+    def __iter__(self):
+        while True:
+            yield self.wait()
+
+    def report(self):
+        '''Counters since the start.'''
+        return {
+            'period'    : self.period,
+            'ticks'     : self.ticks,
+            'overruns'  : self.overruns,
+            'missed'    : self.missed,
+            'max_late'  : self.max_late,
+            }
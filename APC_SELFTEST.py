@@ -0,0 +1,256 @@
+###############################################################################
+#
+#   Staggered battery self-test of a fleet of UPSes
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, at most N units on battery at the same time,
+#             results collected inside the 5 minute window of "X", battery
+#             health history with trend per unit
+#
+###############################################################################
+#   How it works
+#
+#   Every unit gets its own thread, the units share a semaphore with
+#   concurrent places. A unit that gets a place checks it is on line with
+#   enough battery capacity, sends "W" and polls the status byte and battery
+#   voltage until the UPS is back on line. Then it reads "X" and gives its
+#   place to the next unit, so never more than concurrent units run on
+#   battery. Units start at least stagger seconds apart.
+#
+#   The UPS keeps the "X" result for 5 minutes only; the result is read as soon
+#   as the test is over and retried until retention - margin seconds after "W".
+#
+#   Every finished test is appended to the health file, one JSON line per test
+#   with the result, the voltage before the test and the lowest voltage during
+#   the test. trend() fits a line through the voltage drop of the latest tests,
+#   a battery that loses more voltage under the same test is wearing out.
+#
+#   fleet = {'rack1': APC('COM5'), 'rack2': APC('tcp://ts1:4001')}
+#   for ups in fleet.values():
+#       ups.serial_open(); ups.set_ups_to_smart_mode()
+#   test = FleetSelfTest(fleet, concurrent=2, health=BatteryHealth('battery_health.jsonl'))
+#   for record in test.run():
+#       print(record['unit'], record['result'], test.health.trend(record['unit'])['status'])
+#
+###############################################################################
+import json                         # for the health file
+import threading                    # one thread per unit
+import time                         # for the timeouts
+
+from APC_SMART_UPS import STATUS_ON_BATTERY
+from APC_SMART_UPS import STATUS_ON_LINE
+
+
+# answers of APC.battery_test_result()
+RESULTS = {
+    0   : 'ok',
+    1   : 'bad battery',
+    2   : 'invalid, overload',
+    3   : 'no result',
+    -1  : 'no answer',
+    -2  : 'unknown answer',
+    }
+
+DONE        = 'done'                # test ran, result collected
+SKIPPED     = 'skipped'             # preconditions not met, no test
+REFUSED     = 'refused'             # the UPS answered NA to "W"
+LOST        = 'lost'                # test ran, no result inside the window
+
+
+###############################################################################
+class BatteryHealth:
+
+    def __init__(self, filename):
+        '''History of the tests in a JSON lines file, loaded when it exists.'''
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.history = {}
+        try:
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.history.setdefault(record['unit'], []).append(record)
+        except OSError:
+            pass
+
+    def add(self, record):
+        with self.lock:
+            self.history.setdefault(record['unit'], []).append(record)
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def records(self, unit):
+        return list(self.history.get(unit, ()))
+
+    def trend(self, unit, window=10, degrade=0.2):
+        '''Health of the battery of unit from its latest window tests. status is 'replace' when
+           the latest test failed, 'degrading' when the fitted voltage drop grew by more than
+           degrade (a fraction) over these tests, 'ok' otherwise and 'unknown' without tests.'''
+        records = [r for r in self.history.get(unit, ()) if r['state'] == DONE][-window:]
+        trend = {'unit': unit, 'tests': len(records), 'failures': 0, 'drop': None,
+                 'slope_per_day': None, 'status': 'unknown'}
+        if not records:
+            return trend
+        trend['failures'] = sum(1 for r in records if r['result'] == 1)
+        points = [(r['time'], r['drop']) for r in records if r['drop'] is not None]
+        if points:
+            trend['drop'] = points[-1][1]
+        trend['status'] = 'ok'
+        if len(points) >= 3:
+            # least squares line through (time, drop)
+            n = len(points)
+            mean_t = sum(t for t, _ in points) / n
+            mean_d = sum(d for _, d in points) / n
+            variance = sum((t - mean_t) ** 2 for t, _ in points)
+            if variance > 0:
+                slope = sum((t - mean_t) * (d - mean_d) for t, d in points) / variance
+                trend['slope_per_day'] = slope * 86400
+                first = mean_d + slope * (points[0][0] - mean_t)
+                last = mean_d + slope * (points[-1][0] - mean_t)
+                if first > 0 and (last - first) / first > degrade:
+                    trend['status'] = 'degrading'
+        if records[-1]['result'] == 1:
+            trend['status'] = 'replace'
+        return trend
+
+
+###############################################################################
+class FleetSelfTest:
+
+    def __init__(self, units, concurrent=1, stagger=30.0, min_capacity=90.0, poll=2.0,
+                 retention=300.0, margin=30.0, health=None, callback=None, debug=False):
+        '''units is a dict name -> APC with an open port in smart mode. At most concurrent units
+           test at the same time, starts are at least stagger seconds apart. A unit is skipped
+           when it is not on line or its battery capacity is below min_capacity. health is a
+           BatteryHealth, callback is called with every record.'''
+        self.units = dict(units)
+        self.concurrent = concurrent
+        self.stagger = stagger
+        self.min_capacity = min_capacity
+        self.poll = poll
+        self.retention = retention
+        self.margin = margin
+        self.health = health
+        self.callback = callback
+        self.debug = debug
+        self.places = threading.Semaphore(concurrent)
+        self.start_lock = threading.Lock()
+        self.last_start = None
+        self.records = []
+        self.threads = []
+        self.testing = set()            # names of the units on battery right now
+        self.lock = threading.Lock()
+
+    def _wait_for_start(self):
+        '''Keep the starts stagger seconds apart.'''
+        with self.start_lock:
+            if self.last_start is not None:
+                delay = self.last_start + self.stagger - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self.last_start = time.monotonic()
+
+    def _test(self, name, ups):
+        '''Run the test of one unit, returns its record.'''
+        debug = self.debug
+        record = {'unit': name, 'time': time.time(), 'state': SKIPPED, 'result': None, 'text': '',
+                  'capacity': None, 'voltage': None, 'minimum': None, 'drop': None, 'duration': None}
+        status = ups.ups_status_byte(debug)
+        capacity = ups.battery_capacity(debug)
+        voltage = ups.battery_voltage(debug)
+        record['capacity'] = capacity if capacity >= 0 else None
+        record['voltage'] = voltage if voltage >= 0 else None
+        if status < 0 or not status & STATUS_ON_LINE or status & STATUS_ON_BATTERY:
+            record['text'] = 'not on line'
+            return record
+        if capacity < self.min_capacity:
+            record['text'] = 'battery capacity %s' % capacity
+            return record
+
+        self._wait_for_start()
+        started = time.monotonic()
+        record['time'] = time.time()
+        if ups.battery_test(debug) != 0:
+            record['state'] = REFUSED
+            record['text'] = 'W not acknowledged'
+            return record
+        with self.lock:
+            self.testing.add(name)
+
+        # follow the test until the UPS is back on line
+        minimum = record['voltage']
+        on_battery = False
+        deadline = started + self.retention - self.margin
+        while time.monotonic() < deadline:
+            time.sleep(self.poll)
+            status = ups.ups_status_byte(debug)
+            voltage = ups.battery_voltage(debug)
+            if voltage >= 0 and (minimum is None or voltage < minimum):
+                minimum = voltage
+            if status < 0:
+                continue
+            if status & STATUS_ON_BATTERY:
+                on_battery = True
+            elif status & STATUS_ON_LINE and (on_battery or time.monotonic() - started > 20):
+                break
+        record['duration'] = time.monotonic() - started
+        with self.lock:
+            self.testing.discard(name)
+
+        # collect the result while the UPS still keeps it
+        result = ups.battery_test_result(debug)
+        while result in (3, -1, -2) and time.monotonic() < deadline:
+            time.sleep(self.poll)
+            result = ups.battery_test_result(debug)
+        record['result'] = result
+        record['text'] = RESULTS.get(result, '')
+        record['state'] = DONE if result in (0, 1, 2) else LOST
+        record['minimum'] = minimum
+        if record['voltage'] is not None and minimum is not None:
+            record['drop'] = round(record['voltage'] - minimum, 2)
+        return record
+
+    def _worker(self, name, ups):
+        with self.places:
+            try:
+                record = self._test(name, ups)
+            except Exception as error:      # one broken unit must not stop the fleet
+                record = {'unit': name, 'time': time.time(), 'state': LOST, 'result': None,
+                          'text': repr(error), 'capacity': None, 'voltage': None, 'minimum': None,
+                          'drop': None, 'duration': None}
+        with self.lock:
+            self.records.append(record)
+        if self.health is not None and record['state'] != SKIPPED:
+            self.health.add(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def start(self, names=None):
+        '''Start the tests of names (default all units) in the background.'''
+        for name in names or self.units:
+            thread = threading.Thread(target=self._worker, args=(name, self.units[name]), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def wait(self, timeout=None):
+        '''Wait until all started tests are finished, returns the records.'''
+        end = None if timeout is None else time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(None if end is None else max(0.0, end - time.monotonic()))
+        with self.lock:
+            return list(self.records)
+
+    def run(self, names=None):
+        '''Test names (default all units) and return the records when all are finished.'''
+        self.start(names)
+        return self.wait()
+
+    def progress(self):
+        '''Number of finished units, units on battery right now and units started.'''
+        with self.lock:
+            return {'finished': len(self.records), 'testing': sorted(self.testing), 'units': len(self.threads)}
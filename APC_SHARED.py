@@ -0,0 +1,175 @@
+###############################################################################
+#
+#   Latest UPS values in shared memory for other processes on the same host
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, memory mapped file with a fixed layout and a
+#             sequence counter (seqlock)
+#           - the -1/-2 error answers do not overwrite the last good value
+#
+###############################################################################
+#   Layout, little endian
+#
+#   0       8s      magic b'APCSHM1\0'
+#   8       I       number of fields n
+#   12      I       length of a field name slot, NAME
+#   16      Q       sequence counter, odd while the writer is busy
+#   24      d       time.time() of the snapshot
+#   32      n*NAME  field names, zero padded
+#   ...     n*d     values, NaN when never read
+#
+#   The process that owns the serial port writes, any number of processes
+#   read. A reader copies the values and checks the counter did not change
+#   and was even; otherwise it reads again. No lock, no round trip.
+#
+#   writer = SnapshotWriter('ups.shm')
+#   writer.publish(ups.sample())
+#
+#   reader = SnapshotReader('ups.shm')
+#   print(reader.battery_capacity(), reader.age())
+#
+###############################################################################
+import mmap                         # for the shared memory
+import os                           # for replacing the file
+import struct                       # for the layout
+import time                         # for the timestamps
+
+from APC_SMART_UPS import FIELDS
+
+
+MAGIC = b'APCSHM1\0'
+HEADER = struct.Struct('<8sIIQd')
+COUNTER = struct.Struct('<Q')
+COUNTER_OFFSET = 16
+NAME = 40
+NAN = float('nan')
+
+
+###############################################################################
+class SnapshotWriter:
+
+    def __init__(self, filename, fields=FIELDS):
+        '''Create the shared file with room for fields. A file of an earlier writer with the same
+           fields is taken over in place, so running readers keep working. Otherwise a new file
+           replaces it; never truncate a file that readers may have mapped.'''
+        self.fields = tuple(fields)
+        self.index = {field: i for i, field in enumerate(self.fields)}
+        self.values_offset = HEADER.size + NAME * len(self.fields)
+        size = self.values_offset + 8 * len(self.fields)
+        names = b''.join(field.encode().ljust(NAME, b'\0') for field in self.fields)
+        if not self._reusable(filename, size, names):
+            temp = filename + '.tmp'
+            with open(temp, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, len(self.fields), NAME, 0, 0.0) + names)
+                f.write(b'\0' * (size - HEADER.size - len(names)))
+            os.replace(temp, filename)
+        self.file = open(filename, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), size)
+        (sequence,) = COUNTER.unpack_from(self.map, COUNTER_OFFSET)
+        self.sequence = sequence + (sequence & 1)
+        self.current = [NAN] * len(self.fields)
+        self.publish({})
+
+    def _reusable(self, filename, size, names):
+        '''True when filename is a snapshot file with exactly this layout.'''
+        try:
+            if os.path.getsize(filename) != size:
+                return False
+            with open(filename, 'rb') as f:
+                data = f.read(HEADER.size + len(names))
+        except OSError:
+            return False
+        magic, count, name, sequence, stamp = HEADER.unpack_from(data)
+        return magic == MAGIC and count == len(self.fields) and name == NAME and data[HEADER.size:] == names
+
+    def publish(self, values, stamp=None):
+        '''Write a new snapshot, values is a dict like APC.sample() returns. Fields that are not
+           in values, or have an error answer (negative or None), keep their previous value.'''
+        if stamp is None:
+            stamp = time.time()
+        for field, value in values.items():
+            index = self.index.get(field)
+            if index is not None and value is not None and value >= 0:
+                self.current[index] = float(value)
+        self.sequence += 1                                  # odd, readers wait
+        COUNTER.pack_into(self.map, COUNTER_OFFSET, self.sequence)
+        struct.pack_into('<d', self.map, COUNTER_OFFSET + 8, stamp)
+        struct.pack_into('<%dd' % len(self.fields), self.map, self.values_offset, *self.current)
+        self.sequence += 1                                  # even, consistent again
+        COUNTER.pack_into(self.map, COUNTER_OFFSET, self.sequence)
+
+    def sample(self, ups, debug=False, fields=None):
+        '''Read fields (default all shared fields) from ups and publish them.'''
+        self.publish(ups.sample(fields or self.fields, debug))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+###############################################################################
+class SnapshotReader:
+
+    def __init__(self, filename, retries=1000):
+        '''Map the shared file of a SnapshotWriter. The fields become methods with the names of
+           the APC methods, reader.battery_capacity() returns the latest published value.'''
+        self.file = open(filename, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, name, sequence, stamp = HEADER.unpack_from(self.map)
+        if magic != MAGIC or name != NAME:
+            raise ValueError('%s is not an APC snapshot' % filename)
+        self.retries = retries
+        self.fields = tuple(
+            self.map[HEADER.size + i * NAME:HEADER.size + (i + 1) * NAME].rstrip(b'\0').decode()
+            for i in range(count))
+        self.index = {field: i for i, field in enumerate(self.fields)}
+        self.values_offset = HEADER.size + NAME * count
+
+    def read(self):
+        '''Consistent copy of the snapshot as (sequence, stamp, tuple of values), None when the
+           writer was busy for all retries.'''
+        for _ in range(self.retries):
+            (before,) = COUNTER.unpack_from(self.map, COUNTER_OFFSET)
+            if before & 1:
+                continue
+            stamp = struct.unpack_from('<d', self.map, COUNTER_OFFSET + 8)[0]
+            values = struct.unpack_from('<%dd' % len(self.fields), self.map, self.values_offset)
+            (after,) = COUNTER.unpack_from(self.map, COUNTER_OFFSET)
+            if before == after:
+                return before, stamp, values
+        return None
+
+    def snapshot(self):
+        '''Latest values as a dict, with the time of the snapshot under 'time'.'''
+        copy = self.read()
+        if copy is None:
+            return None
+        values = dict(zip(self.fields, copy[2]))
+        values['time'] = copy[1]
+        return values
+
+    def value(self, field):
+        '''Latest value of one field, NaN when the writer never published it.'''
+        copy = self.read()
+        if copy is None:
+            return NAN
+        return copy[2][self.index[field]]
+
+    def age(self):
+        '''Seconds since the latest snapshot.'''
+        copy = self.read()
+        if copy is None:
+            return None
+        return time.time() - copy[1]
+
+    def __getattr__(self, name):
+        # reader.line_voltage() like APC.line_voltage(), the debug argument is accepted and ignored
+        if name != 'index' and name in self.__dict__.get('index', {}):
+            return lambda debug=False: self.value(name)
+        raise AttributeError(name)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
@@ -0,0 +1,200 @@
+###############################################################################
+#
+#   Non-blocking shutdown orchestration for APC SMART-UPS control commands
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, timer based state machine for the two step
+#             commands K(>1.5 sec)K, Z(>1.5 sec)Z and Ctrl N(>1.5 sec)Ctrl N
+#             and the single step commands S, @ddd and DEL
+#           - the answer to the first character is checked, a UPS that
+#             refuses it (NA, NO) does not get the second one
+#
+###############################################################################
+#   How it works
+#
+#   The first character of a two step command is sent from the caller, after
+#   that the sequencer owns the UPS (APC.exclusive) so no other command can be
+#   injected between the two characters. A timer sends the second character
+#   after the gap, checks the acknowledge and releases the UPS again. The caller
+#   does not block, the monitoring loop keeps polling; its commands return [-3]
+#   while the window is open.
+#
+###############################################################################
+import threading                    # for the timer of the second character
+import time                         # for the monotonic clock
+
+
+IDLE        = 'idle'
+WAITING     = 'waiting'             # first character sent, waiting for the gap
+DONE        = 'done'                # acknowledged with OK or *
+FAILED      = 'failed'              # NO, NA, no answer or unknown answer
+ABORTED     = 'aborted'
+
+
+###############################################################################
+class ShutdownSequencer:
+
+    def __init__(self, ups, gap=2.0, debug=False, callback=None):
+        '''Init of the sequencer. ups is an APC instance with an open serialport, gap is the delay
+           between the two characters in seconds (must be more than 1.5). callback is called with
+           the sequencer once a sequence is finished.'''
+        if gap <= 1.5:
+            gap = 2.0
+        self.ups = ups
+        self.gap = gap
+        self.debug = debug
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.timer = None
+        self.token = None
+        self.state = IDLE
+        self.name = ''
+        self.result = None
+        self.started = 0.0
+        self.finished = 0.0
+
+    def busy(self):
+        '''True while a two step sequence holds the UPS.'''
+        return self.state == WAITING
+
+    def _acquire(self):
+        '''Take ownership of the UPS for a sequence, returns the token or None when busy.'''
+        with self.ups.lock:
+            if self.ups.exclusive is not None:
+                return None
+            self.token = object()
+            self.ups.exclusive = self.token
+            return self.token
+
+    def _release(self):
+        '''Hand the UPS back to the other callers.'''
+        with self.ups.lock:
+            if self.ups.exclusive is self.token:
+                self.ups.exclusive = None
+        self.token = None
+
+    def _finish(self, result):
+        '''Store the result of a sequence and notify the callback.'''
+        self.result = result
+        self.finished = time.monotonic()
+        if result == 0 or result == 3:
+            self.state = DONE
+        else:
+            self.state = FAILED
+        if self.debug:
+            print('sequence', self.name, self.state, result)
+        if self.callback is not None:
+            self.callback(self)
+
+    def _two_step(self, name, character):
+        '''Send the first character now and schedule the second one after the gap.
+           Returns 0 when the sequence is started, -1 when another sequence owns the UPS and
+           -2 when the UPS did not accept the first character, result holds its answer.'''
+        with self.lock:
+            if self.busy():
+                return -1
+            token = self._acquire()
+            if token is None:
+                return -1
+            self.name = name
+            self.result = None
+            self.state = WAITING
+            self.started = time.monotonic()
+            receive = self.ups.process_command([character], self.debug, token=token)
+            if self.debug:
+                print(name, 'first', receive)
+            first = self.ups.decode_acknowledge(receive)
+            if receive != [-2] and first != 0:
+                # the UPS answers nothing (or OK) to the first character, NA or NO means it
+                # will not take the command, the second character is not sent
+                self._release()
+                self.timer = None
+                self._finish(-2 if first == 3 else first)
+                return -2
+            self.timer = threading.Timer(self.gap, self._second, args=(token, character))
+            self.timer.daemon = True
+            self.timer.start()
+            return 0
+
+    def _second(self, token, character):
+        '''Timer callback, sends the second character and checks the acknowledge.'''
+        with self.lock:
+            if self.state != WAITING or token is not self.token:
+                return
+            receive = self.ups.process_command([character], self.debug, token=token)
+            if self.debug:
+                print(self.name, 'second', receive)
+            self._release()
+            if self.name == 'turn_off_ups' and len(receive) == 1 and receive[0] == -2:
+                # the UPS turns off immediately and does not always answer
+                self._finish(0)
+            else:
+                self._finish(self.ups.decode_acknowledge(receive))
+
+    def _one_step(self, name, data):
+        '''Send a single command, returns the decoded acknowledge or -1 when busy.'''
+        with self.lock:
+            if self.busy():
+                return -1
+            token = self._acquire()
+            if token is None:
+                return -1
+            self.name = name
+            self.started = time.monotonic()
+            try:
+                receive = self.ups.process_command(data, self.debug, token=token)
+            finally:
+                self._release()
+            if self.debug:
+                print(name, receive)
+            self._finish(self.ups.decode_acknowledge(receive))
+            return self.result
+
+    ###########################################################################
+
+    def turn_off_after_delay(self):
+        '''Start K(>1.5 sec)K, the UPS turns off after the programmed shutdown delay.'''
+        return self._two_step('turn_off_after_delay', ord('K'))
+
+    def turn_off_ups(self):
+        '''Start Z(>1.5 sec)Z, the UPS turns off immediately.'''
+        return self._two_step('turn_off_ups', ord('Z'))
+
+    def turn_ups_on(self):
+        '''Start Ctrl N(>1.5 sec)Ctrl N, equal to pushing the on button.'''
+        return self._two_step('turn_ups_on', 14)
+
+    def shut_down_ups_on_battery(self):
+        '''Send S, only accepted while the UPS runs on battery.'''
+        return self._one_step('shut_down_ups_on_battery', [ord('S')])
+
+    def shut_down_with_delayed_wake_up(self, tenths):
+        '''Send @ddd, wake up after ddd tenths of an hour.'''
+        return self._one_step('shut_down_with_delayed_wake_up', self.ups.delayed_wake_up_command(tenths))
+
+    def abort(self):
+        '''Abort a pending sequence. While waiting for the second character the timer is simply
+           cancelled, so the UPS never sees a complete command. Otherwise DEL is sent to the UPS
+           to abort S, @ddd or K during the shutdown delay.'''
+        with self.lock:
+            if self.state == WAITING:
+                self.timer.cancel()
+                self._release()
+                self.state = ABORTED
+                self.finished = time.monotonic()
+                if self.callback is not None:
+                    self.callback(self)
+                return 0
+        result = self._one_step('abort_shutdown', [127])
+        if result == 0:
+            self.state = ABORTED
+        return result
+
+    def wait(self, timeout=None):
+        '''Block until the running sequence is finished, only meant for scripts and demos.'''
+        timer = self.timer
+        if timer is not None:
+            timer.join(timeout)
+        return self.result
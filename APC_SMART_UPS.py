@@ -7,6 +7,22 @@
 #   2024 - August - Henk-Johan
 #           - first version of interface module
 #
+#   2026 - October
+#           - command lock and exclusive token for multi-step sequences
+#           - turn off after delay, shut down on battery, delayed wake up
+#             and abort shutdown commands
+#           - retry loops no longer index short answers
+#           - pyserial is imported when the port is opened, not at import
+#           - the port can replace the response delay, see APC_TRACE
+#           - serial_open uses the transports of APC_TRANSPORT
+#           - optional instrumentation hooks in process_command
+#           - sample() reads a set of fields in one call
+#           - ups_status_byte decodes the status as hexadecimal byte
+#           - estimated_runtime
+#           - the two step commands K, Z and Ctrl N hold the UPS with the
+#             exclusive token between their characters
+#           - the instrumented exchange asks a recorded port for in_waiting
+#             once, the attempt counter is per thread
 #
 ###############################################################################
 #   to-be-do-list
@@ -14,26 +30,114 @@
 #
 ###############################################################################
 import time                         # for sleeping
-import serial                       # for RS232 connection
+import threading                    # for the command lock
+
+
+# inquiry methods that only read a value from the UPS, safe to poll
+FIELDS = (
+    'battery_test_result',
+    'number_of_battery_packs',
+    'transfer_cause',
+    'ups_nominal_battery_voltage_rating',
+    'battery_capacity',
+    'estimated_runtime',
+    'acceptable_line_quality',
+    'ups_status',
+    'ups_status_byte',
+    'load_current',
+    'apparent_load_power',
+    'battery_voltage',
+    'ups_internal_temperature',
+    'ups_and_utility_operating_frequency',
+    'line_voltage',
+    'maximum_line_voltage',
+    'minimum_line_voltage',
+    'output_voltage',
+    'load_power',
+    )
+
+# the fields of battery_calibration_log_to_csv.py, in the order of its columns
+LOG_FIELDS = (
+    'line_voltage',
+    'output_voltage',
+    'ups_and_utility_operating_frequency',
+    'load_power',
+    'battery_capacity',
+    'battery_voltage',
+    'ups_internal_temperature',
+    'ups_status',
+    )
+
+# the csv column names of battery_calibration_log_to_csv.py for LOG_FIELDS
+LOG_COLUMNS = (
+    'line voltage',
+    'output voltage',
+    'ups and utility frequency',
+    'load power',
+    'battery capacity',
+    'battery voltage',
+    'ups internal temperature',
+    'ups internal status',
+    )
+
+# bits of ups_status_byte()
+STATUS_REPLACE_BATTERY  = 0x80
+STATUS_LOW_BATTERY      = 0x40
+STATUS_OVERLOAD         = 0x20
+STATUS_ON_BATTERY       = 0x10
+STATUS_ON_LINE          = 0x08
+STATUS_SMART_BOOST      = 0x04
+STATUS_SMART_TRIM       = 0x02
+STATUS_CALIBRATION      = 0x01
+
+STATUS_NAMES = (
+    (STATUS_REPLACE_BATTERY,    'replace battery'),
+    (STATUS_LOW_BATTERY,        'low battery'),
+    (STATUS_OVERLOAD,           'overload'),
+    (STATUS_ON_BATTERY,         'on battery'),
+    (STATUS_ON_LINE,            'on line'),
+    (STATUS_SMART_BOOST,        'SmartBoost'),
+    (STATUS_SMART_TRIM,         'SmartTrim'),
+    (STATUS_CALIBRATION,        'calibration'),
+    )
+
+
+def status_flags(status):
+    '''Names of the bits set in a ups_status_byte() value, empty for the -1/-2 answers.'''
+    if status is None or status < 0:
+        return []
+    return [name for bit, name in STATUS_NAMES if status & bit]
 
 
 ###############################################################################
 class APC:
 
-    def __init__(self, serialport):
-        '''Init of the UPS. We need to parse the serialport location that we are going to use.'''
+    def __init__(self, serialport, **options):
+        '''Init of the UPS. We need to parse the serialport location that we are going to use.
+           options are passed to the transport of the port, each transport has its own, for
+           example timeout for a serial port or read_ahead for tcp://, see APC_TRANSPORT.'''
         self.serialport = serialport
+        self.options = options
+        # only one command can be on the wire at any time
+        self.lock = threading.RLock()
+        # token of a multi-step sequence that currently owns the UPS, see APC_SHUTDOWN
+        self.exclusive = None
+        # functions called with a dict for every command, see APC_INSTRUMENT. None costs nothing
+        self.hooks = None
+        # local.attempt is the number of the attempt within one method call, set by
+        # APC_INSTRUMENT per thread. Not set outside a wrapped call, then every command is
+        # reported as attempt 0
+        self.local = threading.local()
 
     def serial_open(self):
-        '''Open the serialport that we parsed at the init.'''
-        self.ser = serial.Serial(
-            port        = self.serialport,
-            baudrate    = 2400,
-            parity      = serial.PARITY_NONE,
-            stopbits    = serial.STOPBITS_ONE,
-            bytesize    = serial.EIGHTBITS,
-            timeout     = 2
-            )
+        '''Open the serialport that we parsed at the init. This can be a port name like COM5,
+           a tcp://, rfc2217://, loop:// or replay:// url, or a transport object, see APC_TRANSPORT.'''
+        if isinstance(self.serialport, str):
+            from APC_TRANSPORT import open_transport
+            self.ser = open_transport(self.serialport, **self.options)
+        else:
+            self.ser = self.serialport
+        self.ser.open()
         return self.ser.is_open
 
     def serial_close(self):
@@ -41,8 +145,23 @@ class APC:
         self.ser.close()
         return self.ser.is_open
 
-    def process_command(self, data, debug = False, sleep=0.5):
-        """Handle commands . This method will only do a basic inspection of the data that comes back."""
+    def process_command(self, data, debug = False, sleep=0.5, token=None):
+        """Handle commands . This method will only do a basic inspection of the data that comes back.
+           When a multi-step sequence owns the UPS, only commands carrying its token are sent,
+           all others return [-3] without touching the serial port."""
+        with self.lock:
+            if (self.exclusive is not None) and (token is not self.exclusive):
+                if debug:
+                    print('Blocked, sequence in progress:', list(data))
+                if self.hooks is not None:
+                    self._report(data, 0, 0, None, 0.0, 'blocked')
+                return [-3]
+            if self.hooks is not None:
+                return self._instrumented_command(data, debug, sleep)
+            return self._process_command(data, debug, sleep)
+
+    def _process_command(self, data, debug, sleep):
+        """The actual exchange with the UPS, the caller holds the lock."""
         # transform the list into a byte array so we can push it out of the RS232 port
         transmit = bytearray(data)
         # write to the RS232 port
@@ -52,7 +171,8 @@ class APC:
         if trbytes != len(transmit):
             return [-1]
         # small delay to give the APC time to respond. keep in mind, it is slow.
-        time.sleep(sleep)
+        # a port can bring its own wait, a replayed trace does not need to sleep for real
+        getattr(self.ser, 'wait', time.sleep)(sleep)
         # check how many bytes are in the buffer    
         exp =  int(self.ser.in_waiting )
         if exp == 0:
@@ -65,6 +185,109 @@ class APC:
         self.ser.readinto(receive)
         return list(receive)
 
+    def _instrumented_command(self, data, debug, sleep, step=0.01):
+        """Same exchange as _process_command, but timed. The response delay is split in steps of
+           step seconds to see when the first byte arrives, the UPS sees no difference."""
+        transmit = bytearray(data)
+        if debug:
+            print('Transmitting:', list(transmit))
+        start = time.perf_counter()
+        trbytes = self.ser.write(transmit)
+        if trbytes != len(transmit):
+            self._report(data, trbytes, 0, None, time.perf_counter() - start, 'write_error')
+            return [-1]
+        wait = getattr(self.ser, 'wait', time.sleep)
+        first_byte = None
+        waited = 0.0
+        pollable = getattr(self.ser, 'pollable', True)
+        if not pollable:
+            # every in_waiting of a recorded or replayed port is a record, ask once
+            wait(sleep)
+            waited = sleep
+        while waited < sleep:
+            if first_byte is None:
+                wait(min(step, sleep - waited))
+                waited += step
+                if self.ser.in_waiting:
+                    first_byte = time.perf_counter() - start
+            else:
+                wait(sleep - waited)
+                waited = sleep
+        exp = int(self.ser.in_waiting)
+        if exp == 0:
+            self._report(data, trbytes, 0, None, time.perf_counter() - start, 'no_answer')
+            return [-2]
+        if first_byte is None and pollable:
+            first_byte = time.perf_counter() - start
+        if debug:
+            print('received bytes: ', exp)
+        receive = bytearray(exp)
+        self.ser.readinto(receive)
+        self._report(data, trbytes, exp, first_byte, time.perf_counter() - start, 'ok')
+        return list(receive)
+
+    def _report(self, data, written, read, first_byte, latency, result):
+        """Hand one exchange to the instrumentation hooks."""
+        attempt = getattr(self.local, 'attempt', None)
+        event = {
+            'time'          : time.time(),
+            'command'       : chr(data[0]) if len(data) else '',
+            'written'       : written,
+            'read'          : read,
+            'first_byte'    : first_byte,
+            'latency'       : latency,
+            'attempt'       : attempt or 0,
+            'result'        : result,
+            }
+        if attempt is not None:
+            self.local.attempt = attempt + 1
+        for hook in self.hooks:
+            hook(event)
+
+    def _two_step(self, name, debug):
+        """Run the two step command name of APC_SHUTDOWN.ShutdownSequencer and wait for it.
+           The UPS is held with the exclusive token between the two characters, so the
+           commands of other threads can not break the sequence. Returns the decoded
+           acknowledge of the second character, the refusal of the first one, or -1 when
+           another sequence owns the UPS."""
+        from APC_SHUTDOWN import ShutdownSequencer
+        sequencer = ShutdownSequencer(self, debug=debug)
+        if getattr(sequencer, name)() == -1:
+            return -1
+        return sequencer.wait()
+
+    def sample(self, fields=LOG_FIELDS, debug=False):
+        """Read a set of fields, returns a dict with the value of every field."""
+        values = {}
+        for field in fields:
+            values[field] = getattr(self, field)(debug)
+        return values
+
+    def decode_acknowledge(self, receive):
+        """ Decode the acknowledge of a control command.
+            0 = OK, 1 = NO, 2 = NA, 3 = * (older UPS about to turn off),
+            -1 = no or incomplete answer, -2 = unknown answer
+        """
+        if len(receive) < 1 or receive[0] < 0:
+            return -1
+        if receive[0] == 42:                                    # *
+            return 3
+        if len(receive) < 4:
+            return -1
+        if receive[2] != 13:      # CR
+            return -1
+        if receive[3] != 10:      # LR
+            return -1
+        #---------------------------------------------
+        if receive[0] == 79 and receive[1] == 75: # OK
+            return 0
+        if receive[0] == 78 and receive[1] == 79: # NO
+            return 1
+        if receive[0] == 78 and receive[1] == 65: # NA
+            return 2
+        #---------------------------------------------
+        return -2
+
     def set_ups_to_smart_mode(self,debug=False):
         """ Set UPS to Smart Mode
             In order to use the UPS-Link control language to communicate with the UPS, 
@@ -141,76 +364,53 @@ class APC:
                 return -1
             return 0
 
-    # def turn_off_after_delay(self,debug=False):
-    #     """
-    #         Sending an ASCII character sequence uppercase "K" uppercase "K", with a 
-    #         greater than 1.5 second delay between characters, causes the UPS to turn 
-    #         off based on the Shutdown Delay (the "p" command in section 3.4, “UPS 
-    #         Customizing Commands”). The KK character sequence, with the greater than 
-    #         1.5 second delay between the K characters, is shown in this document as 
-    #         “K (>1.5 sec)K.” If the delay between characters is less than 1.5 seconds, 
-    #         or if another command is sent to the UPS between the "K" characters, the
-    #         UPS will not recognize the "K" command. When processing a command that 
-    #         conflicts with the Turn Off after Delay function, the UPS returns the message 
-    #         "NA" immediately after the "K (>1.5 sec)K" command is sent. Older UPSs return 
-    #         an "*" (asterisk) to the terminal to signal that it is about to turn off. Newer 
-    #         models respond with a "OK" to indicate that the UPS received the command. No 
-    #         other commands will be processed following the "*" or "OK" response. If 
-    #         turned off while operating on-battery, the UPS does not restart when the utility is restored.
-
-    #         This command is not supported on the Smart-UPS 250, 400, and 370ci. 
-    #         The Matrix-UPS's battery charger is disabled when shut off. 
-    #         Do not operate the Matrix-UPS in this mode for extended periods because 
-    #         the batteries may become discharged.
-    #     """
-    #     receive = self.process_command([ord('Y')], debug)
-    #     if debug == True:
-    #         print('turn_off_after_delay', receive)
-    #     if len(receive) == 0:
-    #         return -1
-    #     if receive[0] != 83:      # S
-    #         return -1
-    #     if receive[1] != 77:      # M
-    #         return -1
-    #     if receive[-2] != 13:      # CR
-    #         return -1
-    #     if receive[-1] != 10:      # LR
-    #         return -1
-    #     return 0
+    def turn_off_after_delay(self,debug=False):
+        """
+            Sending an ASCII character sequence uppercase "K" uppercase "K", with a 
+            greater than 1.5 second delay between characters, causes the UPS to turn 
+            off based on the Shutdown Delay (the "p" command in section 3.4, “UPS 
+            Customizing Commands”). The KK character sequence, with the greater than 
+            1.5 second delay between the K characters, is shown in this document as 
+            “K (>1.5 sec)K.” If the delay between characters is less than 1.5 seconds, 
+            or if another command is sent to the UPS between the "K" characters, the
+            UPS will not recognize the "K" command. When processing a command that 
+            conflicts with the Turn Off after Delay function, the UPS returns the message 
+            "NA" immediately after the "K (>1.5 sec)K" command is sent. Older UPSs return 
+            an "*" (asterisk) to the terminal to signal that it is about to turn off. Newer 
+            models respond with a "OK" to indicate that the UPS received the command. No 
+            other commands will be processed following the "*" or "OK" response. If 
+            turned off while operating on-battery, the UPS does not restart when the utility is restored.
+
+            This command is not supported on the Smart-UPS 250, 400, and 370ci. 
+            The Matrix-UPS's battery charger is disabled when shut off. 
+            Do not operate the Matrix-UPS in this mode for extended periods because 
+            the batteries may become discharged.
+        """
+        return self._two_step('turn_off_after_delay', debug)
 
-    # def shut_down_ups_on_battery(self,debug=False):
-    #     """
-    #         Sending the ASCII character uppercase "S" to the UPS while operating on-battery 
-    #         causes the UPS to shut down following a shutdown delay programmed by the Shutdown 
-    #         Delay command (the "p" command documented in Section 3.4, “UPS Customizing Commands”). 
-    #         The UPS's output returns when the utility power is restored. If the utility power is 
-    #         restored within the UPS shutdown delay interval, the UPS still shuts down at the end 
-    #         of the interval (and then immediately restarts). The UPS responds to this command with 
-    #         the characters "OK". The commands "K(>1.5 sec)K", "U", "W", "Z(>1.5 sec) Z", "@ddd" 
-    #         and "-" will not be processed following the "OK" response. If these commands are sent, 
-    #         the UPS returns the characters "NA". During the time the UPS's output is unpowered, 
-    #         the UPS's internal electronics remain in a "sleep" mode as indicated by the marquee 
-    #         sequence of the UPS LEDs or message given on the UPS's display.
+    def shut_down_ups_on_battery(self,debug=False):
+        """
+            Sending the ASCII character uppercase "S" to the UPS while operating on-battery 
+            causes the UPS to shut down following a shutdown delay programmed by the Shutdown 
+            Delay command (the "p" command documented in Section 3.4, “UPS Customizing Commands”). 
+            The UPS's output returns when the utility power is restored. If the utility power is 
+            restored within the UPS shutdown delay interval, the UPS still shuts down at the end 
+            of the interval (and then immediately restarts). The UPS responds to this command with 
+            the characters "OK". The commands "K(>1.5 sec)K", "U", "W", "Z(>1.5 sec) Z", "@ddd" 
+            and "-" will not be processed following the "OK" response. If these commands are sent, 
+            the UPS returns the characters "NA". During the time the UPS's output is unpowered, 
+            the UPS's internal electronics remain in a "sleep" mode as indicated by the marquee 
+            sequence of the UPS LEDs or message given on the UPS's display.
             
-    #         The UPS responds to this command only when running on battery, and the UPS stays on battery after the command is sent.
+            The UPS responds to this command only when running on battery, and the UPS stays on battery after the command is sent.
             
-    #         The automatic turn on feature on APC models Smart-UPS 400 and UPS 370ci must be disabled 
-    #         via the option switch in order for the command to take effect.
-    #     """
-    #     receive = self.process_command([ord('Y')], debug)
-    #     if debug == True:
-    #         print('shut_down_ups_on_battery', receive)
-    #     if len(receive) == 0:
-    #         return -1
-    #     if receive[0] != 83:      # S
-    #         return -1
-    #     if receive[1] != 77:      # M
-    #         return -1
-    #     if receive[-2] != 13:      # CR
-    #         return -1
-    #     if receive[-1] != 10:      # LR
-    #         return -1
-    #     return 0
+            The automatic turn on feature on APC models Smart-UPS 400 and UPS 370ci must be disabled 
+            via the option switch in order for the command to take effect.
+        """
+        receive = self.process_command([ord('S')], debug)
+        if debug == True:
+            print('shut_down_ups_on_battery', receive)
+        return self.decode_acknowledge(receive)
 
 
     def simulate_power_failure(self,debug=False):
@@ -281,81 +481,59 @@ class APC:
             The Matrix-UPS's battery charger is disabled when shut off. Do not operate the 
             Matrix-UPS in this mode for extended periods because the batteries may become discharged.
         """
-        receive = self.process_command([ord('Z')], debug)
-        if debug == True:
-            print('turn_off_ups', receive)
-        time.sleep(2)
-        receive = self.process_command([ord('Z')], debug)
-        if debug == True:
-            print('turn_off_ups', receive)
-        if len(receive) != 0:
+        if self._two_step('turn_off_ups', debug) not in (0, 3):
             return -1
         return 0
 
-    # def shut_down_with_delayed_wake_up(self,debug=False):
-    #     """
-    #         Sending the ASCII characters "@ddd" causes the UPS to turn off based on the Shutdown Delay (the "p" command, 
-    #         documented in Section 3.4, "UPS Customizing Commands"), then restore power to the load after "ddd" tenths of 
-    #         an hour have expired. After "ddd" tenths of an hour have expired, the UPS waits an additional delay interval 
-    #         specified by the UPS Turn On Delay (the "r" command, documented in Section 3.4, "UPS Customizing Commands").
+    def shut_down_with_delayed_wake_up(self,tenths,debug=False):
+        """
+            Sending the ASCII characters "@ddd" causes the UPS to turn off based on the Shutdown Delay (the "p" command, 
+            documented in Section 3.4, "UPS Customizing Commands"), then restore power to the load after "ddd" tenths of 
+            an hour have expired. After "ddd" tenths of an hour have expired, the UPS waits an additional delay interval 
+            specified by the UPS Turn On Delay (the "r" command, documented in Section 3.4, "UPS Customizing Commands").
             
-    #         For example, if "@126" is sent to the UPS, the UPS turns off following a 20 second delay (the default value 
-    #         of the "p" command) and restarts after 12.6 hours. The UPS ignores invalid characters such as alphabetic 
-    #         characters (letters) sent after the "@", and the command must be retried. When processing a command that conflicts 
-    #         with the Shut Down with Delayed Wake Up command, the UPS returns the message "NA" immediately after the "@ddd" command is sent.
+            For example, if "@126" is sent to the UPS, the UPS turns off following a 20 second delay (the default value 
+            of the "p" command) and restarts after 12.6 hours. The UPS ignores invalid characters such as alphabetic 
+            characters (letters) sent after the "@", and the command must be retried. When processing a command that conflicts 
+            with the Shut Down with Delayed Wake Up command, the UPS returns the message "NA" immediately after the "@ddd" command is sent.
             
-    #         Older UPSs return an "*" (asterisk) to the terminal to signal that they are about to turn off. Matrix-UPSs and 
-    #         newer Smart-UPSs return an "OK" to acknowledge receipt of the command. No other commands will be processed 
-    #         following the "*" or "OK" response. During the time the UPS's output is unpowered, the UPS's internal electronics 
-    #         remain in a "sleep" mode as indicated by the marquee sequence or message given on the UPS's display. A delay in 
-    #         addition to that programmed with the "@ddd" command is provided via the "r" command, documented in Section 3.4.
-
-    #         Note that the “automatic turn on” feature on APC models Smart-UPS 400 and UPS 370ci must be disabled via the 
-    #         option switch in order for the command to take effect.
-    #     """
-    #     receive = self.process_command([ord('Y')], debug)
-    #     if debug == True:
-    #         print('xxxxx', receive)
-    #     if len(receive) == 0:
-    #         return -1
-    #     if receive[0] != 79:      # O
-    #         return -1
-    #     if receive[1] != 75:      # K
-    #         return -1
-    #     if receive[-2] != 13:      # CR
-    #         return -1
-    #     if receive[-1] != 10:      # LR
-    #         return -1
-    #     return 0
+            Older UPSs return an "*" (asterisk) to the terminal to signal that they are about to turn off. Matrix-UPSs and 
+            newer Smart-UPSs return an "OK" to acknowledge receipt of the command. No other commands will be processed 
+            following the "*" or "OK" response. During the time the UPS's output is unpowered, the UPS's internal electronics 
+            remain in a "sleep" mode as indicated by the marquee sequence or message given on the UPS's display. A delay in 
+            addition to that programmed with the "@ddd" command is provided via the "r" command, documented in Section 3.4.
+
+            Note that the “automatic turn on” feature on APC models Smart-UPS 400 and UPS 370ci must be disabled via the 
+            option switch in order for the command to take effect.
+        """
+        receive = self.process_command(self.delayed_wake_up_command(tenths), debug)
+        if debug == True:
+            print('shut_down_with_delayed_wake_up', receive)
+        return self.decode_acknowledge(receive)
 
-    # def abort_shutdown(self,debug=False):
-    #     """
-    #         Sending the ASCII character equivalent to the "DEL" key (delete) immediately causes the UPS to 
-    #         abort the following shutdown commands: "@ddd" (Shut Down with Delayed Wake Up), "S" (Shut Down 
-    #         UPS on Battery) or "K(>1.5 sec)K" (Turn Off after Delay). However, the "K" command, "K(>1.5 sec)K,
-    #         " can be aborted only during the delay; once the UPS is shut off, the “DEL” command responds 
-    #         "NO" to the "K" command and does not turn back on. When the UPS aborts a shutdown command, the 
-    #         UPS turns back on regardless of whether line voltage is good or not. If a newer Smart-UPS is in 
-    #         "sleep" mode due to the "@ddd" command, "DEL" brings it out of sleep mode. The response from the 
-    #         UPS to the "DEL" command is "OK".
-
-    #         The "DEL" command is valid for APC Matrix-UPS models and newer Smart-UPS models. 
-    #         Other APC UPS models do not respond to the command.
-    #     """
-    #     receive = self.process_command([ord('Y')], debug)
-    #     if debug == True:
-    #         print('xxxxx', receive)
-    #     if len(receive) == 0:
-    #         return -1
-    #     if receive[0] != 79:      # O
-    #         return -1
-    #     if receive[1] != 75:      # K
-    #         return -1
-    #     if receive[-2] != 13:      # CR
-    #         return -1
-    #     if receive[-1] != 10:      # LR
-    #         return -1
-    #     return 0
+    def delayed_wake_up_command(self, tenths):
+        """Build the "@ddd" command, ddd is the wake up delay in tenths of an hour (0..999)."""
+        tenths = min(max(int(tenths), 0), 999)
+        return [ord('@')] + [ord(c) for c in '%03d' % tenths]
+
+    def abort_shutdown(self,debug=False):
+        """
+            Sending the ASCII character equivalent to the "DEL" key (delete) immediately causes the UPS to 
+            abort the following shutdown commands: "@ddd" (Shut Down with Delayed Wake Up), "S" (Shut Down 
+            UPS on Battery) or "K(>1.5 sec)K" (Turn Off after Delay). However, the "K" command, "K(>1.5 sec)K,
+            " can be aborted only during the delay; once the UPS is shut off, the “DEL” command responds 
+            "NO" to the "K" command and does not turn back on. When the UPS aborts a shutdown command, the 
+            UPS turns back on regardless of whether line voltage is good or not. If a newer Smart-UPS is in 
+            "sleep" mode due to the "@ddd" command, "DEL" brings it out of sleep mode. The response from the 
+            UPS to the "DEL" command is "OK".
+
+            The "DEL" command is valid for APC Matrix-UPS models and newer Smart-UPS models. 
+            Other APC UPS models do not respond to the command.
+        """
+        receive = self.process_command([127], debug)
+        if debug == True:
+            print('abort_shutdown', receive)
+        return self.decode_acknowledge(receive)
 
     def run_time_calibration(self,debug=False):
         """
@@ -427,22 +605,7 @@ class APC:
             user pushed the front “on” button with no line voltage present. The Ctrl N command is 
             valid only on newer Smart-UPS models.
         """
-        receive = self.process_command([14], debug)
-        if debug == True:
-            print('turn_ups_on', receive)
-        time.sleep(2)
-        receive = self.process_command([14], debug)
-        if debug == True:
-            print('turn_ups_on', receive)
-        if len(receive) < 4:
-            return -1
-        if receive[0] != 79:      # O
-            return -1
-        if receive[1] != 75:      # K
-            return -1
-        if receive[2] != 13:      # CR
-            return -1
-        if receive[3] != 10:      # LR
+        if self._two_step('turn_ups_on', debug) != 0:
             return -1
         return 0
 
@@ -673,6 +836,33 @@ class APC:
         return result
 
 
+    def estimated_runtime(self,debug=False):
+        """
+            Sending the ASCII character lowercase "j" causes the UPS to respond with "dddd:" the
+            estimated runtime in minutes, based on the present load and battery capacity.
+        """
+        OK = False
+        counter = 0
+        while (OK == False) and (counter < 3):
+            receive = self.process_command([ord('j')], debug)
+            if debug == True:
+                print('estimated_runtime', receive)
+            if len(receive) < 7:
+                result = -1
+            else:
+                if receive[5] != 13:      # CR
+                    result = -1
+                if receive[6] != 10:      # LR
+                    result = -1
+                #-----------------------------------
+                try:
+                    result = int( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) )
+                    OK = True
+                except:
+                    result = -2
+            counter += 1
+        return result
+
     def acceptable_line_quality(self,debug=False):
         """
             Sending the ASCII character "9" causes the UPS to respond with either the characters "FF", 
@@ -725,16 +915,46 @@ class APC:
                 print('ups_status', receive)
             if len(receive) < 4:
                 result = -1
-            if receive[2] != 13:      # CR
-                result = -1
-            if receive[3] != 10:      # LR
+            else:
+                if receive[2] != 13:      # CR
+                    result = -1
+                if receive[3] != 10:      # LR
+                    result = -1
+                #-----------------------------------
+                try:
+                    result = int(chr(receive[0])) + 10*int(chr(receive[1]))
+                    OK = True
+                except:
+                    result = -2
+            counter += 1
+        return result
+
+    def ups_status_byte(self,debug=False):
+        """
+            Same "Q" command as ups_status, but the two characters are decoded as the hexadecimal
+            status byte, so the STATUS_ bits can be tested directly, for example
+            ups.ups_status_byte() & STATUS_ON_BATTERY. ups_status is kept as it is for the
+            existing csv logs.
+        """
+        OK = False
+        counter = 0
+        while (OK == False) and (counter < 3):
+            receive = self.process_command([ord('Q')], debug)
+            if debug == True:
+                print('ups_status_byte', receive)
+            if len(receive) < 4:
                 result = -1
-            #-----------------------------------
-            try:
-                result = int(chr(receive[0])) + 10*int(chr(receive[1]))
-                OK = True
-            except:
-                result = -2
+            else:
+                if receive[2] != 13:      # CR
+                    result = -1
+                if receive[3] != 10:      # LR
+                    result = -1
+                #-----------------------------------
+                try:
+                    result = int(chr(receive[0]) + chr(receive[1]), 16)
+                    OK = True
+                except:
+                    result = -2
             counter += 1
         return result
 
@@ -813,16 +1033,17 @@ class APC:
                 print('battery_voltage', receive)
             if len(receive) < 7:
                 result = -1
-            if receive[5] != 13:      # CR
-                result = -1
-            if receive[6] != 10:      # LR
-                result = -1
-            #-----------------------------------
-            try:
-                result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
-                OK = True
-            except:
-                result = -2
+            else:
+                if receive[5] != 13:      # CR
+                    result = -1
+                if receive[6] != 10:      # LR
+                    result = -1
+                #-----------------------------------
+                try:
+                    result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
+                    OK = True
+                except:
+                    result = -2
             counter += 1
         return result
     
@@ -842,16 +1063,17 @@ class APC:
                 print('ups_internal_temperature', receive)
             if len(receive) < 7:
                 result = -1
-            if receive[5] != 13:      # CR
-                result = -1
-            if receive[6] != 10:      # LR
-                result = -1
-            #-----------------------------------
-            try:
-                result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
-                OK = True
-            except:
-                result = -2
+            else:
+                if receive[5] != 13:      # CR
+                    result = -1
+                if receive[6] != 10:      # LR
+                    result = -1
+                #-----------------------------------
+                try:
+                    result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
+                    OK = True
+                except:
+                    result = -2
             counter += 1
         return result
         
@@ -872,16 +1094,17 @@ class APC:
                 print('ups_and_utility_operating_frequency', receive)
             if len(receive) < 7:
                 result = -1
-            if receive[5] != 13:      # CR
-                result = -1
-            if receive[6] != 10:      # LR
-                result = -1
-            #-----------------------------------
-            try:
-                result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
-                OK = True
-            except:
-                result = -2
+            else:
+                if receive[5] != 13:      # CR
+                    result = -1
+                if receive[6] != 10:      # LR
+                    result = -1
+                #-----------------------------------
+                try:
+                    result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
+                    OK = True
+                except:
+                    result = -2
             counter += 1
         return result
 
@@ -901,16 +1124,17 @@ class APC:
                 print('line_voltage', receive)
             if len(receive) < 7:
                 result = -1
-            if receive[5] != 13:      # CR
-                result = -1
-            if receive[6] != 10:      # LR
-                result = -1
-            #-----------------------------------
-            try:
-                result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
-                OK = True
-            except:
-                result -2
+            else:
+                if receive[5] != 13:      # CR
+                    result = -1
+                if receive[6] != 10:      # LR
+                    result = -1
+                #-----------------------------------
+                try:
+                    result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
+                    OK = True
+                except:
+                    result = -2
             counter += 1
         return result
 
@@ -975,16 +1199,17 @@ class APC:
                 print('output_voltage', receive)
             if len(receive) < 7:
                 result = -1
-            if receive[5] != 13:      # CR
-                result = -2
-            if receive[6] != 10:      # LR
-                result = -3
-            #-----------------------------------
-            try:
-                result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
-                OK = True
-            except:
-                result -4
+            else:
+                if receive[5] != 13:      # CR
+                    result = -2
+                if receive[6] != 10:      # LR
+                    result = -3
+                #-----------------------------------
+                try:
+                    result = float( chr(receive[0]) + chr(receive[1]) + chr(receive[2]) + chr(receive[3]) + chr(receive[4]) )
+                    OK = True
+                except:
+                    result = -4
             counter += 1
         return result
 
@@ -0,0 +1,318 @@
+###############################################################################
+#
+#   Store and forward spool for samples when a sink is unreachable
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, append-only segment files with checksums, batch
+#             replay, size cap with oldest-first eviction, backlog counters
+#           - a record evicted while its batch was sent is only counted as
+#             evicted, ack counts the rest from the moved cursor
+#
+###############################################################################
+#   Layout on disk
+#
+#   <directory>/<segment>.spool     segment files, numbered 000000000001, ...
+#   <directory>/cursor              JSON {"segment": n, "offset": o}, the
+#                                   first record that was not forwarded yet
+#
+#   record  '<II' length and crc32 of the payload, then the payload, a
+#           compact JSON object {"time": ..., "values": {...}}
+#
+#   A new segment is started when the current one reaches segment_bytes. When
+#   all segments together pass max_bytes the oldest segment is deleted, sent
+#   or not, and counted as evicted. After a crash the torn record at the end
+#   of the last segment is cut off; a record with a bad checksum is skipped.
+#
+#   spool = Spool('spool')
+#   forwarder = Forwarder(spool, send_to_database)
+#   forwarder.start()
+#   pipeline.add_sink('database', forwarder)        every sample goes through the spool
+#
+###############################################################################
+import json                         # for the payload and the cursor
+import os                           # for the segment files
+import struct                       # for the record header
+import threading                    # for the forwarding thread
+import time                         # for the timestamps
+import zlib                         # for crc32
+
+
+RECORD = struct.Struct('<II')
+SUFFIX = '.spool'
+MAX_RECORD = 16 * 1024 * 1024       # a longer length is a broken header
+
+
+###############################################################################
+class Spool:
+
+    def __init__(self, directory, segment_bytes=1024 * 1024, max_bytes=256 * 1024 * 1024, fsync=False):
+        '''Open or create the spool in directory. fsync makes every append durable against a
+           power loss of the host itself, at the cost of a disk flush per sample.'''
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max(max_bytes, 2 * segment_bytes)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.forwarded = 0
+        self.evicted = 0
+        self.corrupt = 0
+        os.makedirs(directory, exist_ok=True)
+        self.segments = sorted(int(name[:-len(SUFFIX)]) for name in os.listdir(directory) if name.endswith(SUFFIX))
+        if not self.segments:
+            self.segments = [1]
+            open(self._name(1), 'ab').close()
+        self._repair(self.segments[-1])
+        self.cursor = self._load_cursor()
+        self.read_from = self.cursor    # cursor of the last read()
+        self.sizes = {segment: os.path.getsize(self._name(segment)) for segment in self.segments}
+        self.pending = sum(self._count(segment, self.cursor[1] if segment == self.cursor[0] else 0)
+                           for segment in self.segments if segment >= self.cursor[0])
+        self.file = open(self._name(self.segments[-1]), 'ab')
+
+    def _name(self, segment):
+        return os.path.join(self.directory, '%012d%s' % (segment, SUFFIX))
+
+    def _records(self, segment, offset):
+        '''(offset after, payload or None when corrupt) of the records of segment from offset.'''
+        with open(self._name(segment), 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                length, crc = RECORD.unpack(header)
+                if length > MAX_RECORD:
+                    return
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+                offset += RECORD.size + length
+                yield offset, payload if zlib.crc32(payload) == crc else None
+
+    def _count(self, segment, offset):
+        return sum(1 for _ in self._records(segment, offset))
+
+    def _between(self, start, end):
+        '''(records, corrupt ones) from position start up to position end.'''
+        count = corrupt = 0
+        for segment in [s for s in self.segments if start[0] <= s <= end[0]]:
+            for offset, payload in self._records(segment, start[1] if segment == start[0] else 0):
+                if segment == end[0] and offset > end[1]:
+                    break
+                count += 1
+                corrupt += payload is None
+        return count, corrupt
+
+    def _repair(self, segment):
+        '''Cut a torn record off the end of segment.'''
+        end = 0
+        for end, payload in self._records(segment, 0):
+            pass
+        if os.path.getsize(self._name(segment)) != end:
+            with open(self._name(segment), 'r+b') as f:
+                f.truncate(end)
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, 'cursor')) as f:
+                cursor = json.load(f)
+            segment, offset = cursor['segment'], cursor['offset']
+        except (OSError, ValueError, KeyError):
+            return self.segments[0], 0
+        if segment < self.segments[0]:
+            return self.segments[0], 0
+        return segment, offset
+
+    def _save_cursor(self):
+        name = os.path.join(self.directory, 'cursor')
+        with open(name + '.tmp', 'w') as f:
+            json.dump({'segment': self.cursor[0], 'offset': self.cursor[1]}, f)
+        os.replace(name + '.tmp', name)
+
+    ###########################################################################
+
+    def append(self, values, stamp=None):
+        '''Add one sample to the end of the spool.'''
+        if stamp is None:
+            stamp = time.time()
+        payload = json.dumps({'time': stamp, 'values': values}, separators=(',', ':')).encode()
+        with self.lock:
+            segment = self.segments[-1]
+            if self.sizes[segment] >= self.segment_bytes:
+                self.file.close()
+                segment += 1
+                self.segments.append(segment)
+                self.sizes[segment] = 0
+                self.file = open(self._name(segment), 'ab')
+            self.file.write(RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.sizes[segment] += RECORD.size + len(payload)
+            self.appended += 1
+            self.pending += 1
+            while sum(self.sizes.values()) > self.max_bytes and len(self.segments) > 1:
+                self._evict()
+
+    def _evict(self):
+        '''Delete the oldest segment, its records that were not forwarded are lost.'''
+        segment = self.segments.pop(0)
+        if segment >= self.cursor[0]:
+            lost = self._count(segment, self.cursor[1] if segment == self.cursor[0] else 0)
+            self.evicted += lost
+            self.pending -= lost
+            self.cursor = (self.segments[0], 0)
+            self._save_cursor()
+        os.remove(self._name(segment))
+        del self.sizes[segment]
+
+    def read(self, count):
+        '''Up to count records from the cursor as (position, records read including corrupt
+           ones, list of dicts). Pass position and the number read to ack() once they are
+           forwarded.'''
+        records = []
+        read = 0
+        with self.lock:
+            self.read_from = self.cursor
+            segment, offset = self.cursor
+            for segment in [s for s in self.segments if s >= self.cursor[0]]:
+                start = offset if segment == self.cursor[0] else 0
+                offset = start
+                for offset, payload in self._records(segment, start):
+                    read += 1
+                    if payload is None:
+                        continue
+                    records.append(json.loads(payload))
+                    if len(records) >= count:
+                        return (segment, offset), read, records
+            return (segment, offset), read, records
+
+    def ack(self, position, read, forwarded):
+        '''The records up to position are done, read of them (forwarded plus corrupt ones).
+           Moves the cursor and deletes the segments that are done.'''
+        with self.lock:
+            if tuple(position) <= tuple(self.cursor):
+                return                  # all of them were evicted meanwhile
+            if self.cursor != self.read_from:
+                # _evict counted the records before the moved cursor, only count the rest
+                read, corrupt = self._between(self.cursor, position)
+                forwarded = read - corrupt
+            self.cursor = position
+            self.forwarded += forwarded
+            self.corrupt += read - forwarded
+            self.pending -= read
+            while len(self.segments) > 1 and self.segments[0] < self.cursor[0]:
+                segment = self.segments.pop(0)
+                os.remove(self._name(segment))
+                del self.sizes[segment]
+            self._save_cursor()
+
+    def backlog(self):
+        '''Records and bytes that were not forwarded yet.'''
+        with self.lock:
+            unsent = sum(size for segment, size in self.sizes.items() if segment > self.cursor[0])
+            unsent += self.sizes.get(self.cursor[0], 0) - self.cursor[1]
+            return {'records': self.pending, 'bytes': unsent, 'segments': len(self.segments)}
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+###############################################################################
+class Forwarder:
+
+    def __init__(self, spool, send, batch=500, retry=1.0, max_retry=60.0):
+        '''Forwards the spool to send(list of {'time', 'values'}) in batches of up to batch
+           records. send raises an exception (or returns False) when the sink is unreachable,
+           the batch is then tried again after retry seconds, doubling up to max_retry.'''
+        self.spool = spool
+        self.send = send
+        self.batch = batch
+        self.retry = retry
+        self.max_retry = max_retry
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+        self.failures = 0
+        self.last_error = ''
+        self.online = True
+        self.rate = 0.0                 # records per second of the recent batches
+        self.batches = 0
+
+    def __call__(self, sample):
+        '''Pipeline sink, spool sample and wake up the forwarding thread.'''
+        self.put(sample.values, sample.stamp)
+
+    def put(self, values, stamp=None):
+        self.spool.append(values, stamp)
+        with self.condition:
+            self.condition.notify()
+
+    def _run(self):
+        delay = self.retry
+        while self.running:
+            position, read, records = self.spool.read(self.batch)
+            if not records:
+                if read:
+                    self.spool.ack(position, read, 0)
+                    continue
+                with self.condition:
+                    if self.running:
+                        self.condition.wait(1.0)
+                continue
+            start = time.monotonic()
+            try:
+                ok = self.send(records) is not False
+                if not ok:
+                    self.last_error = 'send returned False'
+            except Exception as error:
+                ok = False
+                self.last_error = repr(error)
+            if not ok:
+                self.failures += 1
+                self.online = False
+                with self.condition:
+                    self.condition.wait(delay)
+                delay = min(delay * 2, self.max_retry)
+                continue
+            self.spool.ack(position, read, len(records))
+            elapsed = max(time.monotonic() - start, 1e-6)
+            self.rate = len(records) / elapsed if not self.batches else 0.8 * self.rate + 0.2 * len(records) / elapsed
+            self.batches += 1
+            self.online = True
+            delay = self.retry
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='forwarder', daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.running = False
+        with self.condition:
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def close(self):
+        self.stop(10.0)
+        self.spool.close()
+
+    def stats(self):
+        '''Backlog depth, drain rate and counters.'''
+        result = self.spool.backlog()
+        result.update({
+            'online'        : self.online,
+            'drain_rate'    : self.rate,
+            'appended'      : self.spool.appended,
+            'forwarded'     : self.spool.forwarded,
+            'evicted'       : self.spool.evicted,
+            'corrupt'       : self.spool.corrupt,
+            'failures'      : self.failures,
+            'last_error'    : self.last_error,
+            })
+        return result
@@ -0,0 +1,195 @@
+###############################################################################
+#
+#   SQLite storage of UPS samples
+#
+#   python APC_SQLITE.py ups.sqlite ups_log_*.csv       import logger csv files
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, batched inserts in WAL mode, one table per UPS,
+#             importer for the csv files of battery_calibration_log_to_csv.py
+#           - stores of several UPSes in one file can share one connection
+#
+###############################################################################
+#   Tables
+#
+#   samples_<ups>   time REAL (seconds since epoch) and one REAL column per
+#                   field, NULL for the -1/-2 error answers, indexed on time
+#
+#   select datetime(time, 'unixepoch', 'localtime'), battery_capacity
+#       from samples_ups where time > strftime('%s', 'now', '-1 hour')
+#
+###############################################################################
+import csv                          # for the importer
+import os                           # for the shared connections
+import re                           # for table names
+import sqlite3                      # the database
+import threading                    # for the shared connections
+import time                         # for the timestamps
+
+from APC_SMART_UPS import LOG_COLUMNS
+from APC_SMART_UPS import LOG_FIELDS
+
+
+# filename -> [connection, lock, number of stores using it]
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _connect(filename):
+    db = sqlite3.connect(filename, check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+
+###############################################################################
+class SqliteStore:
+
+    def __init__(self, filename, ups='ups', fields=LOG_FIELDS, batch=60, batch_seconds=10.0, shared=False):
+        '''Open or create the database. ups names the table, so several UPSes can share one file.
+           Samples are written in one transaction per batch samples or batch_seconds. With
+           shared all stores of this process on the same file use one connection and take
+           turns, so threads of different UPSes never wait for each other's file lock.'''
+        self.key = None
+        if shared:
+            self.key = os.path.abspath(filename)
+            with _shared_lock:
+                entry = _shared.get(self.key)
+                if entry is None:
+                    entry = _shared[self.key] = [_connect(filename), threading.RLock(), 0]
+                entry[2] += 1
+            self.db, self.lock = entry[0], entry[1]
+        else:
+            self.db, self.lock = _connect(filename), threading.RLock()
+        self.fields = tuple(fields)
+        self.batch = batch
+        self.batch_seconds = batch_seconds
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.table = self.create(ups)
+        placeholders = ','.join('?' * (len(self.fields) + 1))
+        self.insert = 'INSERT INTO %s (time,%s) VALUES (%s)' % (self.table, ','.join(self.fields), placeholders)
+
+    def create(self, ups):
+        '''Create the table of a UPS when it is not there yet, returns its name.'''
+        table = 'samples_' + re.sub(r'\W', '_', ups)
+        columns = ''.join(', %s REAL' % field for field in self.fields)
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS %s (time REAL NOT NULL%s)' % (table, columns))
+            self.db.execute('CREATE INDEX IF NOT EXISTS %s_time ON %s (time)' % (table, table))
+        return table
+
+    def _row(self, stamp, values):
+        row = [stamp]
+        for field in self.fields:
+            value = values.get(field)
+            if value is None or value < 0:
+                value = None
+            row.append(value)
+        return row
+
+    def add(self, values, stamp=None):
+        '''Queue one sample, values is a dict like APC.sample() returns.'''
+        if stamp is None:
+            stamp = time.time()
+        self.pending.append(self._row(stamp, values))
+        if len(self.pending) >= self.batch or time.monotonic() - self.last_flush >= self.batch_seconds:
+            self.flush()
+
+    def sample(self, ups, debug=False):
+        '''Read the fields from ups and add them.'''
+        self.add(ups.sample(self.fields, debug))
+
+    def flush(self):
+        '''Write the queued samples in one transaction.'''
+        if self.pending:
+            with self.lock, self.db:
+                self.db.executemany(self.insert, self.pending)
+            self.pending = []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self.key is None:
+            self.db.close()
+            return
+        with _shared_lock:
+            entry = _shared[self.key]
+            entry[2] -= 1
+            if entry[2] == 0:
+                del _shared[self.key]
+                entry[0].close()
+
+    ###########################################################################
+
+    def import_csv(self, filenames):
+        '''Load csv files of battery_calibration_log_to_csv.py in one transaction. Returns the
+           number of rows. Rows that can not be read are skipped.'''
+        rows = []
+        for filename in filenames:
+            with open(filename, newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader, None)
+                if header is None:
+                    continue
+                index = {name: i for i, name in enumerate(header)}
+                columns = [index.get(name) for name in LOG_COLUMNS]
+                for line in reader:
+                    try:
+                        stamp = time.mktime(time.strptime(line[1] + ' ' + line[2], '%Y-%m-%d %H:%M:%S'))
+                    except (IndexError, ValueError):
+                        continue
+                    values = {}
+                    for field, column in zip(LOG_FIELDS, columns):
+                        try:
+                            values[field] = float(line[column])
+                        except (TypeError, IndexError, ValueError):
+                            values[field] = None
+                    rows.append(self._row(stamp, values))
+        with self.lock, self.db:
+            self.db.executemany(self.insert, rows)
+        return len(rows)
+
+    def range(self, start, end=None, fields=None):
+        '''Samples between start and end (seconds since epoch) as a list of tuples, time first.'''
+        if end is None:
+            end = time.time()
+        fields = fields or self.fields
+        self.flush()
+        with self.lock:
+            return self.db.execute('SELECT time,%s FROM %s WHERE time BETWEEN ? AND ? ORDER BY time'
+                                   % (','.join(fields), self.table), (start, end)).fetchall()
+
+    def transitions(self, field='ups_status', start=0, end=None):
+        '''Changes of field as a list of (time, old value, new value).'''
+        if end is None:
+            end = time.time()
+        self.flush()
+        with self.lock:
+            return self.db.execute(
+                'SELECT time, previous, value FROM ('
+                ' SELECT time, %s AS value, LAG(%s) OVER (ORDER BY time) AS previous'
+                ' FROM %s WHERE time BETWEEN ? AND ? AND %s IS NOT NULL)'
+                ' WHERE previous IS NOT NULL AND previous != value'
+                % (field, field, self.table, field), (start, end)).fetchall()
+
+
+if __name__ == '__main__':
+    import glob
+    import sys
+    if len(sys.argv) < 3:
+        print('usage: python APC_SQLITE.py database.sqlite ups_log_*.csv [--ups name]')
+        sys.exit(2)
+    arguments = sys.argv[1:]
+    name = 'ups'
+    if '--ups' in arguments:
+        position = arguments.index('--ups')
+        name = arguments[position + 1]
+        del arguments[position:position + 2]
+    store = SqliteStore(arguments[0], ups=name)
+    # the Windows shell does not expand wildcards
+    filenames = [filename for pattern in arguments[1:] for filename in sorted(glob.glob(pattern))]
+    print('imported rows', store.import_csv(filenames))
+    store.close()
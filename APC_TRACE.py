@@ -0,0 +1,236 @@
+###############################################################################
+#
+#   Record and replay of the serial traffic with the APC SMART-UPS
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, record a real session once and replay it on a
+#             machine without serial hardware, at original or any speed
+#           - the replay keeps the recorded time between the commands, not
+#             only the response delay
+#           - both ports are not pollable, APC asks them for in_waiting once
+#             per command also when it is instrumented
+#
+###############################################################################
+#   Trace file
+#
+#   magic   b'APCT1\n'
+#   header  '<d'    wall clock time (time.time) of the start of the recording
+#   records '<dcH'  seconds since the start, kind, length, followed by data
+#
+#   kind    w       bytes written to the UPS
+#           i       in_waiting was asked, length is the answer, no data
+#           r       bytes read from the UPS
+#
+#   A recorded command of APC.process_command is one w, one i and one r.
+#
+###############################################################################
+import struct                       # for the binary records
+import time                         # for the timestamps
+
+
+MAGIC   = b'APCT1\n'
+HEADER  = struct.Struct('<d')
+RECORD  = struct.Struct('<dcH')
+
+
+###############################################################################
+class RecordingPort:
+
+    # every in_waiting is a record, see APC._instrumented_command
+    pollable = False
+
+    def __init__(self, port, filename):
+        '''Wrap an open port (serial.Serial or similar) and write all traffic to filename.'''
+        self.port = port
+        self.file = open(filename, 'wb')
+        self.file.write(MAGIC)
+        self.file.write(HEADER.pack(time.time()))
+        self.start = time.monotonic()
+
+    def _record(self, kind, length, data=b''):
+        self.file.write(RECORD.pack(time.monotonic() - self.start, kind, length))
+        if data:
+            self.file.write(data)
+
+    def write(self, data):
+        written = self.port.write(data)
+        self._record(b'w', len(data), bytes(data))
+        return written
+
+    @property
+    def in_waiting(self):
+        waiting = int(self.port.in_waiting)
+        self._record(b'i', waiting)
+        return waiting
+
+    def readinto(self, buffer):
+        count = self.port.readinto(buffer)
+        self._record(b'r', count, bytes(buffer[:count]))
+        return count
+
+    def read(self, size=1):
+        data = self.port.read(size)
+        self._record(b'r', len(data), data)
+        return data
+
+    @property
+    def is_open(self):
+        return self.port.is_open
+
+    def flush(self):
+        '''Push the recorded traffic to disk, the port itself is not touched.'''
+        self.file.flush()
+
+    def close(self):
+        self.port.close()
+        self.file.close()
+
+    def __getattr__(self, name):
+        # everything else (timeout, reset_input_buffer, ...) goes to the real port
+        return getattr(self.port, name)
+
+
+###############################################################################
+def load_trace(filename):
+    '''Read a trace file. Returns (wall clock start, list of (seconds, kind, length, data)).'''
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError('%s is not an APC trace file' % filename)
+    offset = len(MAGIC)
+    (start,) = HEADER.unpack_from(data, offset)
+    offset += HEADER.size
+    records = []
+    while offset + RECORD.size <= len(data):
+        stamp, kind, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if kind == b'i':
+            payload = b''
+        else:
+            payload = data[offset:offset + length]
+            offset += length
+        records.append((stamp, kind, length, payload))
+    return start, records
+
+
+###############################################################################
+class ReplayPort:
+
+    pollable = False
+
+    def __init__(self, filename, speed=1.0):
+        '''Replay a recorded trace. speed 1.0 is original speed, 1000.0 is a thousand times
+           faster, 0 does not sleep at all. Every command and every answer is held back until
+           its recorded time divided by speed, so the gaps between the samples are replayed as
+           well. Writes are checked against the trace, a different command is counted in
+           mismatches but the recorded answer is still returned.'''
+        self.start, self.records = load_trace(filename)
+        self.speed = speed
+        self.index = 0
+        self.now = self.records[0][0] if self.records else 0.0
+        self.is_open = True
+        self.writes = 0
+        self.mismatches = 0
+        self.buffer = b''
+        self.origin = None              # time.monotonic() that matches recorded time 0
+
+    def open(self):
+        self.is_open = True
+        return True
+
+    def finished(self):
+        '''True when all recorded commands are replayed.'''
+        return self.index >= len(self.records)
+
+    def duration(self):
+        '''Length of the recorded session in seconds.'''
+        if not self.records:
+            return 0.0
+        return self.records[-1][0] - self.records[0][0]
+
+    def time(self):
+        '''Wall clock time of the replay position, for timestamping replayed samples.'''
+        return self.start + self.now
+
+    def _pace(self, stamp):
+        '''Sleep until the recorded time stamp is reached at the replay speed.'''
+        if not self.speed:
+            return
+        now = time.monotonic()
+        if self.origin is None:
+            self.origin = now - stamp / self.speed
+        delay = self.origin + stamp / self.speed - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def wait(self, seconds):
+        '''Replacement of the response delay in APC.process_command, waits until the recorded
+           time the answer was asked for.'''
+        index = self._next((b'i',))
+        if index is not None:
+            self._pace(self.records[index][0])
+
+    def _next(self, kinds):
+        '''Index of the next record of one of kinds before the next write, or None.'''
+        index = self.index
+        while index < len(self.records):
+            kind = self.records[index][1]
+            if kind in kinds:
+                return index
+            if kind == b'w':
+                return None
+            index += 1
+        return None
+
+    def write(self, data):
+        # skip whatever was recorded for the previous command but not asked for now
+        while self.index < len(self.records) and self.records[self.index][1] != b'w':
+            self.index += 1
+        if self.finished():
+            return len(data)
+        stamp, kind, length, recorded = self.records[self.index]
+        self._pace(stamp)
+        self.index += 1
+        self.now = stamp
+        self.writes += 1
+        self.buffer = b''
+        if bytes(data) != recorded:
+            self.mismatches += 1
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        index = self._next((b'i',))
+        if index is not None:
+            self.index = index + 1
+            self.now = self.records[index][0]
+            return self.records[index][2]
+        # asked more often than recorded, report what is left for this command
+        index = self.index
+        waiting = len(self.buffer)
+        while index < len(self.records) and self.records[index][1] != b'w':
+            if self.records[index][1] == b'r':
+                waiting += self.records[index][2]
+            index += 1
+        return waiting
+
+    def read(self, size=1):
+        while len(self.buffer) < size:
+            index = self._next((b'r',))
+            if index is None:
+                break
+            self.index = index + 1
+            self.now = self.records[index][0]
+            self.buffer += self.records[index][3]
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.is_open = False
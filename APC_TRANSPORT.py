@@ -0,0 +1,331 @@
+###############################################################################
+#
+#   Transports for the APC SMART-UPS: local serial, TCP serial bridges and an
+#   in-memory loopback
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, APC.serial_open no longer hard codes serial.Serial
+#           - TcpTransport reconnects on write after the peer closed, errors are
+#             OSError
+#           - every transport only takes its own options, see the table below
+#
+###############################################################################
+#   Interface
+#
+#   Every transport offers what APC.process_command uses:
+#
+#   open()              open the connection, returns is_open
+#   close()
+#   is_open             True while open
+#   write(data)         returns the number of bytes written
+#   in_waiting          number of bytes that can be read without blocking
+#   readinto(buffer)    returns the number of bytes read
+#   read(size)          returns bytes
+#   wait(seconds)       the response delay, a transport may shorten it
+#   pollable            optional, False when in_waiting may only be asked once per
+#                       command (a recorded or replayed port), default True
+#
+#   open_transport() picks the implementation from the port name:
+#
+#   COM5, /dev/ttyS0            SerialTransport
+#   tcp://host:port             TcpTransport, raw serial-over-TCP terminal server
+#   rfc2217://host:port         Rfc2217Transport, telnet COM port control
+#   loop://                     LoopbackTransport with a simulated UPS
+#   replay://trace.apct         APC_TRACE.ReplayPort
+#
+#   and passes the options to its constructor, an option that the transport
+#   does not have is a TypeError:
+#
+#   SerialTransport, Rfc2217    baudrate, timeout, write_timeout
+#   TcpTransport                timeout, connect_timeout, read_ahead
+#   LoopbackTransport           responder, size, latency
+#   ReplayPort                  speed
+#
+###############################################################################
+import select                       # for in_waiting on a socket
+import socket                       # for the TCP transport
+import time                         # for sleeping
+
+
+###############################################################################
+class SerialTransport:
+
+    def __init__(self, port, baudrate=2400, timeout=2, write_timeout=None):
+        '''Local RS232 port, the settings of the UPS are 2400 8N1.'''
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.ser = None
+
+    def open(self):
+        import serial                   # for RS232 connection, only loaded when a port is opened
+        self.ser = serial.Serial(
+            port            = self.port,
+            baudrate        = self.baudrate,
+            parity          = serial.PARITY_NONE,
+            stopbits        = serial.STOPBITS_ONE,
+            bytesize        = serial.EIGHTBITS,
+            timeout         = self.timeout,
+            write_timeout   = self.write_timeout
+            )
+        return self.ser.is_open
+
+    def close(self):
+        if self.ser is not None:
+            self.ser.close()
+
+    @property
+    def is_open(self):
+        return self.ser is not None and self.ser.is_open
+
+    def write(self, data):
+        return self.ser.write(data)
+
+    @property
+    def in_waiting(self):
+        return self.ser.in_waiting
+
+    def readinto(self, buffer):
+        return self.ser.readinto(buffer)
+
+    def read(self, size=1):
+        return self.ser.read(size)
+
+    def wait(self, seconds):
+        time.sleep(seconds)
+
+
+###############################################################################
+class Rfc2217Transport(SerialTransport):
+
+    def __init__(self, url, baudrate=2400, timeout=2, write_timeout=None):
+        '''Serial port behind a terminal server that speaks RFC2217, url is rfc2217://host:port.
+           The baudrate and framing are set on the remote port by pyserial.'''
+        SerialTransport.__init__(self, url, baudrate, timeout, write_timeout)
+
+    def open(self):
+        import serial                   # for RS232 connection, only loaded when a port is opened
+        self.ser = serial.serial_for_url(
+            self.port,
+            baudrate        = self.baudrate,
+            parity          = serial.PARITY_NONE,
+            stopbits        = serial.STOPBITS_ONE,
+            bytesize        = serial.EIGHTBITS,
+            timeout         = self.timeout,
+            write_timeout   = self.write_timeout
+            )
+        return self.ser.is_open
+
+
+###############################################################################
+class TcpTransport:
+
+    def __init__(self, host, port, timeout=2, connect_timeout=5, read_ahead=256):
+        '''Raw serial-over-TCP, the terminal server is set to 2400 8N1 itself. Received bytes are
+           collected in a read-ahead buffer of read_ahead bytes, allocated once.'''
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.buffer = bytearray(read_ahead)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.sock = None
+
+    def open(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        self.sock.settimeout(self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.start = self.end = 0
+        return True
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    @property
+    def is_open(self):
+        return self.sock is not None
+
+    def write(self, data):
+        '''Send data, reconnects first when the terminal server closed the connection. Raises
+           OSError (ConnectionError, socket.timeout, ...) when the server can not be reached.'''
+        if self.sock is None:
+            self.open()
+        try:
+            self.sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+        return len(data)
+
+    def _fill(self, block):
+        '''Move whatever the socket has into the read-ahead buffer. Returns False on a closed
+           connection.'''
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buffer):
+            # keep the unread bytes, make room at the end
+            size = self.end - self.start
+            self.buffer[:size] = self.view[self.start:self.end]
+            self.start, self.end = 0, size
+        if self.end == len(self.buffer):
+            return True
+        if not block:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if not readable:
+                return True
+        try:
+            count = self.sock.recv_into(self.view[self.end:])
+        except socket.timeout:
+            return True
+        except OSError:
+            count = 0                   # reset by the peer, same as closed
+        if count == 0:
+            self.close()
+            return False
+        self.end += count
+        return True
+
+    @property
+    def in_waiting(self):
+        if self.sock is not None:
+            self._fill(False)
+        return self.end - self.start
+
+    def readinto(self, buffer):
+        if self.start == self.end and self.sock is not None:
+            self._fill(True)
+        count = min(len(buffer), self.end - self.start)
+        buffer[:count] = self.view[self.start:self.start + count]
+        self.start += count
+        return count
+
+    def read(self, size=1):
+        buffer = bytearray(size)
+        count = self.readinto(buffer)
+        return bytes(buffer[:count])
+
+    def wait(self, seconds):
+        time.sleep(seconds)
+
+
+###############################################################################
+# answers of a healthy Smart-UPS 3000 on-line, used by the loopback transport
+SIMULATED_ANSWERS = {
+    b'Y'    : b'SM\r\n',
+    b'R'    : b'BYE\r\n',
+    b'A'    : b'OK\r\n',
+    b'U'    : b'OK\r\n',
+    b'W'    : b'OK\r\n',
+    b'X'    : b'OK\r\n',
+    b'D'    : b'OK\r\n',
+    b'S'    : b'NA\r\n',
+    b'K'    : b'OK\r\n',
+    b'\x7f' : b'OK\r\n',
+    b'@'    : b'OK\r\n',
+    b'\x0e' : b'OK\r\n',
+    b'G'    : b'O\r\n',
+    b'g'    : b'048\r\n',
+    b'>'    : b'000\r\n',
+    b'f'    : b'100.0\r\n',
+    b'j'    : b'0042:\r\n',
+    b'9'    : b'FF\r\n',
+    b'Q'    : b'08\r\n',
+    b'B'    : b'54.72\r\n',
+    b'C'    : b'031.5\r\n',
+    b'F'    : b'50.00\r\n',
+    b'L'    : b'231.4\r\n',
+    b'M'    : b'233.1\r\n',
+    b'N'    : b'229.0\r\n',
+    b'O'    : b'230.0\r\n',
+    b'P'    : b'012.3\r\n',
+    }
+
+
+class LoopbackTransport:
+
+    def __init__(self, responder=None, size=256, latency=0.0):
+        '''In-process UPS for tests. responder is called with a memoryview of the written command
+           and returns the answer bytes, default is SIMULATED_ANSWERS. Both directions use a
+           buffer of size bytes that is allocated once. latency replaces the response delay.'''
+        self.responder = responder
+        self.latency = latency
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.command = bytearray(size)
+        self.command_view = memoryview(self.command)
+        self.start = 0
+        self.end = 0
+        self.is_open = False
+
+    def open(self):
+        self.start = self.end = 0
+        self.is_open = True
+        return True
+
+    def close(self):
+        self.is_open = False
+
+    def respond(self, command):
+        '''Default responder, answers from SIMULATED_ANSWERS on the first character.'''
+        return SIMULATED_ANSWERS.get(bytes(command[:1]), b'')
+
+    def write(self, data):
+        size = len(data)
+        self.command_view[:size] = data
+        command = self.command_view[:size]
+        if self.responder is None:
+            answer = self.respond(command)
+        else:
+            answer = self.responder(command)
+        if answer:
+            if self.end + len(answer) > len(self.buffer):
+                # unread answers are dropped like an overflowing UART would
+                self.start = self.end = 0
+            self.view[self.end:self.end + len(answer)] = answer
+            self.end += len(answer)
+        return size
+
+    @property
+    def in_waiting(self):
+        return self.end - self.start
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.end - self.start)
+        buffer[:count] = self.view[self.start:self.start + count]
+        self.start += count
+        if self.start == self.end:
+            self.start = self.end = 0
+        return count
+
+    def read(self, size=1):
+        buffer = bytearray(size)
+        count = self.readinto(buffer)
+        return bytes(buffer[:count])
+
+    def wait(self, seconds):
+        if self.latency:
+            time.sleep(self.latency)
+
+
+###############################################################################
+def open_transport(name, **options):
+    '''Create the transport for a port name, options go to its constructor. The transport is not
+       opened yet.'''
+    if name.startswith('tcp://'):
+        host, _, port = name[len('tcp://'):].rstrip('/').rpartition(':')
+        return TcpTransport(host, int(port), **options)
+    if name.startswith('rfc2217://'):
+        return Rfc2217Transport(name, **options)
+    if name.startswith('loop://'):
+        return LoopbackTransport(**options)
+    if name.startswith('replay://'):
+        from APC_TRACE import ReplayPort
+        return ReplayPort(name[len('replay://'):], **options)
+    return SerialTransport(name, **options)
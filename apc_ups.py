@@ -0,0 +1,137 @@
+###############################################################################
+#
+#   Command line access to the APC SMART-UPS
+#
+#   python apc_ups.py status --field battery_capacity
+#   python apc_ups.py status --field line_voltage --field load_power --timing
+#
+###############################################################################
+#
+#   2026 - October
+#           - first version, meant for cron jobs and shutdown hooks
+#           - values of a daemon older than --max-age are not used
+#           - the port is closed also when reading fails
+#
+###############################################################################
+#   Fast path
+#
+#   1. ask a running daemon for its cached values over the local socket
+#   2. only if there is none, or its values are older than --max-age seconds
+#      (the daemon lost the UPS), open the serial port (pyserial is imported here)
+#   3. ask the UPS directly, Y (smart mode) is only sent when it does not answer
+#
+###############################################################################
+import time                         # for the startup-to-answer timing
+START = time.perf_counter()
+
+import argparse                     # for the command line
+import sys
+
+
+def socket_address(text):
+    '''host:port of the --socket option, the port defaults to the one of the daemon.'''
+    from APC_LOCAL_SOCKET import DEFAULT_ADDRESS
+    host, colon, tcpport = text.rpartition(':')
+    if not colon:
+        return text, DEFAULT_ADDRESS[1]
+    try:
+        return host or DEFAULT_ADDRESS[0], int(tcpport)
+    except ValueError:
+        raise argparse.ArgumentTypeError('%r is not host:port' % text)
+
+
+def read_from_daemon(fields, address, timeout, max_age):
+    '''Values from a running daemon, None when there is none or its values are older than
+       max_age seconds.'''
+    from APC_LOCAL_SOCKET import query
+    answer = query(fields, address, timeout)
+    if answer is None:
+        return None
+    try:
+        age = time.time() - float(answer.get('time', 0.0))
+    except (TypeError, ValueError):
+        return None
+    if age > max_age:
+        print('daemon values are %.0f s old, asking the UPS' % age, file=sys.stderr)
+        return None
+    values = answer['values']
+    if any(field not in values for field in fields):
+        return None
+    return values
+
+
+def read_from_ups(fields, port, debug):
+    '''Values read from the UPS itself, None when the port does not open.'''
+    from APC_SMART_UPS import APC
+    ups = APC(port)
+    try:
+        if not ups.serial_open():
+            return None
+    except Exception as error:
+        print('can not open', port, error, file=sys.stderr)
+        return None
+    values = {}
+    smart = False
+    try:
+        for field in fields:
+            value = getattr(ups, field)(debug)
+            if value < 0 and not smart:
+                # no valid answer, the UPS is probably not in smart mode yet
+                smart = True
+                ups.set_ups_to_smart_mode(debug)
+                value = getattr(ups, field)(debug)
+            values[field] = value
+    finally:
+        # also after an error, an open port would block the next call
+        ups.serial_close()
+    return values
+
+
+def status(args):
+    '''The status command.'''
+    from APC_SMART_UPS import FIELDS
+    fields = args.field or ['line_voltage', 'load_power', 'battery_capacity', 'ups_status']
+    for field in fields:
+        if field not in FIELDS:
+            print('unknown field', field, file=sys.stderr)
+            return 2
+    values = None
+    source = 'daemon'
+    if not args.no_daemon:
+        values = read_from_daemon(fields, args.socket, args.socket_timeout, args.max_age)
+    if values is None:
+        source = 'ups'
+        values = read_from_ups(fields, args.port, args.debug)
+    if values is None:
+        return 1
+    if len(fields) == 1:
+        print(values[fields[0]])
+    else:
+        for field in fields:
+            print(field, values[field])
+    if args.timing:
+        print('answer from %s in %.3f s' % (source, time.perf_counter() - START), file=sys.stderr)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='apc-ups', description='APC Smart-UPS command line')
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('status', help='read values from the UPS')
+    command.add_argument('--field', action='append', help='value to read, can be repeated')
+    command.add_argument('--port', default='COM5', help='serial port of the UPS')
+    command.add_argument('--socket', type=socket_address, default='127.0.0.1:47310',
+                         help='address of a running daemon, host or host:port')
+    command.add_argument('--socket-timeout', type=float, default=0.2)
+    command.add_argument('--max-age', type=float, default=60.0,
+                         help='seconds after which the values of the daemon are too old')
+    command.add_argument('--no-daemon', action='store_true', help='always ask the UPS itself')
+    command.add_argument('--timing', action='store_true', help='print startup-to-answer time')
+    command.add_argument('--debug', action='store_true')
+    command.set_defaults(handler=status)
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
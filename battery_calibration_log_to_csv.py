@@ -1,9 +1,17 @@
 import sys
-import time
 from datetime import date
 from datetime import datetime
 
 from APC_SMART_UPS import APC as apc
+from APC_SMART_UPS import LOG_FIELDS
+from APC_CALIBRATION import CalibrationSession
+from APC_CALIBRATION import RUNNING
+from APC_PIPELINE import COALESCE
+from APC_PIPELINE import CsvSink
+from APC_PIPELINE import Pipeline
+from APC_PIPELINE import print_sink
+from APC_SCHEDULER import FixedRateScheduler
+from APC_TRACE import RecordingPort
 
 debug = False
 # debug = True
@@ -11,6 +19,13 @@ debug = False
 do_cal = False
 # do_cal = True
 
+# seconds between samples, one sample takes about 4 seconds (8 commands of 0.5 second)
+period = 5
+
+# record all serial traffic next to the csv file, replay it with replay_benchmark.py
+record = False
+# record = True
+
 print('\n\n')
 print('#'*80)
 print('APC Smart-UPS interface demo')
@@ -29,48 +44,36 @@ filename += str(date.today()) + '_'
 filename += str(str(datetime.now().time()).split('.')[0]).replace(':','-')
 filename += '.csv'
 
-header = ''
-header += 'counter,'
-header += 'date,'
-header += 'time,'
-header += 'line voltage,'
-header += 'output voltage,'
-header += 'ups and utility frequency,'
-header += 'load power,'
-header += 'battery capacity,'
-header += 'battery voltage,'
-header += 'ups internal temperature,'
-header += 'ups internal status,'
-f = open(filename, 'w')
-f.write(header + '\n')
-f.close()
+# writing and printing run in their own threads, a slow disk or console does not delay sampling
+pipeline = Pipeline()
+pipeline.add_sink('csv', CsvSink(filename))
+pipeline.add_sink('print', print_sink, capacity=1, policy=COALESCE)
+pipeline.start()
+
+if record:
+    ups.ser = RecordingPort(ups.ser, filename.replace('.csv', '.apct'))
 
 
 counter = 0
+calibration = None
+scheduler = FixedRateScheduler(period)
+
+for tick in scheduler:
+    # the calibration session owns the UPS while it runs, its capture has the dense values
+    if (calibration is None) or (calibration.state != RUNNING):
+        # one timestamp per sample, taken before the first command
+        pipeline.put(ups.sample(LOG_FIELDS, debug), tick.stamp)
+
+    if tick.missed:
+        print('sample took too long, missed', tick.missed, 'ticks', scheduler.report())
 
-while True:
-    dataline = ''
-    dataline += str(counter) + ','
-    dataline += str(date.today()) + ','
-    dataline += str(datetime.now().time()).split('.')[0] + ','
-    dataline += str(ups.line_voltage(debug)) + ','
-    dataline += str(ups.output_voltage(debug)) + ','
-    dataline += str(ups.ups_and_utility_operating_frequency(debug)) + ','
-    dataline += str(ups.load_power(debug)) + ','
-    dataline += str(ups.battery_capacity(debug)) + ','
-    dataline += str(ups.battery_voltage(debug)) + ','
-    dataline += str(ups.ups_internal_temperature(debug)) + ','
-    dataline += str(ups.ups_status(debug)) + ','
-
-    f = open(filename, 'a')
-    f.write(dataline + '\n')
-    f.close()
-
-    print(dataline)
+    if record:
+        ups.ser.flush()
 
     if (counter == 2) and (do_cal == True):
-        ups.run_time_calibration(True)
+        # checks the preconditions, captures densely and aborts on the limits, see APC_CALIBRATION
+        calibration = CalibrationSession(ups, debug=True)
+        print('run time calibration', calibration.start())
     
     counter += 1
-    time.sleep(1)
 
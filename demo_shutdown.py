@@ -0,0 +1,34 @@
+import time
+
+from APC_SMART_UPS import APC as apc
+from APC_SHUTDOWN import ShutdownSequencer
+
+debug = False
+# debug = True
+
+print('\n\n')
+print('#'*80)
+print('APC Smart-UPS shutdown sequencer demo')
+print('#'*80)
+
+
+ups = apc('COM5')
+print('open serial port', ups.serial_open())
+print('set ups to smart mode', ups.set_ups_to_smart_mode(debug))
+
+sequencer = ShutdownSequencer(ups, debug=debug)
+
+print('turn off after delay', sequencer.turn_off_after_delay())
+# print('turn ups off', sequencer.turn_off_ups())
+# print('shut down on battery', sequencer.shut_down_ups_on_battery())
+# print('shut down, wake up after 0.5 hour', sequencer.shut_down_with_delayed_wake_up(5))
+
+# the monitoring keeps running, commands are refused while the sequence owns the UPS
+while sequencer.busy():
+    print(sequencer.state, 'battery capacity', ups.battery_capacity(debug))
+    time.sleep(0.5)
+print('sequence', sequencer.name, sequencer.state, sequencer.result)
+
+# print('abort shutdown', sequencer.abort())
+
+print('#'*80)
@@ -0,0 +1,51 @@
+###############################################################################
+#
+#   Replay a recorded UPS session and measure parsing, event detection and
+#   logging throughput, no serial hardware needed
+#
+#   python replay_benchmark.py ups_log_2024-08-01_12-00-00.apct
+#   python replay_benchmark.py trace.apct --speed 1
+#
+###############################################################################
+import argparse
+import io
+import time
+
+from APC_SMART_UPS import APC as apc
+from APC_SMART_UPS import LOG_FIELDS
+from APC_TRACE import ReplayPort
+
+
+parser = argparse.ArgumentParser(description='replay a recorded APC trace')
+parser.add_argument('trace')
+parser.add_argument('--speed', type=float, default=0.0, help='1 is original speed, 0 is as fast as possible')
+args = parser.parse_args()
+
+ups = apc('replay')
+ups.ser = ReplayPort(args.trace, args.speed)
+
+out = io.StringIO()
+samples = 0
+events = 0
+status = None
+start = time.perf_counter()
+while not ups.ser.finished():
+    stamp = time.strftime('%Y-%m-%d,%H:%M:%S', time.localtime(ups.ser.time()))
+    values = [getattr(ups, field)() for field in LOG_FIELDS]
+    # event detection, a change of the status byte
+    if values[-1] != status:
+        events += 1
+        status = values[-1]
+    out.write(str(samples) + ',' + stamp + ',' + ','.join(str(v) for v in values) + ',\n')
+    samples += 1
+elapsed = time.perf_counter() - start
+
+print('samples           ', samples)
+print('status changes    ', events)
+print('commands          ', ups.ser.writes)
+print('mismatches        ', ups.ser.mismatches)
+print('recorded duration  %.1f s' % ups.ser.duration())
+print('replay duration    %.3f s' % elapsed)
+if elapsed > 0:
+    print('samples per second %.0f' % (samples / elapsed))
+    print('times real time    %.0f' % (ups.ser.duration() / elapsed))
@@ -0,0 +1,46 @@
+###############################################################################
+#
+#   Anomaly detection on synthetic series, see APC_ANOMALY
+#
+###############################################################################
+import unittest
+
+from APC_ANOMALY import AnomalyDetector
+from APC_ANOMALY import NORMAL
+
+
+def feed(detector, temperature, hours, stamp, period=60.0):
+    '''Feed a constant temperature for hours, returns the events and the next stamp.'''
+    events = []
+    for _ in range(int(hours * 3600 / period)):
+        events += detector.update({'ups_internal_temperature': temperature}, stamp)
+        stamp += period
+    return events, stamp
+
+
+class TemperatureTest(unittest.TestCase):
+
+    def test_drop_is_learned_and_rise_reported(self):
+        detector = AnomalyDetector()
+        events, stamp = feed(detector, 30.0, 48, 0.0)
+        self.assertEqual(events, [])
+        events, stamp = feed(detector, 25.0, 48, stamp)
+        self.assertEqual(events, [])
+        series = detector.temperature
+        self.assertEqual(series.state, NORMAL)
+        self.assertAlmostEqual(series.mean, 25.0, places=1)
+        self.assertEqual(series.low, 0.0)
+        events, stamp = feed(detector, 29.5, 2, stamp)
+        self.assertEqual([event.kind for event in events], ['temperature_rise'])
+        self.assertAlmostEqual(events[0].baseline, 25.0, places=1)
+
+    def test_fixed_limit(self):
+        detector = AnomalyDetector(max_temperature=45.0)
+        events, stamp = feed(detector, 46.0, 0.1, 0.0)
+        self.assertEqual([event.kind for event in events], ['temperature_high'])
+        events, stamp = feed(detector, 40.0, 0.1, stamp)
+        self.assertEqual([(event.kind, event.end is not None) for event in events], [('temperature_high', True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
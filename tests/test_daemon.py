@@ -0,0 +1,72 @@
+###############################################################################
+#
+#   Reload of the daemon configuration, see APC_DAEMON
+#
+###############################################################################
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from APC_DAEMON import Daemon
+from APC_DAEMON import load_config
+
+
+class ReloadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'apc_daemon.json')
+        self.daemon = Daemon(self.filename)
+
+    def tearDown(self):
+        self.daemon.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self, **rack1):
+        unit = {'port': 'loop://', 'period': 0.5, 'fields': ['line_voltage'], 'sinks': ['csv']}
+        unit.update(rack1)
+        config = {
+            'units': {'rack1': unit},
+            'sinks': {'csv': {'type': 'csv', 'filename': os.path.join(self.directory, '{unit}.csv')},
+                      'broken': {'type': 'csv', 'filename': os.path.join(self.directory, 'none', '{unit}.csv')}},
+            }
+        with open(self.filename, 'w') as f:
+            json.dump(config, f)
+
+    def test_bad_detector_option_keeps_old_worker(self):
+        self.write()
+        self.assertTrue(self.daemon.reload())
+        worker = self.daemon.workers['rack1']
+        self.write(anomaly={'bogus': 1})
+        self.assertTrue(self.daemon.reload())
+        self.assertIs(self.daemon.workers['rack1'], worker)
+        self.assertTrue(worker.thread.is_alive())
+        self.write(anomaly={'interval': 30.0})
+        self.daemon.reload()
+        self.assertIsNot(self.daemon.workers['rack1'], worker)
+        self.assertEqual(len(self.daemon.workers['rack1'].detectors), 1)
+
+    def test_sink_that_does_not_open_goes_back(self):
+        self.write()
+        self.daemon.reload()
+        worker = self.daemon.workers['rack1']
+        self.write(sinks=['broken'])
+        self.assertEqual(self.daemon.apply(load_config(self.filename)),
+                         ([], [], [], ['rack1']))
+        running = self.daemon.workers['rack1']
+        self.assertTrue(running.thread.is_alive())
+        self.assertEqual(running.settings, worker.settings)
+
+    def test_bad_new_unit_is_not_started(self):
+        self.write(power_quality={'nominal': 230})
+        self.assertTrue(self.daemon.reload())
+        self.assertEqual(self.daemon.workers, {})
+        self.write()
+        self.daemon.reload()
+        self.assertIn('rack1', self.daemon.workers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+###############################################################################
+#
+#   Shutdown fan-out against local stand-in listeners, see APC_FANOUT
+#
+###############################################################################
+import socket
+import threading
+import time
+import unittest
+
+from APC_FANOUT import ACKNOWLEDGED
+from APC_FANOUT import FanOut
+from APC_FANOUT import ShutdownTrigger
+from APC_FANOUT import Target
+from APC_SMART_UPS import STATUS_LOW_BATTERY
+from APC_SMART_UPS import STATUS_ON_BATTERY
+
+
+class Listener:
+
+    def __init__(self, delay, answer=b'OK\n'):
+        '''A protected host that acknowledges after delay seconds.'''
+        self.delay = delay
+        self.answer = answer
+        self.received = []
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(8)
+        self.address = self.server.getsockname()
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                self.received.append(conn.recv(256))
+                time.sleep(self.delay)
+                conn.sendall(self.answer)
+
+    def close(self):
+        self.running = False
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+
+
+class FanOutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listeners = [Listener(delay) for delay in (0.1, 0.5, 1.0)]
+
+    def tearDown(self):
+        for listener in self.listeners:
+            listener.close()
+
+    def test_parallel_group(self):
+        targets = [Target('host%d' % i, address=listener.address, timeout=5.0)
+                   for i, listener in enumerate(self.listeners)]
+        report = FanOut(targets).run()
+        self.assertEqual(report['acknowledged'], ['host0', 'host1', 'host2'])
+        self.assertEqual(report['failed'], [])
+        for listener in self.listeners:
+            self.assertEqual(listener.received, [b'shutdown\n'])
+        # the hosts are contacted at the same time, the group takes as long as the slowest
+        self.assertGreaterEqual(report['elapsed'], 1.0)
+        self.assertLess(report['elapsed'], 1.5)
+
+    def test_groups_in_order_and_failure(self):
+        closed = socket.socket()
+        closed.bind(('127.0.0.1', 0))
+        address = closed.getsockname()
+        closed.close()                  # nobody listens there
+        targets = [
+            Target('app', address=self.listeners[1].address, group=0),
+            Target('gone', address=address, group=0, timeout=1.0, retries=1),
+            Target('storage', address=self.listeners[0].address, group=1),
+            ]
+        report = FanOut(targets).run()
+        self.assertEqual(report['acknowledged'], ['app', 'storage'])
+        self.assertEqual(report['failed'], ['gone'])
+        states = {result['name']: result['state'] for result in report['results']}
+        self.assertEqual(states['app'], ACKNOWLEDGED)
+        self.assertGreaterEqual(report['elapsed'], 0.6)
+
+    def test_trigger(self):
+        fanout = FanOut([Target('host0', address=self.listeners[0].address)])
+        trigger = ShutdownTrigger(fanout)
+        self.assertFalse(trigger.check({'ups_status_byte': STATUS_ON_BATTERY, 'estimated_runtime': 10}))
+        values = {'ups_status_byte': STATUS_ON_BATTERY | STATUS_LOW_BATTERY, 'estimated_runtime': 3}
+        self.assertTrue(trigger.check(values))
+        self.assertFalse(trigger.check(values))
+        report = trigger.wait(5.0)
+        self.assertEqual(report['acknowledged'], ['host0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
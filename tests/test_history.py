@@ -0,0 +1,60 @@
+###############################################################################
+#
+#   Window statistics of the in-memory history, see APC_HISTORY
+#
+###############################################################################
+import random
+import unittest
+
+from APC_HISTORY import History
+
+
+def percentile(data, p):
+    data = sorted(data)
+    rank = (len(data) - 1) * p / 100.0
+    low = int(rank)
+    high = min(low + 1, len(data) - 1)
+    return data[low] + (data[high] - data[low]) * (rank - low)
+
+
+class HistoryTest(unittest.TestCase):
+
+    def test_exact_values(self):
+        history = History(('battery_voltage', 'line_voltage'), capacity=100)
+        history.add({'battery_voltage': 54.72, 'line_voltage': 231.4}, 1.0)
+        history.add({'battery_voltage': -1, 'line_voltage': 229.9}, 2.0)
+        self.assertEqual(history.values('battery_voltage'), [54.72])
+        self.assertEqual(history.values('line_voltage'), [231.4, 229.9])
+        self.assertEqual(history.latest('battery_voltage'), (None, 2.0))
+        self.assertEqual(history.latest('line_voltage'), (229.9, 2.0))
+        self.assertEqual(history.minimum('line_voltage'), 229.9)
+        self.assertEqual(history.percentile('line_voltage', 100), 231.4)
+
+    def test_windows_against_brute_force(self):
+        generator = random.Random(7)
+        history = History(('line_voltage',), capacity=1024)
+        stored = []
+        for n in range(2500):                       # wraps the ring more than twice
+            value = round(generator.gauss(230.0, 3.0), 1) if generator.random() > 0.05 else -1
+            history.add({'line_voltage': value}, float(n))
+            stored.append(value)
+            if n % 97 or n < 10:
+                continue
+            for seconds in (5, 63, 64, 130, 1000, None):
+                span = stored[-(seconds or 1024):]
+                data = [value for value in span if value >= 0]
+                self.assertEqual(history.count('line_voltage', seconds), len(data))
+                self.assertAlmostEqual(history.mean('line_voltage', seconds), sum(data) / len(data), places=9)
+                self.assertEqual(history.minimum('line_voltage', seconds), min(data))
+                self.assertEqual(history.maximum('line_voltage', seconds), max(data))
+                for p in (0, 10, 50, 90, 99, 100):
+                    self.assertAlmostEqual(history.percentile('line_voltage', p, seconds),
+                                           percentile(data, p), places=9)
+
+    def test_footprint(self):
+        history = History()
+        self.assertLess(history.nbytes(), 4 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+###############################################################################
+#
+#   Instrumentation with recorded ports and concurrent callers, see
+#   APC_INSTRUMENT
+#
+###############################################################################
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from APC_INSTRUMENT import Instrumentation
+from APC_SMART_UPS import APC
+from APC_TRACE import RecordingPort
+from APC_TRACE import ReplayPort
+from APC_TRACE import load_trace
+from APC_TRANSPORT import LoopbackTransport
+
+
+FIELDS = ('line_voltage', 'battery_capacity', 'load_power')
+
+
+class RecordedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.trace = os.path.join(self.directory, 'session.apct')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_instrumented_recording_replays(self):
+        port = LoopbackTransport(latency=0.001)
+        port.open()
+        ups = APC(RecordingPort(port, self.trace))
+        ups.serial_open()
+        Instrumentation().attach(ups)
+        recorded = [ups.sample(FIELDS) for _ in range(3)]
+        ups.serial_close()
+        kinds = [record[1] for record in load_trace(self.trace)[1]]
+        self.assertEqual(kinds, [b'w', b'i', b'r'] * 9)
+        ups = APC(ReplayPort(self.trace, 0))
+        ups.serial_open()
+        events = []
+        Instrumentation(callback=events.append).attach(ups)
+        self.assertEqual([ups.sample(FIELDS) for _ in range(3)], recorded)
+        commands = [event for event in events if event['kind'] == 'command']
+        self.assertEqual([event['result'] for event in commands], ['ok'] * 9)
+        self.assertTrue(all(event['first_byte'] is None for event in commands))
+
+
+class AttemptTest(unittest.TestCase):
+
+    def test_attempts_per_thread(self):
+        gate = threading.Barrier(2)
+
+        def responder(command):
+            if bytes(command) == b'Q':
+                return b'\r\n'          # too short, ups_status_byte tries again
+            return b'231.4\r\n'
+
+        ups = APC(LoopbackTransport(responder, latency=0.005))
+        ups.serial_open()
+        events = []
+        Instrumentation(callback=events.append).attach(ups)
+
+        def status():
+            gate.wait()
+            ups.ups_status_byte()
+
+        def voltage():
+            gate.wait()
+            for _ in range(5):
+                ups.line_voltage()
+
+        threads = [threading.Thread(target=status), threading.Thread(target=voltage)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        attempts = [event['attempt'] for event in events if event['kind'] == 'command' and event['command'] == 'Q']
+        self.assertEqual(attempts, [0, 1, 2])
+        voltages = [event['attempt'] for event in events if event['kind'] == 'command' and event['command'] == 'L']
+        self.assertEqual(voltages, [0] * 5)
+        parse = {event['field']: event['attempts'] for event in events if event['kind'] == 'parse'}
+        self.assertEqual(parse, {'ups_status_byte': 3, 'line_voltage': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+###############################################################################
+#
+#   Power quality events from synthetic polls, see APC_POWER_QUALITY
+#
+###############################################################################
+import unittest
+
+from APC_POWER_QUALITY import CRITICAL
+from APC_POWER_QUALITY import PowerQualityDetector
+
+
+def run(voltages, minimums=None, maximums=None, period=5.0):
+    '''Feed one poll per voltage, minimums and maximums are the extremes of the UPS since the
+       previous poll (default the voltage itself). Returns all closed events.'''
+    detector = PowerQualityDetector()
+    events = []
+    for n, voltage in enumerate(voltages):
+        values = {
+            'line_voltage'          : voltage,
+            'minimum_line_voltage'  : minimums[n] if minimums else voltage,
+            'maximum_line_voltage'  : maximums[n] if maximums else voltage,
+            }
+        events += detector.update(values, n * period)
+    return events
+
+
+class VoltageTest(unittest.TestCase):
+
+    def test_outage_is_one_event(self):
+        events = run([230.0, 0.0, 0.0, 0.0, 230.0, 230.0])
+        self.assertEqual([(event.kind, event.start, event.end) for event in events], [('outage', 5.0, 20.0)])
+        self.assertEqual(events[0].severity, CRITICAL)
+
+    def test_sag_then_outage(self):
+        events = run([230.0, 200.0, 0.0, 0.0, 230.0], minimums=[230.0, 200.0, 0.0, 0.0, 0.0])
+        self.assertEqual([(event.kind, event.start, event.end) for event in events],
+                         [('sag', 5.0, 10.0), ('outage', 10.0, 20.0)])
+
+    def test_sag_gets_the_extreme_between_polls(self):
+        events = run([230.0, 200.0, 205.0, 230.0], minimums=[230.0, 180.0, 205.0, 205.0])
+        self.assertEqual([(event.kind, event.extreme) for event in events], [('sag', 180.0)])
+
+    def test_short_sag_between_polls(self):
+        events = run([230.0, 230.0, 230.0], minimums=[230.0, 190.0, 230.0])
+        self.assertEqual([(event.kind, event.source, event.start, event.end) for event in events],
+                         [('sag', 'interval', 0.0, 5.0)])
+
+    def test_swell(self):
+        events = run([230.0, 260.0, 230.0], maximums=[230.0, 270.0, 260.0])
+        self.assertEqual([(event.kind, event.extreme) for event in events], [('swell', 270.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+###############################################################################
+#
+#   Consolidation and durability of the rollup store, see APC_ROLLUP
+#
+###############################################################################
+import shutil
+import tempfile
+import unittest
+
+from APC_ROLLUP import SEGMENT
+from APC_ROLLUP import RollupStore
+
+
+ARCHIVES = ((1, 4 * SEGMENT), (60, 100), (3600, 10))
+START = 1800000000.0                # a whole hour
+
+
+def feed(store, start, seconds):
+    '''One sample per second, the line voltage goes 200, 201, ... 259 within every minute.'''
+    for second in range(seconds):
+        stamp = start + second
+        store.add({'line_voltage': 200.0 + second % 60, 'load_power': -1}, stamp)
+
+
+class RollupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def store(self, flush_every=60.0):
+        return RollupStore(self.path, ('line_voltage', 'load_power'), ARCHIVES, flush_every)
+
+    def test_consolidation(self):
+        store = self.store()
+        feed(store, START, 2 * 3600 + 1)
+        step, rows = store.query('line_voltage', START + 3600, START + 2 * 3600 - 1, step=60)
+        self.assertEqual(step, 60)
+        self.assertEqual(len(rows), 60)
+        for bucket, low, average, high, count in rows:
+            self.assertEqual(bucket % 60, 0)
+            self.assertEqual((low, high, count), (200.0, 259.0, 60))
+            self.assertAlmostEqual(average, 229.5, places=3)
+        step, rows = store.query('line_voltage', START, START + 3600, step=3600)
+        self.assertEqual(step, 3600)
+        self.assertEqual([(row[0], row[1], row[3], row[4]) for row in rows],
+                         [(START, 200.0, 259.0, 3600), (START + 3600, 200.0, 259.0, 3600)])
+        # the error answers of load_power were never counted
+        self.assertEqual(store.query('load_power', START, START + 7200, step=60)[1], [])
+        store.close()
+
+    def test_closed_segments(self):
+        store = self.store()
+        feed(store, START, 3 * SEGMENT + 10)
+        store.close()
+        step, rows = self.store().query('line_voltage', START, START + 3 * SEGMENT, step=1)
+        self.assertEqual(step, 1)
+        self.assertEqual([row[0] for row in rows], [START + second for second in range(3 * SEGMENT + 1)])
+
+    def test_crash_loses_nothing_written(self):
+        store = self.store(flush_every=0.0)
+        feed(store, START, 5400)                    # an hour and a half, no close()
+        store = self.store(flush_every=0.0)         # as after kill -9
+        feed(store, START + 5400, 1801)             # the first sample of the third hour closes the second
+        store.close()
+        step, rows = self.store().query('line_voltage', START, START + 3600, step=3600)
+        self.assertEqual([(row[0], row[4]) for row in rows], [(START, 3600), (START + 3600, 3600)])
+
+    def test_choose(self):
+        store = self.store()
+        self.assertEqual(store.choose(START, START + 600, step=60).step, 60)
+        self.assertEqual(store.choose(START, START + 600, step=1).step, 1)
+        # the minute archive holds 100 minutes, an older start needs the hour archive
+        self.assertEqual(store.choose(START - 86400, START, step=60).step, 3600)
+        store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
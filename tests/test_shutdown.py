@@ -0,0 +1,145 @@
+###############################################################################
+#
+#   Timing and refusals of the shutdown sequences on the loopback transport,
+#   see APC_SHUTDOWN
+#
+###############################################################################
+import threading
+import time
+import unittest
+
+from APC_SHUTDOWN import ABORTED
+from APC_SHUTDOWN import DONE
+from APC_SHUTDOWN import FAILED
+from APC_SHUTDOWN import WAITING
+from APC_SHUTDOWN import ShutdownSequencer
+from APC_SMART_UPS import APC
+from APC_TRANSPORT import LoopbackTransport
+from APC_TRANSPORT import SIMULATED_ANSWERS
+
+
+GAP = 1.6
+
+
+class SimulatedUps:
+
+    def __init__(self, first=b'', second=b'OK\r\n'):
+        '''Answers first to the first character of a two step command and second to the repeat,
+           everything else from SIMULATED_ANSWERS. Keeps (time, command) of every command.'''
+        self.first = first
+        self.second = second
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def __call__(self, command):
+        command = bytes(command)
+        with self.lock:
+            repeat = bool(self.commands) and self.commands[-1][1] == command
+            self.commands.append((time.monotonic(), command))
+        if command in (b'K', b'Z', b'\x0e'):
+            return self.second if repeat else self.first
+        return SIMULATED_ANSWERS.get(command[:1], b'')
+
+    def sent(self):
+        return [command for _, command in self.commands]
+
+
+class SequencerTest(unittest.TestCase):
+
+    def ups(self, **answers):
+        self.simulated = SimulatedUps(**answers)
+        ups = APC(LoopbackTransport(self.simulated))
+        ups.serial_open()
+        return ups
+
+    def two_step(self, method, character):
+        ups = self.ups()
+        sequencer = ShutdownSequencer(ups, gap=GAP)
+        self.assertEqual(getattr(sequencer, method)(), 0)
+        self.assertEqual(sequencer.state, WAITING)
+        # other callers are held off while the token is out, the port is not touched
+        self.assertEqual(ups.process_command([ord('L')]), [-3])
+        self.assertLess(ups.line_voltage(), 0)
+        self.assertEqual(sequencer.wait(5.0), 0)
+        self.assertEqual(sequencer.state, DONE)
+        self.assertEqual(self.simulated.sent(), [character, character])
+        gap = self.simulated.commands[1][0] - self.simulated.commands[0][0]
+        self.assertGreaterEqual(gap, GAP)
+        self.assertLess(gap, GAP + 0.5)
+        # polling works again
+        self.assertIsNone(ups.exclusive)
+        self.assertEqual(ups.line_voltage(), 231.4)
+
+    def test_turn_off_after_delay(self):
+        self.two_step('turn_off_after_delay', b'K')
+
+    def test_turn_off_ups(self):
+        self.two_step('turn_off_ups', b'Z')
+
+    def test_turn_ups_on(self):
+        self.two_step('turn_ups_on', b'\x0e')
+
+    def test_turn_off_without_answer(self):
+        # the UPS turns off at once and does not always answer the second Z
+        sequencer = ShutdownSequencer(self.ups(second=b''), gap=GAP)
+        sequencer.turn_off_ups()
+        self.assertEqual(sequencer.wait(5.0), 0)
+        self.assertEqual(sequencer.state, DONE)
+
+    def test_abort_while_waiting(self):
+        ups = self.ups()
+        sequencer = ShutdownSequencer(ups, gap=GAP)
+        sequencer.turn_off_after_delay()
+        self.assertEqual(sequencer.abort(), 0)
+        self.assertEqual(sequencer.state, ABORTED)
+        self.assertIsNone(ups.exclusive)
+        self.assertEqual(ups.line_voltage(), 231.4)
+        time.sleep(GAP + 0.3)
+        # the second K never went out
+        self.assertEqual(self.simulated.sent(), [b'K', b'L'])
+        self.assertEqual(sequencer.state, ABORTED)
+
+    def test_first_character_refused(self):
+        ups = self.ups(first=b'NA\r\n')
+        sequencer = ShutdownSequencer(ups, gap=GAP)
+        self.assertEqual(sequencer.turn_off_after_delay(), -2)
+        self.assertEqual(sequencer.state, FAILED)
+        self.assertEqual(sequencer.result, 2)
+        self.assertIsNone(ups.exclusive)
+        time.sleep(GAP + 0.3)
+        self.assertEqual(self.simulated.sent(), [b'K'])
+
+    def test_second_character_refused(self):
+        sequencer = ShutdownSequencer(self.ups(second=b'NO\r\n'), gap=GAP)
+        sequencer.turn_ups_on()
+        self.assertEqual(sequencer.wait(5.0), 1)
+        self.assertEqual(sequencer.state, FAILED)
+
+    def test_busy(self):
+        ups = self.ups()
+        sequencer = ShutdownSequencer(ups, gap=GAP)
+        other = ShutdownSequencer(ups, gap=GAP)
+        sequencer.turn_off_after_delay()
+        self.assertEqual(sequencer.turn_off_ups(), -1)
+        self.assertEqual(other.turn_off_ups(), -1)
+        self.assertEqual(other.shut_down_ups_on_battery(), -1)
+        sequencer.wait(5.0)
+        self.assertEqual(self.simulated.sent(), [b'K', b'K'])
+
+    def test_one_step(self):
+        ups = self.ups()
+        sequencer = ShutdownSequencer(ups, gap=GAP)
+        # the simulated UPS is on line, S is refused with NA
+        self.assertEqual(sequencer.shut_down_ups_on_battery(), 2)
+        self.assertEqual(sequencer.state, FAILED)
+        self.assertEqual(sequencer.shut_down_with_delayed_wake_up(12), 0)
+        self.assertEqual(sequencer.state, DONE)
+        self.assertEqual(self.simulated.sent()[1], bytes(ups.delayed_wake_up_command(12)))
+        self.assertEqual(sequencer.abort(), 0)
+        self.assertEqual(sequencer.state, ABORTED)
+        self.assertEqual(self.simulated.sent()[-1], b'\x7f')
+        self.assertIsNone(ups.exclusive)
+
+
+if __name__ == '__main__':
+    unittest.main()
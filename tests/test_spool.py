@@ -0,0 +1,118 @@
+###############################################################################
+#
+#   Store and forward through a sink that fails and recovers, see APC_SPOOL
+#
+###############################################################################
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from APC_SPOOL import Forwarder
+from APC_SPOOL import Spool
+
+
+class FlakySink:
+
+    def __init__(self, failures):
+        '''Raises for the first failures batches, then keeps every batch it gets.'''
+        self.failures = failures
+        self.batches = []
+
+    def __call__(self, records):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('database unreachable')
+        self.batches.append(records)
+
+
+def numbers(records):
+    return [record['values']['n'] for record in records]
+
+
+def balanced(test, spool):
+    '''Every appended record is forwarded, corrupt, evicted or still pending.'''
+    test.assertEqual(spool.appended, spool.forwarded + spool.corrupt + spool.evicted + spool.pending)
+
+
+class SpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_nothing_lost_and_in_order(self):
+        spool = Spool(self.directory, segment_bytes=1024)
+        sink = FlakySink(failures=3)
+        forwarder = Forwarder(spool, sink, batch=7, retry=0.01, max_retry=0.05)
+        forwarder.start()
+        for n in range(100):
+            forwarder.put({'n': n}, float(n))
+        deadline = time.monotonic() + 10.0
+        while spool.backlog()['records'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        forwarder.close()
+        self.assertEqual(forwarder.failures, 3)
+        self.assertTrue(all(0 < len(batch) <= 7 for batch in sink.batches))
+        sent = [n for batch in sink.batches for n in numbers(batch)]
+        self.assertEqual(sent, list(range(100)))
+        self.assertEqual(spool.forwarded, 100)
+        self.assertEqual(spool.evicted, 0)
+        self.assertEqual(spool.backlog()['records'], 0)
+        balanced(self, spool)
+
+    def test_oldest_evicted_first(self):
+        spool = Spool(self.directory, segment_bytes=200, max_bytes=400)
+        for n in range(100):
+            spool.append({'n': n}, float(n))
+        self.assertLessEqual(sum(spool.sizes.values()), 400)
+        self.assertGreater(spool.evicted, 0)
+        position, read, records = spool.read(1000)
+        kept = numbers(records)
+        self.assertEqual(kept, list(range(100 - len(kept), 100)))
+        self.assertEqual(spool.pending, len(kept))
+        self.assertEqual(spool.evicted, 100 - len(kept))
+        balanced(self, spool)
+        spool.close()
+
+    def test_eviction_while_sending(self):
+        spool = Spool(self.directory, segment_bytes=200, max_bytes=400)
+        for n in range(10):
+            spool.append({'n': n}, float(n))
+        position, read, records = spool.read(1000)
+        self.assertEqual(len(spool.segments), 2)
+        n = 10
+        while not spool.evicted:                    # the first segment goes while the batch is out
+            spool.append({'n': n}, float(n))
+            n += 1
+        self.assertEqual(spool.segments[0], position[0])
+        spool.ack(position, read, len(records))
+        self.assertEqual(spool.forwarded + spool.evicted, 10)
+        balanced(self, spool)
+        rest = numbers(spool.read(1000)[2])
+        self.assertEqual(rest, list(range(10, n)))
+        self.assertEqual(spool.pending, len(rest))
+        spool.close()
+
+    def test_torn_tail_repaired(self):
+        spool = Spool(self.directory)
+        for n in range(5):
+            spool.append({'n': n}, float(n))
+        spool.close()
+        name = spool._name(spool.segments[-1])
+        size = os.path.getsize(name)
+        with open(name, 'ab') as f:
+            f.write(b'\x40\x00\x00\x00\x01\x02')          # header and part of a payload
+        spool = Spool(self.directory)
+        self.assertEqual(os.path.getsize(name), size)
+        self.assertEqual(spool.pending, 5)
+        spool.append({'n': 5}, 5.0)
+        self.assertEqual(numbers(spool.read(100)[2]), list(range(6)))
+        spool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+###############################################################################
+#
+#   Replay of a recorded session through APC, see APC_TRACE
+#
+#   data/ups_session.apct: 10 samples of LOG_FIELDS, 0.25 s apart, from the
+#   loopback transport; samples 4 to 6 are on battery (Q 10, L 000.0, f 097.0)
+#
+###############################################################################
+import os
+import time
+import unittest
+
+from APC_SMART_UPS import APC
+from APC_SMART_UPS import LOG_FIELDS
+from APC_TRACE import ReplayPort
+
+
+TRACE = os.path.join(os.path.dirname(__file__), 'data', 'ups_session.apct')
+
+
+def replay(speed):
+    ups = APC(ReplayPort(TRACE, speed))
+    ups.serial_open()
+    samples = []
+    while not ups.ser.finished():
+        samples.append(ups.sample(LOG_FIELDS))
+    return ups, samples
+
+
+class ReplayTest(unittest.TestCase):
+
+    def test_values_and_events(self):
+        ups, samples = replay(0)
+        self.assertEqual(len(samples), 10)
+        self.assertEqual(ups.ser.writes, 10 * len(LOG_FIELDS))
+        self.assertEqual(ups.ser.mismatches, 0)
+        on_battery = [n for n, values in enumerate(samples) if values['line_voltage'] == 0.0]
+        self.assertEqual(on_battery, [4, 5, 6])
+        for values in samples:
+            self.assertEqual(values['battery_voltage'], 54.72)
+            self.assertEqual(values['load_power'], 12.3)
+            self.assertEqual(values['ups_internal_temperature'], 31.5)
+        self.assertEqual(samples[5]['battery_capacity'], 97.0)
+        self.assertEqual(samples[9]['battery_capacity'], 100.0)
+        changes = sum(1 for before, after in zip([None] + samples, samples)
+                      if before is None or before['ups_status'] != after['ups_status'])
+        self.assertEqual(changes, 3)
+
+    def test_recorded_timing(self):
+        port = ReplayPort(TRACE)
+        self.assertGreater(port.duration(), 2.0)
+        start = time.monotonic()
+        replay(4.0)
+        elapsed = time.monotonic() - start
+        # the gaps between the samples are replayed too, not only the response delays
+        self.assertGreater(elapsed, port.duration() / 4.0 * 0.9)
+        self.assertLess(elapsed, port.duration() / 4.0 + 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+###############################################################################
+#
+#   Loopback and TCP transports, see APC_TRANSPORT
+#
+###############################################################################
+import socket
+import threading
+import time
+import unittest
+
+from APC_SMART_UPS import APC
+from APC_TRANSPORT import LoopbackTransport
+from APC_TRANSPORT import TcpTransport
+from APC_TRANSPORT import open_transport
+
+
+def wait_for(transport, count, timeout=2.0):
+    '''in_waiting once count bytes arrived, or at the timeout.'''
+    deadline = time.monotonic() + timeout
+    while transport.in_waiting < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return transport.in_waiting
+
+
+class LoopbackTest(unittest.TestCase):
+
+    def test_simulated_answers(self):
+        ups = APC('loop://')
+        self.assertTrue(ups.serial_open())
+        self.assertEqual(ups.line_voltage(), 231.4)
+        self.assertEqual(ups.battery_capacity(), 100.0)
+        ups.serial_close()
+
+    def test_responder_and_partial_reads(self):
+        commands = []
+
+        def responder(command):
+            commands.append(bytes(command))
+            return b'12.5\r\n'
+
+        port = LoopbackTransport(responder)
+        port.open()
+        self.assertEqual(port.write(b'B'), 1)
+        self.assertEqual(commands, [b'B'])
+        self.assertEqual(port.in_waiting, 6)
+        self.assertEqual(port.read(2), b'12')
+        buffer = bytearray(8)
+        self.assertEqual(port.readinto(buffer), 4)
+        self.assertEqual(bytes(buffer[:4]), b'.5\r\n')
+        self.assertEqual(port.in_waiting, 0)
+
+    def test_overflow_drops_unread_answers(self):
+        port = LoopbackTransport(lambda command: b'0123456789', size=16)
+        port.open()
+        port.write(b'x')
+        port.write(b'x')                # does not fit behind the first answer
+        self.assertEqual(port.read(16), b'0123456789')
+
+    def test_unknown_option(self):
+        with self.assertRaises(TypeError):
+            open_transport('loop://', read_ahead=64)
+
+
+class TcpTest(unittest.TestCase):
+
+    def setUp(self):
+        self.near, self.far = socket.socketpair()
+        self.port = TcpTransport('127.0.0.1', 1, timeout=1, read_ahead=8)
+        self.port.sock = self.near
+
+    def tearDown(self):
+        self.port.close()
+        self.far.close()
+
+    def test_write_and_read(self):
+        self.assertEqual(self.port.write(b'L'), 1)
+        self.assertEqual(self.far.recv(16), b'L')
+        self.far.sendall(b'231.4\r\n')
+        self.assertEqual(wait_for(self.port, 7), 7)
+        self.assertEqual(self.port.read(7), b'231.4\r\n')
+        self.assertEqual(self.port.in_waiting, 0)
+
+    def test_answer_longer_than_read_ahead(self):
+        self.far.sendall(b'0123456789ABCDEF\r\n')
+        received = b''
+        deadline = time.monotonic() + 2.0
+        while len(received) < 18 and time.monotonic() < deadline:
+            received += self.port.read(5)
+        self.assertEqual(received, b'0123456789ABCDEF\r\n')
+
+    def test_peer_closed(self):
+        self.far.close()
+        self.assertEqual(self.port.in_waiting, 0)
+        self.assertFalse(self.port.is_open)
+
+    def test_reconnect_on_write(self):
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        accepted = []
+        thread = threading.Thread(target=lambda: accepted.append(server.accept()[0]))
+        thread.start()
+        self.port.port = server.getsockname()[1]
+        self.far.close()
+        self.port.in_waiting        # sees the closed connection
+        self.assertEqual(self.port.write(b'Y'), 1)
+        thread.join(2.0)
+        self.assertEqual(accepted[0].recv(16), b'Y')
+        accepted[0].close()
+        server.close()
+
+    def test_unreachable(self):
+        self.port.close()
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        self.port.port = server.getsockname()[1]
+        server.close()                # nothing listens there any more
+        with self.assertRaises(OSError):
+            self.port.write(b'Y')
+        self.assertFalse(self.port.is_open)
+
+
+if __name__ == '__main__':
+    unittest.main()